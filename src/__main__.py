@@ -1,43 +1,134 @@
 import argparse
 import logging
-from app import launch_app
-from data.metrics_collector import MetricsCollector
+import sys
+from config import config
 from logger import setup_logger
 import threading
 
-from sdk.metrics_api import MetricsAPI
-
-setup_logger()
-
 logger = logging.getLogger(__name__)
 stop_event = threading.Event()
 
+# Packages only the web app needs; the collector must not import them
+WEB_STACK_MODULES = ('dash', 'plotly', 'flask', 'sqlalchemy')
+
+def run_app():
+    """Import and launch the web app."""
+    from app import launch_app
+    launch_app()
+
+def run_server(workers: int):
+    """Import and serve the web app from pre-forked worker processes.
+
+    Args:
+        workers (int): Number of worker processes.
+    """
+    from server import serve
+    serve(workers)
+
+def run_import(files: list[str], chunk_size: int):
+    """Import files of readings into the database.
+
+    Args:
+        files (list[str]): The CSV or NDJSON files to import.
+        chunk_size (int): Number of readings per transaction.
+    """
+    from data.bulk_import import BulkImporter
+    from data.storage import Storage
+
+    storage = Storage.from_config()
+    storage.create_all()
+    importer = BulkImporter(storage, chunk_size=chunk_size)
+    try:
+        for file in files:
+            importer.import_file(file)
+    except KeyboardInterrupt:
+        logger.info('Import interrupted, run the same command again to resume')
+    finally:
+        storage.dispose()
+
+def import_collector() -> tuple:
+    """Import the modules the data collector runs on.
+
+    Returns:
+        tuple: The MetricsCollector class, the slow profiler and the MetricsAPI class.
+    """
+    from data.metrics_collector import MetricsCollector
+    from profiling import slow_profiler
+    from sdk.metrics_api import MetricsAPI
+
+    loaded = [name for name in WEB_STACK_MODULES if name in sys.modules]
+    if loaded:
+        logger.warning('Collector startup imported web stack modules: %s', ', '.join(loaded))
+    return MetricsCollector, slow_profiler, MetricsAPI
+
+def run_collector(args):
+    """Import and run the data collector until interrupted.
+
+    Args:
+        args: Parsed command line arguments.
+    """
+    MetricsCollector, slow_profiler, MetricsAPI = import_collector()
+
+    mc = None
+    stats_server = None
+    try:
+        logger.info('Starting the data collector')
+        if config.collector.stats_port is not None:
+            # The collector has no web app, its timings, breakers and counters are served here
+            from stats_exporter import start_stats_server
+            stats_server = start_stats_server(config.collector.stats_host, config.collector.stats_port)
+        if args.profile:
+            slow_profiler.configure(
+                enabled=True,
+                threshold_ms=args.profile_threshold_ms,
+                output_dir=config.profiling.output_dir,
+            )
+        mc = MetricsCollector()
+        mc.start_scheduler()
+        threading.Thread(target=MetricsAPI.poll_for_message, daemon=True).start()
+        # Keep the main thread alive efficiently
+        while not stop_event.is_set():
+            stop_event.wait(1)
+    except KeyboardInterrupt:
+        logger.info('Shutting down the data collector')
+        if mc:
+            mc.stop_scheduler()
+        if stats_server:
+            stats_server.shutdown()
+        stop_event.set()
+
 def main():
     """Entry function."""
+    # Not at import time, spawned worker processes import this module again
+    setup_logger()
     parser = argparse.ArgumentParser(description='Run the collector server.')
     parser.add_argument('-c', action='store_true', help='Run the collector server')
     parser.add_argument('-a', action='store_true', help='Run the web app')
+    parser.add_argument('-s', action='store_true', help='Serve the web app from a pool of worker processes')
+    parser.add_argument('--workers', type=int, default=config.server.workers, help='Number of worker processes used by -s')
+    parser.add_argument('-i', '--import', dest='import_files', nargs='+', metavar='FILE',
+                        help='Import CSV or NDJSON files of readings (optionally gzipped) into the database')
+    parser.add_argument('--chunk-size', type=int, default=50000, help='Number of readings per transaction used by -i')
+    parser.add_argument('--profile', action='store_true', help='Write cProfile output for collector jobs slower than the threshold')
+    parser.add_argument('--profile-threshold-ms', type=float, default=config.profiling.slow_threshold_ms,
+                        help='Threshold in milliseconds used by --profile')
     args = parser.parse_args()
 
+    # Each mode imports only the modules it needs
     if args.a:
         logger.info('Starting the application')
-        launch_app()
+        run_app()
+    elif args.s:
+        logger.info('Starting the application with %d workers', args.workers)
+        run_server(args.workers)
+    elif args.import_files:
+        logger.info('Importing %d files', len(args.import_files))
+        run_import(args.import_files, args.chunk_size)
     elif args.c:
-        try:
-            logger.info('Starting the data collector')
-            mc = MetricsCollector()
-            mc.start_scheduler()
-            threading.Thread(target=MetricsAPI.poll_for_message, daemon=True).start()
-            # Keep the main thread alive efficiently
-            while not stop_event.is_set():
-                stop_event.wait(1)
-        except KeyboardInterrupt:
-            logger.info('Shutting down the data collector')
-            mc.stop_scheduler()
-            stop_event.set()
+        run_collector(args)
     else:
         logger.info('DEFAULT: Starting the application')
-        launch_app()
+        run_app()
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
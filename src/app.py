@@ -1,17 +1,31 @@
 """Flask application module."""
 
+from collections import Counter
+from datetime import datetime, timedelta
+import heapq
+import hmac
 import json
 import logging
-from flask import Flask, request, jsonify, redirect
-from sqlalchemy.orm import sessionmaker, joinedload  # Add joinedload import
-from sqlalchemy import create_engine
+from flask import Flask, Response, g, request, jsonify, redirect
+from sqlalchemy import null, select
+from sqlalchemy.orm import Session
 from block_timer import BlockTimer
 from config import config
-from datetime import datetime
-from threading import Lock
-
-from data.dto import DeviceDTO, MetricTypeDTO, UnitDTO
-from data.models import Base, MetricReading, Device, MetricType, Unit
+from stats_registry import stats
+from timestamps import from_wire
+from profiling import sample_stacks, slow_profiler
+
+from data.admission import AdmissionController
+from data.alerts import AlertEvaluator
+from data.analytics import AnalyticsExecutor, job_status
+from data.compare import FILL_LAST, FILL_MEAN, align_series, correlation, query_series
+from data.export import export_rows, gzip_chunks, to_csv, to_ndjson
+from data.hot_tier import HotTier, RecentReading
+from data.ingest import InvalidReadingError, MetricsIngestor
+from data.message_store import MessageStore
+from data.models import AlertEvent, MetricReading, Device, MetricType, Unit
+from data.sketch import percentiles
+from data.storage import Storage
 from dash import dcc, html, dash_table
 import plotly.graph_objs as go
 from dash.dependencies import Input, Output, State
@@ -21,26 +35,71 @@ import requests
 
 logger = logging.getLogger(__name__)
 
-# Global variable to store the message with a lock for thread safety
-stored_message = None
-message_lock = Lock()
+# Time ranges offered by the comparison view, in minutes
+COMPARE_WINDOWS = (('15 minutes', 15), ('1 hour', 60), ('6 hours', 360), ('1 day', 1440), ('7 days', 10080))
+
+def create_app(workers: int = 1, create_schema: bool = True):
+    """Create and configure the Flask application.
 
-def create_app():
-    """Create and configure the Flask application."""
+    Args:
+        workers (int): Number of processes serving the application; the in-memory
+            hot tier and alert evaluation are only used by a single process.
+        create_schema (bool): Whether to create the tables, False when the caller already did.
+    """
     app: Flask = Flask(config.app_name)
     logger.debug('App "%s" created in %s', app.name, __name__)
 
-    engine = create_engine(config.database.db_engine)
-    Base.metadata.create_all(engine)
-    Session = sessionmaker(bind=engine)
+    storage = Storage.from_config()
+    if create_schema:
+        storage.create_all()
+    hot_tier = None
+    if config.hot_tier.enabled and workers == 1:
+        hot_tier = HotTier(config.hot_tier.capacity)
+        with BlockTimer("load_hot_tier"):
+            hot_tier.load(storage)
+    elif config.hot_tier.enabled:
+        logger.info('Hot tier disabled: each of the %d workers would only see its own readings', workers)
+    evaluator = None
+    if config.alerts.enabled and workers == 1:
+        evaluator = AlertEvaluator.from_config()
+    elif config.alerts.enabled:
+        logger.info('Alerts disabled: each of the %d workers would only see part of every series', workers)
+    ingestor = MetricsIngestor(storage, evaluator, hot_tier)
+    # The pending message lives in the database so it is shared by all worker processes
+    message_store = MessageStore(storage.catalog_engine)
+    admission = AdmissionController.from_config() if config.admission.enabled else None
+    # Worker processes are only spawned once the first job is submitted
+    analytics = AnalyticsExecutor.from_config(storage, workers) if config.analytics.enabled else None
+
+    slow_profiler.configure(
+        enabled=config.profiling.profile_slow_requests,
+        threshold_ms=config.profiling.slow_threshold_ms,
+        output_dir=config.profiling.output_dir,
+    )
+
+    @app.before_request
+    def start_request_profile():
+        """Start profiling the request when slow request profiling is enabled."""
+        g.profile_token = slow_profiler.start()
+
+    @app.teardown_request
+    def finish_request_profile(exc):
+        """Stop profiling the request and keep the profile if it was slow.
+
+        Args:
+            exc: Exception raised while handling the request, if any.
+        """
+        slow_profiler.finish(g.pop('profile_token', None), f"{request.method} {request.path}")
  
     # Create Dash app
     dash_app = dash.Dash(server=app, name="Dashboard", url_base_pathname='/dashboard/', assets_folder='src/assets')
     
-    session = Session()
-    devices = session.query(MetricReading.device_id, Device.name).join(Device).distinct().all()
-    metric_types = session.query(MetricReading.metric_type_id, MetricType.name).join(MetricType).distinct().all()
-    session.close()
+    devices = _distinct_rows(storage.fan_out(
+        lambda session: session.query(MetricReading.device_id, Device.name).join(Device).distinct().all()
+    ))
+    metric_types = _distinct_rows(storage.fan_out(
+        lambda session: session.query(MetricReading.metric_type_id, MetricType.name).join(MetricType).distinct().all()
+    ))
 
     # Layout for the Dash app
     dash_app.layout = html.Div([
@@ -76,11 +135,83 @@ def create_app():
             page_size=10,
             style_table={'width': '80%', 'margin': 'auto', 'font-size': '14px'}
         ),
+        html.H2("Alerts"),
+        dash_table.DataTable(
+            id='alerts-table',
+            columns=[
+                {'name': 'Timestamp', 'id': 'timestamp', 'type': 'datetime'},
+                {'name': 'Device', 'id': 'device'},
+                {'name': 'Metric', 'id': 'metric_type'},
+                {'name': 'Alert', 'id': 'kind'},
+                {'name': 'Value', 'id': 'value'},
+                {'name': 'Detail', 'id': 'detail'}
+            ],
+            page_size=10,
+            style_table={'width': '80%', 'margin': 'auto', 'font-size': '14px'}
+        ),
+        html.H2("Compare"),
+        dcc.Dropdown(
+            id='compare-devices-dropdown',
+            options=[{'label': device.name, 'value': device.device_id} for device in devices],
+            multi=True,
+            placeholder="Select devices to compare",
+            className='dash-dropdown'
+        ),
+        dcc.Dropdown(
+            id='compare-metric-types-dropdown',
+            options=[{'label': metric_type.name, 'value': metric_type.metric_type_id} for metric_type in metric_types],
+            multi=True,
+            placeholder="Select metric types to compare",
+            className='dash-dropdown'
+        ),
+        dcc.Dropdown(
+            id='compare-window-dropdown',
+            options=[{'label': label, 'value': minutes} for label, minutes in COMPARE_WINDOWS],
+            value=60,
+            clearable=False,
+            className='dash-dropdown'
+        ),
+        dcc.RadioItems(
+            id='compare-fill',
+            options=[{'label': 'Last value', 'value': FILL_LAST}, {'label': 'Mean', 'value': FILL_MEAN}],
+            value=FILL_LAST,
+            inline=True
+        ),
+        dcc.RadioItems(
+            id='compare-mode',
+            options=[{'label': 'Overlay', 'value': 'overlay'}, {'label': 'Correlation', 'value': 'correlation'}],
+            value='overlay',
+            inline=True
+        ),
+        dcc.Graph(id='comparison-plot', className='dash-graph'),
         dcc.Input(id='message-input', type='text', placeholder='Enter a Windows app to run'),
         html.Button('Send Message', id='send-message-button'),
         html.Div(id='message-output')
     ])
 
+    def read_database(device_id, metric_type_id, with_totals: bool) -> tuple[list, float, int]:
+        """Read the dashboard readings of a metric type from the database.
+
+        Args:
+            device_id: The device, or None for all devices.
+            metric_type_id: The metric type.
+            with_totals (bool): Whether to compute the sum and count of the values.
+
+        Returns:
+            tuple[list, float, int]: The readings newest first, their sum and their count.
+        """
+        if device_id:
+            session = storage.device_session(device_id)
+            try:
+                results = [_query_readings(session, device_id, metric_type_id, with_totals)]
+            finally:
+                session.close()
+        else:
+            # All devices: query every shard in parallel and merge by timestamp
+            results = storage.fan_out(lambda session: _query_readings(session, None, metric_type_id, with_totals))
+        readings = list(heapq.merge(*(result['readings'] for result in results), key=lambda metric: metric.timestamp, reverse=True))
+        return readings, sum(result['sum'] or 0 for result in results), sum(result['count'] for result in results)
+
     @dash_app.callback(
         Output('gauge', 'figure'),
         Output('historical-plot', 'figure'),
@@ -100,47 +231,40 @@ def create_app():
         Returns:
             tuple: Updated gauge figure, historical plot figure, and table data.
         """
-        session = Session()
-
-        query = session.query(MetricReading).options(joinedload(MetricReading.metric_type), joinedload(MetricReading.device), joinedload(MetricReading.unit))
-
-        # Refresh device fields
-        devices = session.query(MetricReading.device_id, Device.name).join(Device).distinct().all()
+        if not selected_metric_type:
+            selected_metric_type = metric_types[0].metric_type_id if metric_types else None
 
-        if selected_device:
-            query = query.filter(MetricReading.device_id == selected_device)
-        if selected_metric_type:
-            query = query.filter(MetricReading.metric_type_id == selected_metric_type)
+        recent = hot_tier.recent(selected_device, selected_metric_type) if hot_tier else None
+        if recent and recent['warm']:
+            # The gauge, history and average only need the newest readings and running totals
+            all_metrics, total, count = recent['readings'], recent['sum'], recent['count']
+            # The table lists every reading, memory only holds the newest of long series
+            table_metrics = all_metrics if recent['complete'] else read_database(selected_device, selected_metric_type, False)[0]
         else:
-            selected_metric_type = metric_types[0].metric_type_id if metric_types else None
-            query = query.filter(MetricReading.metric_type_id == selected_metric_type)
+            all_metrics, total, count = read_database(selected_device, selected_metric_type, True)
+            table_metrics = all_metrics
 
         # Fetch the latest metric reading for the gauge
-        latest_metric = query.order_by(MetricReading.timestamp.desc()).first()
+        latest_metric = all_metrics[0] if all_metrics else None
 
         # Calculate the average value for the selected metric type
-        average_value = query.with_entities(func.avg(MetricReading.value)).scalar() if latest_metric else 50
+        average_value = total / count if latest_metric else 50
 
         # Fetch the last 20 metric readings for the historical plot
-        historical_metrics = query.order_by(MetricReading.timestamp.desc()).limit(20).all()
+        historical_metrics = all_metrics[:20]
         historical_metrics.reverse()  # Reverse to have the oldest first
 
-        # Fetch all metric readings for the table
-        all_metrics = query.order_by(MetricReading.timestamp.desc()).all()
-
-        session.close()
-
         if latest_metric:
-            min_value = latest_metric.metric_type.min_value if latest_metric.metric_type.min_value is not None else 0
-            max_value = latest_metric.metric_type.max_value if latest_metric.metric_type.max_value is not None else average_value * 2
-            unit_name = latest_metric.unit.name if latest_metric.unit else ''
-            unit_symbol = latest_metric.unit.symbol if latest_metric.unit else ''
+            min_value = latest_metric.min_value if latest_metric.min_value is not None else 0
+            max_value = latest_metric.max_value if latest_metric.max_value is not None else average_value * 2
+            unit_name = latest_metric.unit_name or ''
+            unit_symbol = latest_metric.unit_symbol or ''
             gauge_figure = {
                 'data': [
                     go.Indicator(
                         mode="gauge+number",
                         value=latest_metric.value,
-                        title={'text': f"{latest_metric.metric_type.name} ({unit_name})"},
+                        title={'text': f"{latest_metric.metric_type_name} ({unit_name})"},
                         gauge={'axis': {'range': [min_value, max_value]}},
                         number={'suffix': f" {unit_symbol}"}
                     )
@@ -175,16 +299,110 @@ def create_app():
 
         table_data = [
             {
-                'device': metric.device.name,
+                'device': metric.device_name,
                 'timestamp': metric.timestamp.isoformat() if metric.timestamp else '',
                 'value': metric.value,
-                'unit': metric.unit.name if metric.unit else ''
-            } for metric in all_metrics
+                'unit': metric.unit_name or ''
+            } for metric in table_metrics
         ]
 
         # Updates the gauge, historical plot, and table
         return gauge_figure, historical_figure, table_data
 
+    @dash_app.callback(
+        Output('comparison-plot', 'figure'),
+        Input('interval-component', 'n_intervals'),
+        Input('compare-devices-dropdown', 'value'),
+        Input('compare-metric-types-dropdown', 'value'),
+        Input('compare-window-dropdown', 'value'),
+        Input('compare-fill', 'value'),
+        Input('compare-mode', 'value')
+    )
+    def update_comparison(n, selected_devices, selected_metric_types, window_m, fill, mode):
+        """Update the comparison of several series on a common time grid.
+
+        Args:
+            n (int): Number of intervals.
+            selected_devices (list): Selected device IDs.
+            selected_metric_types (list): Selected metric type IDs.
+            window_m (int): Length of the compared time range in minutes.
+            fill (str): Resampling of each grid bucket, ``last`` or ``mean``.
+            mode (str): ``overlay`` or ``correlation``.
+
+        Returns:
+            dict: The comparison figure.
+        """
+        if not selected_devices or not selected_metric_types:
+            return {'data': [], 'layout': go.Layout(title='Select devices and metric types to compare')}
+
+        with BlockTimer("update_comparison"):
+            end = datetime.now()
+            start = end - timedelta(minutes=window_m)
+            series = query_series(storage, selected_devices, selected_metric_types, start, end)
+            if not series:
+                return {'data': [], 'layout': go.Layout(title='No data in the selected range')}
+            grid, aligned = align_series(series, start, end, config.dashboard.point_budget, fill)
+
+        device_names = {device.device_id: device.name for device in devices}
+        metric_type_names = {metric_type.metric_type_id: metric_type.name for metric_type in metric_types}
+        labels = [f"{device_names.get(device_id, device_id)} {metric_type_names.get(metric_type_id, metric_type_id)}" for device_id, metric_type_id in aligned]
+
+        if mode == 'correlation':
+            matrix = correlation(aligned)
+            return {
+                'data': [go.Heatmap(z=matrix.tolist(), x=labels, y=labels, zmin=-1, zmax=1, colorscale='RdBu')],
+                'layout': go.Layout(title='Correlation')
+            }
+
+        times = grid.astype('datetime64[s]').astype(str).tolist()
+        return {
+            'data': [
+                go.Scatter(x=times, y=values.tolist(), mode='lines', name=label, connectgaps=False)
+                for label, values in zip(labels, aligned.values())
+            ],
+            'layout': go.Layout(
+                title='Comparison',
+                xaxis={'title': 'Timestamp', 'tickformat': '%Y-%m-%d %H:%M:%S'},
+                yaxis={'title': 'Value'}
+            )
+        }
+
+    @dash_app.callback(
+        Output('alerts-table', 'data'),
+        Input('interval-component', 'n_intervals')
+    )
+    def update_alerts(n):
+        """Update the most recent alerts displayed on the dashboard.
+
+        Args:
+            n (int): Number of intervals.
+
+        Returns:
+            list[dict]: The alerts table data, newest first.
+        """
+        session = storage.catalog_session()
+        try:
+            alerts = (
+                session.query(AlertEvent, Device.name, MetricType.name)
+                .join(Device, AlertEvent.device_id == Device.id)
+                .join(MetricType, AlertEvent.metric_type_id == MetricType.id)
+                .order_by(AlertEvent.timestamp.desc())
+                .limit(50)
+                .all()
+            )
+        finally:
+            session.close()
+        return [
+            {
+                'timestamp': alert.timestamp.isoformat(),
+                'device': device_name,
+                'metric_type': metric_type_name,
+                'kind': alert.kind,
+                'value': alert.value,
+                'detail': alert.detail
+            } for alert, device_name, metric_type_name in alerts
+        ]
+
     @dash_app.callback(
         Output('message-output', 'children'),
         Input('send-message-button', 'n_clicks'),
@@ -227,15 +445,13 @@ def create_app():
             Response: JSON response with status.
         """
         with BlockTimer("send_message"):
-            global stored_message
             data = request.get_json()
             message = data.get('message') if data else None
             if not message:
                 return jsonify({'error': 'No message provided'}), 400
 
-            with message_lock:
-                stored_message = message
-            logger.info("Sent message: %s", stored_message)
+            message_store.put(message)
+            logger.info("Sent message: %s", message)
             return jsonify({"status": "success"}), 200
 
     @app.route('/poll_message', methods=['GET'])
@@ -246,12 +462,156 @@ def create_app():
             Response: JSON response with message.
         """
         with BlockTimer("poll_message"):
-            global stored_message
-            with message_lock:
-                message = stored_message
-                stored_message = None  # Reset the stored message after a successful poll
+            # Taking the message also resets it, so only one poll receives it
+            message = message_store.take()
             return jsonify({'message': message}), 200
 
+    @app.route('/internal/stats', methods=['GET'])
+    def internal_stats():
+        """Endpoint exposing the block timing histograms and counters.
+
+        The ``format`` query parameter selects ``json`` (default) or ``prometheus``.
+
+        Returns:
+            Response: JSON summary or Prometheus text exposition.
+        """
+        if request.args.get('format', 'json') == 'prometheus':
+            return Response(stats.to_prometheus(), mimetype='text/plain; version=0.0.4')
+        return jsonify(stats.to_dict()), 200
+
+    @app.route('/internal/profile', methods=['GET'])
+    def internal_profile():
+        """Endpoint sampling all thread stacks for a number of seconds.
+
+        Requires the configured profiling token in the ``X-Profile-Token`` header.
+        The ``seconds`` query parameter sets the sampling duration.
+
+        Returns:
+            Response: Collapsed stacks as plain text.
+        """
+        token = config.profiling.endpoint_token
+        if not token:
+            return jsonify({'error': 'Profiling endpoint is disabled'}), 404
+        if not hmac.compare_digest(request.headers.get('X-Profile-Token', ''), token):
+            return jsonify({'error': 'Invalid profiling token'}), 403
+
+        try:
+            seconds = float(request.args.get('seconds', 5))
+        except ValueError:
+            return jsonify({'error': 'Invalid number of seconds'}), 400
+        seconds = min(max(seconds, 0.1), config.profiling.max_sample_s)
+
+        logger.info('Sampling thread stacks for %.1f seconds', seconds)
+        collapsed = sample_stacks(seconds, config.profiling.sample_interval_ms / 1000)
+        return Response(collapsed, mimetype='text/plain')
+
+    @app.route('/export', methods=['GET'])
+    def export_readings():
+        """Endpoint streaming readings as CSV or NDJSON.
+
+        Query parameters: ``device_id``, ``metric_type_id``, ``start`` and ``end``
+        (ISO timestamps or epoch milliseconds), ``format`` (``csv`` or ``ndjson``) and ``gzip`` (``1`` to compress).
+
+        Returns:
+            Response: Streamed readings, oldest first.
+        """
+        export_format = request.args.get('format', 'csv')
+        if export_format not in ('csv', 'ndjson'):
+            return jsonify({'error': 'Format must be csv or ndjson'}), 400
+        try:
+            start = from_wire(request.args['start']) if request.args.get('start') else None
+            end = from_wire(request.args['end']) if request.args.get('end') else None
+        except ValueError:
+            return jsonify({'error': 'Invalid start or end timestamp'}), 400
+
+        rows = export_rows(storage, request.args.get('device_id'), request.args.get('metric_type_id', type=int), start, end)
+        chunks = to_csv(rows) if export_format == 'csv' else to_ndjson(rows)
+        filename = f"readings.{export_format}"
+        mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+        if request.args.get('gzip') == '1':
+            chunks = gzip_chunks(chunks)
+            filename += '.gz'
+            mimetype = 'application/gzip'
+
+        logger.info('Exporting readings as %s', filename)
+        return Response(chunks, mimetype=mimetype, headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+    @app.route('/percentiles', methods=['GET'])
+    def metric_percentiles():
+        """Endpoint estimating percentiles of a metric from its quantile sketches.
+
+        Query parameters: ``metric_type_id`` (required), ``device_id``, ``start`` and
+        ``end`` (ISO timestamps or epoch milliseconds, widened to whole sketch buckets) and ``q``
+        (comma separated quantiles, ``0.5,0.95,0.99`` by default).
+
+        Returns:
+            Response: JSON with the count, sum, min, max and estimated quantiles.
+        """
+        metric_type_id = request.args.get('metric_type_id', type=int)
+        if metric_type_id is None:
+            return jsonify({'error': 'metric_type_id is required'}), 400
+        try:
+            quantiles = [float(q) for q in request.args.get('q', '0.5,0.95,0.99').split(',')]
+            start = from_wire(request.args['start']) if request.args.get('start') else None
+            end = from_wire(request.args['end']) if request.args.get('end') else None
+        except ValueError:
+            return jsonify({'error': 'Invalid quantiles, start or end'}), 400
+        if not all(0 <= q <= 1 for q in quantiles):
+            return jsonify({'error': 'Quantiles must be between 0 and 1'}), 400
+
+        with BlockTimer("percentiles"):
+            result = percentiles(storage, metric_type_id, quantiles, request.args.get('device_id'), start, end)
+        result['relative_accuracy'] = config.sketches.relative_accuracy
+        return jsonify(result), 200
+
+    @app.route('/analytics', methods=['POST'])
+    def submit_analytics():
+        """Endpoint starting the computation of per-device statistics of a metric in the background.
+
+        Query parameters: ``metric_type_id`` and ``start`` (required), ``end``
+        (now by default), ``device_id`` (comma separated, all devices by default)
+        and ``q`` (comma separated quantiles, ``0.5,0.95,0.99`` by default).
+        Timestamps are ISO strings or epoch milliseconds.
+
+        Returns:
+            Response: JSON with the job id and the URL of its status.
+        """
+        if not analytics:
+            return jsonify({'error': 'Analytics are disabled'}), 404
+        metric_type_id = request.args.get('metric_type_id', type=int)
+        if metric_type_id is None or not request.args.get('start'):
+            return jsonify({'error': 'metric_type_id and start are required'}), 400
+        try:
+            quantiles = [float(q) for q in request.args.get('q', '0.5,0.95,0.99').split(',')]
+            start = from_wire(request.args['start'])
+            end = from_wire(request.args['end']) if request.args.get('end') else datetime.now()
+        except ValueError:
+            return jsonify({'error': 'Invalid quantiles, start or end'}), 400
+        if not all(0 <= q <= 1 for q in quantiles):
+            return jsonify({'error': 'Quantiles must be between 0 and 1'}), 400
+        device_ids = request.args['device_id'].split(',') if request.args.get('device_id') else None
+
+        job_id = analytics.submit(metric_type_id, start, end, device_ids, quantiles)
+        return jsonify({'job_id': job_id, 'status_url': f'/analytics/{job_id}'}), 202
+
+    @app.route('/analytics/<job_id>', methods=['GET'])
+    def analytics_status(job_id: str):
+        """Endpoint reporting the progress of an analytics job, with its result once done.
+
+        Args:
+            job_id (str): The job id returned when submitting it.
+
+        Returns:
+            Response: JSON with the status, chunk counts and result of the job.
+        """
+        if not analytics:
+            return jsonify({'error': 'Analytics are disabled'}), 404
+        status = job_status(storage, job_id)
+        if status is None:
+            return jsonify({'error': 'Unknown job'}), 404
+        status['relative_accuracy'] = config.sketches.relative_accuracy
+        return jsonify(status), 200
+
     @app.route('/')
     def landing_page():
         """Landing page route.
@@ -265,75 +625,126 @@ def create_app():
     def store_metrics():
         """Store metrics in the database.
 
+        With admission control, oversized payloads are refused, and requests
+        over the concurrency or per-device rate limits get a 429 with ``Retry-After``.
+
         Returns:
             Response: JSON response with status.
         """
-        with BlockTimer("store_metrics"):
-            metrics_data = request.json
-            if not metrics_data:
-                logger.error('No data provided for storing metrics')
-                return jsonify({'error': 'No data provided'}), 400
-
-            session = Session()
-            try:
-                for data in metrics_data:
-                    # Map incoming data into DTOs
-                    device_dto = DeviceDTO(id=data['device']['id'], name=data['device']['name'])
-                    metric_type_dto = MetricTypeDTO(id=data['metric_type']['id'], name=data['metric_type']['name'], min_value=data['metric_type'].get('min_value'), max_value=data['metric_type'].get('max_value'))
-                    unit_dto = UnitDTO(id=data['unit']['id'], name=data['unit']['name'], symbol=data['unit'].get('symbol')) if data.get('unit') else None
-
-                    # Check if Device exists or create it
-                    device = session.query(Device).filter_by(id=device_dto.id).first() or \
-                            session.query(Device).filter_by(name=device_dto.name).first()
-                    if not device:
-                        device = Device(name=device_dto.name, id=device_dto.id)
-                        session.add(device)
-                    
-                    session.flush()
-                    session.commit()
-
-                    # Check if MetricType exists or create it
-                    metric_type = session.query(MetricType).filter_by(name=metric_type_dto.name).first()
-                    if not metric_type:
-                        metric_type = MetricType(name=metric_type_dto.name, min_value=metric_type_dto.min_value, max_value=metric_type_dto.max_value)
-                        session.add(metric_type)
-                    
-                    session.flush()
-                    session.commit()
-                    
-                    # Check if Unit exists or create it
-                    if unit_dto:
-                        unit = session.query(Unit).filter_by(name=unit_dto.name).first()
-                        if not unit:
-                            unit = Unit(name=unit_dto.name, symbol=unit_dto.symbol)
-                            session.add(unit)
-                    
-                    session.flush()
-                    session.commit()
-
-                    # Create MetricReading record using DTO data
-                    metric_reading = MetricReading(
-                        device_id=device.id,
-                        metric_type_id=metric_type.id,
-                        timestamp=datetime.strptime(data['timestamp'], '%Y-%m-%d %H:%M:%S'),
-                        value=data['value'],
-                        unit_id=unit.id if unit else None
+        if admission:
+            if request.content_length is None:
+                return jsonify({'error': 'Content-Length is required'}), 411
+            if request.content_length > config.admission.max_payload_bytes:
+                stats.increment('admission.rejected_payload')
+                return jsonify({'error': 'Payload too large'}), 413
+            if not admission.acquire():
+                return _overloaded(admission.retry_after_s)
+
+        try:
+            with BlockTimer("store_metrics"):
+                metrics_data = request.get_json(silent=True)
+                if not metrics_data or not isinstance(metrics_data, list):
+                    logger.error('No data provided for storing metrics')
+                    return jsonify({'error': 'No data provided'}), 400
+                invalid = next((index for index, reading in enumerate(metrics_data) if not isinstance(reading, dict)), None)
+                if invalid is not None:
+                    logger.error('Metrics data must be a list of readings')
+                    return jsonify({'error': 'Each reading must be an object', 'index': invalid}), 400
+
+                if admission:
+                    readings_by_device = Counter(
+                        str(reading['device'].get('id')) if isinstance(reading.get('device'), dict) else None
+                        for reading in metrics_data
                     )
-                    session.add(metric_reading)
-
-                # Commit the session
-                session.commit()
-                logger.debug('Metrics stored successfully')
-                return jsonify({'status': 'success'}), 201
-            except Exception as e:
-                session.rollback()
-                logger.error('Error storing metrics: %s', e)
-                return jsonify({'error': 'Failed to store metrics'}), 500
-            finally:
-                session.close()
+                    retry_after_s = admission.admit(readings_by_device)
+                    if retry_after_s:
+                        return _overloaded(retry_after_s)
+
+                try:
+                    stored = ingestor.store(metrics_data)
+                    logger.debug('Metrics stored successfully')
+                    return jsonify({'status': 'success', 'stored': stored}), 201
+                except InvalidReadingError as e:
+                    # Nothing was stored; the client drops the reading and resends the others
+                    logger.warning('Rejected metrics: %s', e)
+                    stats.increment('ingest.invalid')
+                    return jsonify({'error': e.reason, 'index': e.index}), 400
+                except Exception as e:
+                    logger.error('Error storing metrics: %s', e)
+                    return jsonify({'error': 'Failed to store metrics'}), 500
+        finally:
+            if admission:
+                admission.release()
 
     return app
 
+def _overloaded(retry_after_s: int) -> tuple[Response, int]:
+    """Build the response turning away a request the server cannot take now.
+
+    Args:
+        retry_after_s (int): Seconds the client should wait before retrying.
+
+    Returns:
+        tuple[Response, int]: The 429 response with its ``Retry-After`` header.
+    """
+    response = jsonify({'error': 'Too many requests', 'retry_after': retry_after_s})
+    response.headers['Retry-After'] = str(retry_after_s)
+    return response, 429
+
+def _distinct_rows(results: list[list]) -> list:
+    """Merge per-shard query rows, dropping rows with an id already seen.
+
+    Args:
+        results (list[list]): Rows returned by each shard, keyed by their first column.
+
+    Returns:
+        list: The distinct rows.
+    """
+    rows = {}
+    for shard_rows in results:
+        for row in shard_rows:
+            rows.setdefault(row[0], row)
+    return list(rows.values())
+
+def _query_readings(session: Session, device_id, metric_type_id, with_totals: bool = True) -> dict:
+    """Query the dashboard readings of one database in a single statement.
+
+    The readings of the series are selected once in a CTE; window functions
+    attach their sum and count to every row, and only the rendered columns
+    of the device, metric type and unit are joined in.
+
+    Args:
+        session (Session): The database session.
+        device_id: Device to filter on, or None for all devices.
+        metric_type_id: Metric type to filter on.
+        with_totals (bool): Whether to compute the sum and count, only the readings are read if False.
+
+    Returns:
+        dict: The readings newest first, as ``RecentReading``, with the sum and count of their values.
+    """
+    totals = (func.sum(MetricReading.value).over(), func.count().over()) if with_totals else (null(), null())
+    filtered = select(
+        MetricReading.timestamp, MetricReading.value, MetricReading.device_id, MetricReading.metric_type_id, MetricReading.unit_id,
+        totals[0].label('total'),
+        totals[1].label('count')
+    ).where(MetricReading.metric_type_id == metric_type_id)
+    if device_id:
+        filtered = filtered.where(MetricReading.device_id == device_id)
+    filtered = filtered.cte('filtered')
+
+    rows = session.execute(
+        select(
+            filtered.c.timestamp, filtered.c.value, Device.name, MetricType.name, MetricType.min_value, MetricType.max_value,
+            Unit.name, Unit.symbol, filtered.c.total, filtered.c.count
+        )
+        .join(Device, Device.id == filtered.c.device_id)
+        .join(MetricType, MetricType.id == filtered.c.metric_type_id)
+        .outerjoin(Unit, Unit.id == filtered.c.unit_id)
+        .order_by(filtered.c.timestamp.desc())
+    ).all()
+    total, count = (rows[0][-2], rows[0][-1]) if rows and with_totals else (None, len(rows))
+    return {'readings': [RecentReading(*row[:-2]) for row in rows], 'sum': total, 'count': count}
+
 def launch_app():
     """Launch the Flask application."""
     app: Flask = create_app()
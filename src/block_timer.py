@@ -1,10 +1,16 @@
 import logging
 import time
 
+from stats_registry import stats
+
 logger = logging.getLogger(__name__)
 
 class BlockTimer:
-    """RAII Context manager for timing code blocks."""
+    """RAII Context manager for timing code blocks.
+
+    Every timed block is recorded in the shared stats registry, so timings are
+    available at INFO level without any log output.
+    """
 
     def __init__(self, block_name="Code block"):
         """Initialize the BlockTimer.
@@ -29,4 +35,7 @@ class BlockTimer:
         """
         self.end = time.perf_counter()
         elapsed_time = self.end - self.start
-        logger.debug(f"{self.block_name} executed in: {elapsed_time:.4f} seconds")
\ No newline at end of file
+        stats.observe(self.block_name, elapsed_time)
+        if exc_type is not None:
+            stats.increment(f"{self.block_name}.errors")
+        logger.debug("%s executed in: %.4f seconds", self.block_name, elapsed_time)
\ No newline at end of file
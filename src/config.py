@@ -3,7 +3,7 @@
 from pathlib import Path
 import json
 import os
-from typing import ClassVar, Optional
+from typing import ClassVar, Literal, Optional
 from pydantic import BaseModel
 
 
@@ -13,16 +13,29 @@ class ServerConfig(BaseModel):
     port: int
     debug: bool
     url: str
+    workers: int = 1
 
 class DatabaseConfig(BaseModel):
     """Database configuration class."""
     db_engine: str
+    shards: int = 1
+    shard_engine_template: str = "sqlite:///metrics_shard_{shard}.db"
+    query_workers: int = 4
 
 class LoggingConfig(BaseModel):
     """Logging configuration class."""
     level: str
     format: str
     file_path: str
+    queued: bool = True
+    max_bytes: int = 10_000_000
+    backup_count: int = 5
+    rate_limits: dict[str, float] = {}
+
+class MetricCacheConfig(BaseModel):
+    """Per-metric cache configuration class."""
+    ttl_m: float
+    max_stale_m: float
 
 class ThirdPartyAPIConfig(BaseModel):
     """Third Party API configuration class."""
@@ -30,6 +43,124 @@ class ThirdPartyAPIConfig(BaseModel):
     url: str
     params: dict[str, str]
     cache_timeout_m: float
+    cache_policy: str = "expire"
+    metric_cache: dict[str, MetricCacheConfig] = {}
+
+    def cache_for(self, metric_type: str) -> MetricCacheConfig:
+        """Return the cache settings of a metric type.
+
+        Metric types without their own settings use ``cache_timeout_m`` and are never served stale.
+
+        Args:
+            metric_type (str): The metric type name.
+
+        Returns:
+            MetricCacheConfig: The cache settings for the metric type.
+        """
+        return self.metric_cache.get(metric_type) or MetricCacheConfig(ttl_m=self.cache_timeout_m, max_stale_m=self.cache_timeout_m)
+
+class MetricScheduleConfig(BaseModel):
+    """Per-metric sampling and reporting configuration class."""
+    interval_s: float
+    jitter_s: float = 0
+    deadband: float = 0
+    max_silence_s: float = 300
+
+class BatchConfig(BaseModel):
+    """Outbound reading batching configuration class."""
+    enabled: bool = True
+    max_batch_size: int = 500
+    max_delay_s: float = 10
+    max_pending: int = 50000
+    max_retry_delay_s: float = 60
+
+class CollectorConfig(BaseModel):
+    """Collector scheduling configuration class."""
+    host_metrics: list[str] = ["CPUTimes", "RAMUsage", "NetworkSend"]
+    default_schedule: MetricScheduleConfig
+    metrics: dict[str, MetricScheduleConfig]
+    backoff_factor: float
+    max_backoff_multiplier: float
+    batch: BatchConfig = BatchConfig()
+    # Interface and port of the collector's /internal/stats listener, disabled if the port is None
+    stats_host: str = '127.0.0.1'
+    stats_port: int | None = 9101
+
+    def schedule_for(self, metric_type: str) -> MetricScheduleConfig:
+        """Return the schedule of a metric type, falling back to the default.
+
+        Args:
+            metric_type (str): The metric type name.
+
+        Returns:
+            MetricScheduleConfig: The schedule for the metric type.
+        """
+        return self.metrics.get(metric_type, self.default_schedule)
+
+class HTTPConfig(BaseModel):
+    """Outbound HTTP resilience configuration class."""
+    connect_timeout_s: float
+    read_timeout_s: float
+    failure_threshold: int
+    reset_timeout_s: float
+    hedge_after_s: Optional[float] = None
+
+class ProfilingConfig(BaseModel):
+    """Profiling configuration class."""
+    endpoint_token: str
+    profile_slow_requests: bool
+    slow_threshold_ms: float
+    output_dir: str
+    max_sample_s: float
+    sample_interval_ms: float
+
+class AlertsConfig(BaseModel):
+    """Streaming alert evaluation configuration class."""
+    enabled: bool = True
+    ewma_alpha: float = 0.1
+    z_threshold: float = 4.0
+    warmup: int = 30
+    hysteresis: float = 0.02
+    # Cumulative metrics, matched as shell-style patterns; their per-second rate is checked instead
+    counter_metrics: list[str] = [
+        "CPUTimes", "CPUSystemTimes", "CPUIdleTimes", "CPUContextSwitches", "CPUInterrupts", "CPUCore*Times*",
+        "Network*", "NIC*", "Disk*Bytes*", "Disk*Count*", "Uptime", "CollectorCPUTime"
+    ]
+
+class DashboardConfig(BaseModel):
+    """Dashboard configuration class."""
+    point_budget: int = 2000
+
+class SketchesConfig(BaseModel):
+    """Quantile sketch configuration class."""
+    enabled: bool = True
+    bucket_m: int = 60
+    relative_accuracy: float = 0.01
+
+class HotTierConfig(BaseModel):
+    """In-memory hot tier configuration class."""
+    enabled: bool = True
+    capacity: int = 512
+
+class TimestampsConfig(BaseModel):
+    """Timestamp representation configuration class."""
+    mode: Literal["datetime", "epoch_ms"] = "epoch_ms"
+
+class AdmissionConfig(BaseModel):
+    """Ingest admission control configuration class."""
+    enabled: bool = True
+    device_rate: float = 50.0
+    device_burst: int = 1000
+    max_concurrent: int = 4
+    max_payload_bytes: int = 2_000_000
+    retry_after_s: int = 1
+    max_devices: int = 10000
+
+class AnalyticsConfig(BaseModel):
+    """Background analytics configuration class."""
+    enabled: bool = True
+    workers: Optional[int] = None
+    chunk_h: int = 24
 
 class Config(BaseModel):
     """Singleton configuration class."""
@@ -41,6 +172,16 @@ class Config(BaseModel):
     logging: LoggingConfig
     third_party_api: ThirdPartyAPIConfig
     database: DatabaseConfig
+    profiling: ProfilingConfig
+    collector: CollectorConfig
+    http: HTTPConfig
+    alerts: AlertsConfig = AlertsConfig()
+    dashboard: DashboardConfig = DashboardConfig()
+    sketches: SketchesConfig = SketchesConfig()
+    hot_tier: HotTierConfig = HotTierConfig()
+    timestamps: TimestampsConfig = TimestampsConfig()
+    admission: AdmissionConfig = AdmissionConfig()
+    analytics: AnalyticsConfig = AnalyticsConfig()
 
     def __new__(cls, *args, **kwargs):
         """Singleton pattern enforcing on Config class creation."""
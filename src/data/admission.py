@@ -0,0 +1,138 @@
+"""Admission module. Sheds ingest load the server cannot absorb."""
+
+from collections import OrderedDict
+import logging
+import math
+import threading
+import time
+
+from config import config
+from stats_registry import stats
+
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+    """Readings a device may still send right away, refilled over time."""
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, tokens: float, updated: float):
+        """Initialize a TokenBucket.
+
+        Args:
+            tokens (float): Initial number of tokens.
+            updated (float): Monotonic time the tokens were counted at.
+        """
+        self.tokens = tokens
+        self.updated = updated
+
+    def refill(self, now: float, rate: float, burst: float):
+        """Add the tokens earned since the last update.
+
+        Args:
+            now (float): Current monotonic time.
+            rate (float): Tokens earned per second.
+            burst (float): Capacity of the bucket.
+        """
+        self.tokens = min(self.tokens + (now - self.updated) * rate, burst)
+        self.updated = now
+
+class AdmissionController:
+    """Class deciding whether an ingest request is accepted.
+
+    Each device has a token bucket of ``device_burst`` readings refilled at
+    ``device_rate`` readings per second; a batch holding more than a full
+    bucket needs the whole bucket. At most ``max_concurrent`` requests are
+    stored at once. The limits apply per worker process.
+
+    Buckets idle long enough to be full again are forgotten, since a new
+    bucket would be the same, and at most ``max_devices`` are kept, the least
+    recently used being dropped first.
+    """
+
+    def __init__(self, device_rate: float, device_burst: int, max_concurrent: int, retry_after_s: int, max_devices: int = 10000):
+        """Initialize the AdmissionController class.
+
+        Args:
+            device_rate (float): Readings per second allowed for each device.
+            device_burst (int): Readings a device may send at once after being idle.
+            max_concurrent (int): Maximum number of requests stored at once.
+            retry_after_s (int): Delay suggested to clients turned away for concurrency.
+            max_devices (int): Maximum number of device buckets kept.
+        """
+        self.device_rate = device_rate
+        self.device_burst = device_burst
+        self.retry_after_s = retry_after_s
+        self.max_devices = max_devices
+        # Least recently used first
+        self.buckets: OrderedDict[str, TokenBucket] = OrderedDict()
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls) -> "AdmissionController":
+        """Create the controller described by the configuration.
+
+        Returns:
+            AdmissionController: The configured controller.
+        """
+        admission = config.admission
+        return cls(admission.device_rate, admission.device_burst, admission.max_concurrent, admission.retry_after_s, admission.max_devices)
+
+    def acquire(self) -> bool:
+        """Take a concurrency slot without waiting.
+
+        Returns:
+            bool: True if a slot was taken and must be released, False if all are busy.
+        """
+        if self._slots.acquire(blocking=False):
+            return True
+        stats.increment('admission.rejected_concurrency')
+        return False
+
+    def release(self):
+        """Give back a slot taken by ``acquire``."""
+        self._slots.release()
+
+    def admit(self, readings_by_device: dict[str, int]) -> int:
+        """Take tokens for a batch, only if every device in it has enough.
+
+        Args:
+            readings_by_device (dict[str, int]): Number of readings in the batch per device id.
+
+        Returns:
+            int: 0 if the batch is admitted, otherwise the seconds to wait before retrying.
+        """
+        now = time.monotonic()
+        with self._lock:
+            costs = []
+            wait_s = 0.0
+            for device_id, count in readings_by_device.items():
+                bucket = self.buckets.get(device_id)
+                if bucket is None:
+                    self.buckets[device_id] = bucket = TokenBucket(self.device_burst, now)
+                else:
+                    self.buckets.move_to_end(device_id)
+                bucket.refill(now, self.device_rate, self.device_burst)
+                cost = min(count, self.device_burst)
+                wait_s = max(wait_s, (cost - bucket.tokens) / self.device_rate)
+                costs.append((bucket, cost))
+            self._evict(now)
+            if wait_s > 0:
+                stats.increment('admission.rejected_rate')
+                return math.ceil(wait_s)
+            for bucket, cost in costs:
+                bucket.tokens -= cost
+        return 0
+
+    def _evict(self, now: float):
+        """Forget full buckets and the least recently used beyond ``max_devices``. Requires the lock.
+
+        Args:
+            now (float): Current monotonic time.
+        """
+        refill_s = self.device_burst / self.device_rate
+        while self.buckets:
+            device_id, bucket = next(iter(self.buckets.items()))
+            if len(self.buckets) <= self.max_devices and now - bucket.updated < refill_s:
+                break
+            del self.buckets[device_id]
@@ -0,0 +1,236 @@
+"""Alerts module. Evaluates incoming readings against thresholds and their recent behaviour."""
+
+from fnmatch import fnmatch
+import logging
+import math
+import threading
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+THRESHOLD_HIGH = 'threshold_high'
+THRESHOLD_LOW = 'threshold_low'
+THRESHOLD_CLEAR = 'threshold_clear'
+ANOMALY = 'anomaly'
+ANOMALY_CLEAR = 'anomaly_clear'
+
+class SeriesState:
+    """Constant-size state kept for one (device, metric type) series."""
+    __slots__ = ('mean', 'variance', 'count', 'breach', 'anomalous')
+
+    def __init__(self, value: float):
+        """Initialize the SeriesState from the first value of the series.
+
+        Args:
+            value (float): The first value.
+        """
+        self.mean = value
+        self.variance = 0.0
+        self.count = 1
+        self.breach = None
+        self.anomalous = False
+
+class AlertEvaluator:
+    """Class evaluating each reading as it is ingested.
+
+    Two checks run per reading in O(1) time and memory:
+
+    * the metric type's ``min_value``/``max_value`` thresholds, with hysteresis so
+      a value hovering at a limit does not raise an alert on every reading;
+    * a z-score against an exponentially weighted moving mean and variance,
+      once the series has seen ``warmup`` readings.
+
+    Cumulative metrics (``counter_metrics``) only ever grow, so their thresholds
+    are not checked and the z-score runs on their per-second rate between two
+    readings. The state is kept in memory, so all the readings of a series
+    must reach the same process.
+    """
+
+    def __init__(self, alpha: float, z_threshold: float, warmup: int, hysteresis: float, counter_metrics: list[str] | None = None):
+        """Initialize the AlertEvaluator class.
+
+        Args:
+            alpha (float): Weight of the newest value in the moving mean and variance.
+            z_threshold (float): Absolute z-score above which a reading is anomalous.
+            warmup (int): Readings a series needs before anomalies are reported.
+            hysteresis (float): Fraction of the min/max range a value must move back
+                inside the thresholds before a breach clears.
+            counter_metrics (list[str] | None): Shell-style patterns of the cumulative metric type names.
+        """
+        self.alpha = alpha
+        self.z_threshold = z_threshold
+        self.warmup = warmup
+        self.hysteresis = hysteresis
+        self.counter_metrics = counter_metrics or []
+        self.series: dict[tuple, SeriesState] = {}
+        # Last value and time of each counter series
+        self.counters: dict[tuple, tuple[float, int]] = {}
+        self._is_counter: dict[str, bool] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls) -> "AlertEvaluator":
+        """Create the evaluator described by the configuration.
+
+        Returns:
+            AlertEvaluator: The configured evaluator.
+        """
+        return cls(
+            alpha=config.alerts.ewma_alpha,
+            z_threshold=config.alerts.z_threshold,
+            warmup=config.alerts.warmup,
+            hysteresis=config.alerts.hysteresis,
+            counter_metrics=config.alerts.counter_metrics,
+        )
+
+    def evaluate_batch(self, readings: list[dict]) -> list[dict]:
+        """Evaluate a batch of stored readings in order.
+
+        Args:
+            readings (list[dict]): Resolved readings, as built by ``MetricsIngestor``.
+
+        Returns:
+            list[dict]: The alert events raised by the batch.
+        """
+        events = []
+        with self._lock:
+            for reading in readings:
+                raised = self.evaluate(reading['device'][0], reading['metric_type'], reading['timestamp'], reading['value'])
+                if raised:
+                    events.extend(raised)
+        for event in events:
+            logger.warning('Alert %s on %s/%s: %s', event['kind'], event['device_id'], event['metric_type_id'], event['detail'])
+        return events
+
+    def evaluate(self, device_id, metric_type: tuple, timestamp: int, value: float) -> list[dict]:
+        """Evaluate one reading and update the state of its series.
+
+        Callers evaluating from several threads must hold the evaluator lock,
+        as ``evaluate_batch`` does.
+
+        Args:
+            device_id: The device id.
+            metric_type (tuple): The metric type id, name, min value and max value.
+            timestamp (int): Time of the reading, in epoch milliseconds.
+            value (float): The reading value.
+
+        Returns:
+            list[dict]: The alert events raised by the reading, usually none.
+        """
+        metric_type_id, metric_type_name, min_value, max_value = metric_type
+        key = (device_id, metric_type_id)
+        if self.is_counter(metric_type_name):
+            value = self._rate(key, timestamp, value)
+            if value is None:
+                return []
+            # The limits bound the cumulative value, not its rate
+            min_value = max_value = None
+        state = self.series.get(key)
+        if state is None:
+            self.series[key] = state = SeriesState(value)
+            events = []
+        else:
+            events = self._check_anomaly(state, value)
+            # Exponentially weighted mean and variance
+            difference = value - state.mean
+            increment = self.alpha * difference
+            state.mean += increment
+            state.variance = (1 - self.alpha) * (state.variance + difference * increment)
+            state.count += 1
+
+        breach = self._check_thresholds(state, value, min_value, max_value)
+        if breach:
+            events.append(breach)
+        if not events:
+            return events
+        return [
+            {'device_id': device_id, 'metric_type_id': metric_type_id, 'timestamp': timestamp, 'kind': kind, 'value': value, 'detail': detail}
+            for kind, detail in events
+        ]
+
+    def is_counter(self, metric_type_name: str) -> bool:
+        """Check if a metric type is cumulative.
+
+        Args:
+            metric_type_name (str): Name of the metric type.
+
+        Returns:
+            bool: True if the name matches one of the counter patterns.
+        """
+        is_counter = self._is_counter.get(metric_type_name)
+        if is_counter is None:
+            is_counter = self._is_counter[metric_type_name] = any(fnmatch(metric_type_name, pattern) for pattern in self.counter_metrics)
+        return is_counter
+
+    def _rate(self, key: tuple, timestamp: int, value: float) -> float | None:
+        """Turn a counter reading into its per-second rate since the previous one.
+
+        Args:
+            key (tuple): The device id and metric type id.
+            timestamp (int): Time of the reading, in epoch milliseconds.
+            value (float): The cumulative value.
+
+        Returns:
+            float | None: The rate, or None for the first reading, a reading not newer
+                than the previous one, or after the counter was reset.
+        """
+        previous = self.counters.get(key)
+        if previous is not None and timestamp <= previous[1]:
+            return None
+        self.counters[key] = (value, timestamp)
+        if previous is None or value < previous[0]:
+            return None
+        return (value - previous[0]) * 1000 / (timestamp - previous[1])
+
+    def _check_anomaly(self, state: SeriesState, value: float) -> list[tuple]:
+        """Compare a value with the moving mean and variance of its series.
+
+        Args:
+            state (SeriesState): State of the series before the value.
+            value (float): The reading value.
+
+        Returns:
+            list[tuple]: (kind, detail) of the raised events.
+        """
+        if state.count < self.warmup or state.variance <= 0:
+            return []
+        z_score = (value - state.mean) / math.sqrt(state.variance)
+        if not state.anomalous and abs(z_score) > self.z_threshold:
+            state.anomalous = True
+            return [(ANOMALY, f'z-score {z_score:.1f} from mean {state.mean:.4g}')]
+        if state.anomalous and abs(z_score) < self.z_threshold / 2:
+            state.anomalous = False
+            return [(ANOMALY_CLEAR, f'z-score {z_score:.1f} from mean {state.mean:.4g}')]
+        return []
+
+    def _check_thresholds(self, state: SeriesState, value: float, min_value: float | None, max_value: float | None) -> tuple | None:
+        """Compare a value with the thresholds of its metric type.
+
+        Args:
+            state (SeriesState): State of the series.
+            value (float): The reading value.
+            min_value (float | None): Lower threshold.
+            max_value (float | None): Upper threshold.
+
+        Returns:
+            tuple | None: (kind, detail) of the raised event, if any.
+        """
+        if min_value is None and max_value is None:
+            return None
+        margin = self.hysteresis * (max_value - min_value) if min_value is not None and max_value is not None else 0.0
+
+        if state.breach is None:
+            if max_value is not None and value > max_value:
+                state.breach = THRESHOLD_HIGH
+                return THRESHOLD_HIGH, f'above maximum {max_value:g}'
+            if min_value is not None and value < min_value:
+                state.breach = THRESHOLD_LOW
+                return THRESHOLD_LOW, f'below minimum {min_value:g}'
+        elif state.breach == THRESHOLD_HIGH and value <= max_value - margin:
+            state.breach = None
+            return THRESHOLD_CLEAR, f'back below maximum {max_value:g}'
+        elif state.breach == THRESHOLD_LOW and value >= min_value + margin:
+            state.breach = None
+            return THRESHOLD_CLEAR, f'back above minimum {min_value:g}'
+        return None
@@ -0,0 +1,279 @@
+"""Analytics module. Aggregates long time ranges of readings in a pool of worker processes."""
+
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime, timedelta
+import json
+import logging
+import math
+import multiprocessing
+import os
+import threading
+import uuid
+from sqlalchemy import create_engine, insert, select, update
+from sqlalchemy.engine import Engine
+
+from config import config
+from stats_registry import stats
+
+from .models import AnalyticsJob, MetricReading
+from .sketch import DDSketch, summarize
+from .storage import Storage
+
+logger = logging.getLogger(__name__)
+
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+# Chunks per shard and job; longer ranges get longer chunks
+MAX_CHUNKS = 256
+
+# Engines of the worker process, one per shard, opened by _open_engines
+_engines: list[Engine] = []
+
+class AnalyticsExecutor:
+    """Class computing per-device statistics of a metric over long time ranges.
+
+    The range is split into ``chunk_h`` hour chunks, at most ``MAX_CHUNKS``
+    of them, on every shard holding the requested devices. Worker processes
+    aggregate the chunks into quantile sketches on their own read-only
+    engines, so the work neither holds the GIL of the web app nor blocks its
+    request threads. The partial sketches are merged as chunks complete. Jobs
+    are recorded in the catalog, so any worker process of the web app can
+    report their progress and result.
+    """
+
+    def __init__(self, storage: Storage, workers: int | None = None, chunk_h: int = 24, relative_accuracy: float = 0.01):
+        """Initialize the AnalyticsExecutor class.
+
+        Args:
+            storage (Storage): The storage to read from; jobs are recorded in its catalog.
+            workers (int | None): Number of worker processes, the number of CPUs if None.
+            chunk_h (int): Length in hours of the time range aggregated by one task.
+            relative_accuracy (float): Relative accuracy of the estimated quantiles.
+        """
+        self.storage = storage
+        self.chunk_h = chunk_h
+        self.relative_accuracy = relative_accuracy
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers or os.cpu_count(),
+            # Forking a threaded web app process could copy held locks into the workers
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_open_engines,
+            initargs=([_read_only_url(engine) for engine in storage.shard_engines],),
+        )
+        self._jobs: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, storage: Storage, web_workers: int = 1) -> "AnalyticsExecutor":
+        """Create the executor described by the configuration.
+
+        Without ``analytics.workers``, the CPUs are shared between the pools
+        of the web app processes, each getting at least one worker process.
+
+        Args:
+            storage (Storage): The storage to read from.
+            web_workers (int): Number of web app processes, each creating its own executor.
+
+        Returns:
+            AnalyticsExecutor: The configured executor.
+        """
+        workers = config.analytics.workers or max(1, (os.cpu_count() or 1) // web_workers)
+        return cls(storage, workers, config.analytics.chunk_h, config.sketches.relative_accuracy)
+
+    def submit(self, metric_type_id: int, start: datetime, end: datetime, device_ids: list | None = None, quantiles: list[float] = (0.5, 0.95, 0.99)) -> str:
+        """Start computing the statistics of a metric.
+
+        Args:
+            metric_type_id (int): The metric type.
+            start (datetime): Start of the range, included.
+            end (datetime): End of the range, excluded.
+            device_ids (list | None): Only include these devices, all devices if None.
+            quantiles (list[float]): The quantiles to estimate, between 0 and 1.
+
+        Returns:
+            str: The job id, to pass to ``job_status``.
+        """
+        if device_ids:
+            shards: dict[int, list | None] = {}
+            for device_id in device_ids:
+                shards.setdefault(self.storage.shard_for(device_id), []).append(device_id)
+        else:
+            shards = dict.fromkeys(range(len(self.storage.shard_engines)))
+        chunk_h = max(self.chunk_h, math.ceil((end - start) / timedelta(hours=1) / MAX_CHUNKS))
+        chunks = [
+            (shard, devices, chunk_start, min(chunk_start + timedelta(hours=chunk_h), end))
+            for shard, devices in shards.items()
+            for chunk_start in _chunk_starts(start, end, chunk_h)
+        ]
+
+        job_id = str(uuid.uuid4())
+        with self.storage.catalog_engine.begin() as connection:
+            connection.execute(insert(AnalyticsJob).values(id=job_id, status=RUNNING, chunks=len(chunks), chunks_done=0))
+        stats.increment('analytics.jobs')
+        logger.info('Analytics job %s: metric type %s over %d chunks', job_id, metric_type_id, len(chunks))
+
+        with self._lock:
+            self._jobs[job_id] = {'quantiles': list(quantiles), 'sketches': {}, 'remaining': len(chunks)}
+        if not chunks:
+            self._finish(job_id)
+        for shard, devices, chunk_start, chunk_end in chunks:
+            future = self.executor.submit(
+                _aggregate_chunk, shard, metric_type_id, devices, chunk_start, chunk_end, self.relative_accuracy
+            )
+            future.add_done_callback(lambda future, job_id=job_id: self._collect(job_id, future))
+        return job_id
+
+    def shutdown(self):
+        """Stop the worker processes, abandoning queued chunks."""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _collect(self, job_id: str, future: Future):
+        """Merge the sketches of a completed chunk into its job.
+
+        Args:
+            job_id (str): The job id.
+            future (Future): The completed chunk.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                # An earlier chunk of the job failed
+                return
+            try:
+                for device_id, data in future.result().items():
+                    sketch = DDSketch.from_json(data)
+                    if device_id in job['sketches']:
+                        job['sketches'][device_id].merge(sketch)
+                    else:
+                        job['sketches'][device_id] = sketch
+            except Exception as e:
+                logger.error('Analytics job %s failed: %s', job_id, e)
+                del self._jobs[job_id]
+                with self.storage.catalog_engine.begin() as connection:
+                    connection.execute(update(AnalyticsJob).where(AnalyticsJob.id == job_id).values(status=FAILED, result=json.dumps({'error': str(e)})))
+                return
+            job['remaining'] -= 1
+            finished = not job['remaining']
+            if not finished:
+                # Under the lock, so progress is never written after the result
+                with self.storage.catalog_engine.begin() as connection:
+                    connection.execute(update(AnalyticsJob).where(AnalyticsJob.id == job_id).values(chunks_done=AnalyticsJob.chunks_done + 1))
+
+        if finished:
+            self._finish(job_id)
+
+    def _finish(self, job_id: str):
+        """Store the merged statistics of a job whose chunks all completed.
+
+        Args:
+            job_id (str): The job id.
+        """
+        with self._lock:
+            job = self._jobs.pop(job_id)
+        overall = DDSketch(self.relative_accuracy)
+        for sketch in job['sketches'].values():
+            overall.merge(sketch)
+        result = {
+            'overall': summarize(overall, job['quantiles']),
+            'devices': {str(device_id): summarize(sketch, job['quantiles']) for device_id, sketch in job['sketches'].items()},
+        }
+        with self.storage.catalog_engine.begin() as connection:
+            connection.execute(
+                update(AnalyticsJob).where(AnalyticsJob.id == job_id)
+                .values(status=DONE, chunks_done=AnalyticsJob.chunks, result=json.dumps(result))
+            )
+        logger.info('Analytics job %s done: %d readings of %d devices', job_id, overall.count, len(job['sketches']))
+
+def job_status(storage: Storage, job_id: str) -> dict | None:
+    """Return the progress of a job, with its result once done.
+
+    Only the job row is read, so any web app process can report any job,
+    whichever process runs it.
+
+    Args:
+        storage (Storage): The storage recording the jobs in its catalog.
+        job_id (str): The job id returned by ``AnalyticsExecutor.submit``.
+
+    Returns:
+        dict | None: The job status, chunk counts and result, or None if the job is unknown.
+    """
+    with storage.catalog_engine.connect() as connection:
+        job = connection.execute(select(AnalyticsJob).where(AnalyticsJob.id == job_id)).first()
+    if job is None:
+        return None
+    return {
+        'status': job.status,
+        'chunks': job.chunks,
+        'chunks_done': job.chunks_done,
+        'result': json.loads(job.result) if job.result else None,
+    }
+
+def _chunk_starts(start: datetime, end: datetime, chunk_h: int):
+    """Yield the start of every chunk of a time range.
+
+    Args:
+        start (datetime): Start of the range.
+        end (datetime): End of the range.
+        chunk_h (int): Length of the chunks in hours.
+
+    Yields:
+        datetime: Start of a chunk.
+    """
+    while start < end:
+        yield start
+        start += timedelta(hours=chunk_h)
+
+def _read_only_url(engine: Engine) -> str:
+    """Return the URL opening a database read-only, for the worker processes.
+
+    Args:
+        engine (Engine): Engine of the database.
+
+    Returns:
+        str: The URL, opening SQLite files in read-only mode by absolute path.
+    """
+    url = engine.url
+    if url.get_backend_name() != 'sqlite' or not url.database or url.database == ':memory:':
+        return url.render_as_string(hide_password=False)
+    return f'sqlite:///file:{os.path.abspath(url.database)}?mode=ro&uri=true'
+
+def _open_engines(urls: list[str]):
+    """Open the shard engines of a worker process.
+
+    Args:
+        urls (list[str]): URL of every shard, in shard order.
+    """
+    _engines[:] = [create_engine(url) for url in urls]
+
+def _aggregate_chunk(shard: int, metric_type_id: int, device_ids: list | None, start: datetime, end: datetime, relative_accuracy: float) -> dict:
+    """Sketch the values of a metric per device over a chunk of a shard. Runs in a worker process.
+
+    Args:
+        shard (int): The shard index.
+        metric_type_id (int): The metric type.
+        device_ids (list | None): Only include these devices, all devices if None.
+        start (datetime): Start of the chunk, included.
+        end (datetime): End of the chunk, excluded.
+        relative_accuracy (float): Relative accuracy of the sketches.
+
+    Returns:
+        dict: Serialized sketch by device id.
+    """
+    statement = select(MetricReading.device_id, MetricReading.value).where(
+        MetricReading.metric_type_id == metric_type_id,
+        MetricReading.timestamp >= start,
+        MetricReading.timestamp < end,
+    )
+    if device_ids:
+        statement = statement.where(MetricReading.device_id.in_(device_ids))
+
+    sketches: dict = {}
+    with _engines[shard].connect() as connection:
+        for device_id, value in connection.execute(statement):
+            sketch = sketches.get(device_id)
+            if sketch is None:
+                sketches[device_id] = sketch = DDSketch(relative_accuracy)
+            sketch.add(value)
+    return {device_id: sketch.to_json() for device_id, sketch in sketches.items()}
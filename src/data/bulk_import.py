@@ -0,0 +1,394 @@
+"""Bulk import module. Loads large CSV/NDJSON files of readings into the database."""
+
+from collections import defaultdict
+import csv
+import gzip
+import json
+import logging
+import os
+from pathlib import Path
+import queue
+import threading
+import time
+from typing import Iterator
+import uuid
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from timestamps import parse_ms
+
+from .dto import DeviceDTO, MetricTypeDTO, UnitDTO
+from .ingest import add_readings, mirror_catalog, resolve_device, resolve_metric_type, resolve_unit
+from .models import ImportProgress
+from .storage import Storage
+
+logger = logging.getLogger(__name__)
+
+# Trade durability for speed while loading; a crash only loses uncommitted chunks.
+# The journal mode persists in the database file, so it is restored afterwards
+BULK_LOAD_PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=OFF',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA cache_size=-65536',
+)
+
+def parse_file(path: Path) -> Iterator[tuple]:
+    """Stream the readings of a CSV or NDJSON file, optionally gzipped.
+
+    CSV files use the columns written by ``/export`` (``device_id``, ``device``,
+    ``metric_type``, ``timestamp``, ``value``, ``unit``, ``utc_offset``, ``id``) plus
+    the optional ``unit_symbol``, ``min_value`` and ``max_value``. NDJSON lines
+    use either those keys or the nested format sent by the collector. Readings
+    with an id already stored are skipped, so files may overlap.
+
+    Args:
+        path (Path): The file to read.
+
+    Returns:
+        Iterator[tuple]: Readings as (device id, device name, metric type, min value,
+            max value, unit name, unit symbol, timestamp in epoch milliseconds, value, utc offset, reading id).
+    """
+    suffixes = [suffix.lower() for suffix in path.suffixes]
+    opener = gzip.open if suffixes and suffixes[-1] == '.gz' else open
+    if suffixes and suffixes[-1] == '.gz':
+        suffixes = suffixes[:-1]
+
+    with opener(path, 'rt', newline='', encoding='utf-8') as file:
+        if suffixes and suffixes[-1] == '.csv':
+            for row in csv.DictReader(file):
+                yield _parse_flat(row)
+        elif suffixes and suffixes[-1] in ('.ndjson', '.jsonl', '.json'):
+            for line in file:
+                if not line.strip():
+                    continue
+                data = json.loads(line)
+                yield _parse_nested(data) if isinstance(data.get('device'), dict) else _parse_flat(data)
+        else:
+            raise ValueError(f'Unsupported file type: {path}')
+
+def _parse_flat(row: dict) -> tuple:
+    """Parse a reading in the export format.
+
+    Args:
+        row (dict): The reading.
+
+    Returns:
+        tuple: The normalized reading.
+    """
+    return (
+        row['device_id'], row['device'], row['metric_type'],
+        _optional_float(row.get('min_value')), _optional_float(row.get('max_value')),
+        row.get('unit') or None, row.get('unit_symbol') or '',
+        parse_ms(row['timestamp']), float(row['value']),
+        _optional_float(row.get('utc_offset')) or 0.0,
+        row.get('id') or None,
+    )
+
+def _parse_nested(data: dict) -> tuple:
+    """Parse a reading in the format sent by the collector.
+
+    Args:
+        data (dict): The reading.
+
+    Returns:
+        tuple: The normalized reading.
+    """
+    unit = data.get('unit') or {}
+    return (
+        data['device']['id'], data['device']['name'], data['metric_type']['name'],
+        data['metric_type'].get('min_value'), data['metric_type'].get('max_value'),
+        unit.get('name'), unit.get('symbol') or '',
+        parse_ms(data['timestamp']), float(data['value']),
+        data.get('utc_offset') or 0.0,
+        data['id'] if isinstance(data.get('id'), str) else None,
+    )
+
+def _optional_float(value) -> float | None:
+    """Convert a possibly empty value to a float.
+
+    Args:
+        value: The value to convert.
+
+    Returns:
+        float | None: The value, or None if empty.
+    """
+    return float(value) if value not in (None, '') else None
+
+class BulkImporter:
+    """Class loading files of readings through a parser thread and chunked transactions.
+
+    Progress is recorded per file after every chunk, so an interrupted
+    import resumes after the last committed chunk when run again. Rows
+    without an id get one derived from the file and the row position, so
+    rows committed to a shard before the progress was recorded are skipped
+    on resume instead of stored twice.
+    """
+
+    def __init__(self, storage: Storage, chunk_size: int = 50000, report_every_s: float = 5.0):
+        """Initialize the BulkImporter class.
+
+        Args:
+            storage (Storage): The storage to write to.
+            chunk_size (int): Number of readings per transaction.
+            report_every_s (float): Seconds between two progress reports.
+        """
+        self.storage = storage
+        self.chunk_size = chunk_size
+        self.report_every_s = report_every_s
+        self.devices: dict[str, tuple] = {}
+        self.metric_types: dict[str, tuple] = {}
+        self.units: dict[str, tuple] = {}
+        self.mirrored: dict[int, set] = defaultdict(set)
+
+    def import_file(self, path: str) -> int:
+        """Import a file, resuming after the rows committed by a previous run.
+
+        Args:
+            path (str): The file to import.
+
+        Returns:
+            int: The number of readings inserted by this run, those already stored excluded.
+        """
+        path = Path(path)
+        source, source_size = str(path.resolve()), os.path.getsize(path)
+        rows_done = self._load_progress(source, source_size)
+        if rows_done:
+            logger.info('Resuming %s after %d rows', path, rows_done)
+
+        chunks: queue.Queue = queue.Queue(maxsize=4)
+        stop = threading.Event()
+        producer = threading.Thread(target=self._produce, args=(path, source, rows_done, chunks, stop), name='import-parser', daemon=True)
+        producer.start()
+
+        connections = {}
+        imported = inserted = 0
+        start = last_report = time.perf_counter()
+        try:
+            while (chunk := chunks.get()) is not None:
+                if isinstance(chunk, Exception):
+                    raise chunk
+                rows_done += len(chunk)
+                inserted += self._write_chunk(connections, chunk, source, source_size, rows_done)
+                imported += len(chunk)
+
+                now = time.perf_counter()
+                if now - last_report >= self.report_every_s:
+                    logger.info('%s: %d rows imported (%.0f rows/s)', path, imported, imported / (now - start))
+                    last_report = now
+        finally:
+            stop.set()
+            for connection in connections.values():
+                _restore_journal_mode(connection)
+                connection.close()
+
+        elapsed = time.perf_counter() - start
+        logger.info('Imported %d rows from %s in %.1fs (%.0f rows/s), %d already stored', imported, path, elapsed, imported / elapsed if elapsed else 0, imported - inserted)
+        return inserted
+
+    def _produce(self, path: Path, source: str, skip: int, chunks: queue.Queue, stop: threading.Event):
+        """Parse a file into chunks of readings on the parser thread.
+
+        Args:
+            path (Path): The file to parse.
+            source (str): Resolved path of the file, from which missing reading ids are derived.
+            skip (int): Number of leading rows already imported.
+            chunks (queue.Queue): Queue receiving the chunks, then None or the error raised.
+            stop (threading.Event): Set when the writer gives up.
+        """
+        def put(item) -> bool:
+            while not stop.is_set():
+                try:
+                    chunks.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        try:
+            chunk = []
+            for index, row in enumerate(parse_file(path)):
+                if index < skip:
+                    continue
+                chunk.append(row if row[-1] else (*row[:-1], row_id(source, index)))
+                if len(chunk) == self.chunk_size:
+                    if not put(chunk):
+                        return
+                    chunk = []
+            if chunk and not put(chunk):
+                return
+            put(None)
+        except Exception as e:
+            put(e)
+
+    def _write_chunk(self, connections: dict, chunk: list[tuple], source: str, source_size: int, rows_done: int) -> int:
+        """Resolve and insert one chunk, then record the progress.
+
+        Args:
+            connections (dict): Open shard connections by shard index.
+            chunk (list[tuple]): The normalized readings.
+            source (str): Path of the imported file.
+            source_size (int): Size of the imported file.
+            rows_done (int): Rows of the file imported once this chunk is committed.
+
+        Returns:
+            int: The number of readings inserted.
+        """
+        self._resolve_catalog(chunk)
+
+        rows_by_shard = defaultdict(list)
+        for device_id, _, metric_type_name, _, _, unit_name, _, timestamp, value, utc_offset, reading_id in chunk:
+            device = self.devices[device_id]
+            rows_by_shard[self.storage.shard_for(device[0])].append({
+                'device': device,
+                'metric_type': self.metric_types[metric_type_name],
+                'unit': self.units[unit_name] if unit_name else None,
+                'timestamp': timestamp,
+                'value': value,
+                'reading_id': reading_id,
+                'utc_offset': utc_offset,
+            })
+
+        inserted = 0
+        for shard, rows in rows_by_shard.items():
+            if shard not in connections:
+                connections[shard] = _bulk_load_connection(self.storage.shard_engines[shard])
+            session = Session(bind=connections[shard])
+            try:
+                if self.storage.sharded:
+                    self._mirror(session, shard, rows)
+                # Same insert as the ingest endpoint, ignoring readings already stored
+                inserted += len(add_readings(session, rows))
+                if not self.storage.sharded:
+                    # Readings and progress share the database, so they commit together
+                    _save_progress(session, source, source_size, rows_done)
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+            finally:
+                session.close()
+
+        if self.storage.sharded:
+            catalog = self.storage.catalog_session()
+            try:
+                _save_progress(catalog, source, source_size, rows_done)
+                catalog.commit()
+            finally:
+                catalog.close()
+        return inserted
+
+    def _resolve_catalog(self, chunk: list[tuple]):
+        """Resolve the devices, metric types and units of a chunk not seen before.
+
+        Args:
+            chunk (list[tuple]): The normalized readings.
+        """
+        catalog = self.storage.catalog_session()
+        try:
+            for device_id, device_name, metric_type_name, min_value, max_value, unit_name, unit_symbol, *_ in chunk:
+                if device_id not in self.devices:
+                    self.devices[device_id] = resolve_device(catalog, DeviceDTO(id=device_id, name=device_name))
+                if metric_type_name not in self.metric_types:
+                    self.metric_types[metric_type_name] = resolve_metric_type(catalog, MetricTypeDTO(id=-1, name=metric_type_name, min_value=min_value, max_value=max_value))
+                if unit_name and unit_name not in self.units:
+                    self.units[unit_name] = resolve_unit(catalog, UnitDTO(id=-1, name=unit_name, symbol=unit_symbol))
+            catalog.commit()
+        except Exception:
+            catalog.rollback()
+            raise
+        finally:
+            catalog.close()
+
+    def _mirror(self, session: Session, shard: int, rows: list[dict]):
+        """Copy the catalog rows a shard has not received yet.
+
+        Args:
+            session (Session): The shard session.
+            shard (int): The shard index.
+            rows (list[dict]): The readings about to be inserted in the shard.
+        """
+        mirrored = self.mirrored[shard]
+        device_ids = {row['device'][0] for row in rows}
+        devices = {device for device in self.devices.values() if device[0] in device_ids} - mirrored
+        metric_types = set(self.metric_types.values()) - mirrored
+        units = set(self.units.values()) - mirrored
+        if devices or metric_types or units:
+            mirror_catalog(session, devices, metric_types, units)
+            mirrored.update(devices, metric_types, units)
+
+    def _load_progress(self, source: str, source_size: int) -> int:
+        """Return the number of rows of a file already imported.
+
+        Args:
+            source (str): Path of the file.
+            source_size (int): Size of the file.
+
+        Returns:
+            int: The number of imported rows.
+        """
+        catalog = self.storage.catalog_session()
+        try:
+            progress = catalog.query(ImportProgress).filter_by(source=source, source_size=source_size).first()
+            return progress.rows_done if progress else 0
+        finally:
+            catalog.close()
+
+def row_id(source: str, index: int) -> str:
+    """Derive the id of a file row that has none, the same on every run.
+
+    Args:
+        source (str): Resolved path of the file.
+        index (int): Position of the row in the file.
+
+    Returns:
+        str: The reading id.
+    """
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f'{source}#{index}'))
+
+def _save_progress(session: Session, source: str, source_size: int, rows_done: int):
+    """Record the number of rows of a file imported so far.
+
+    Args:
+        session (Session): Session of the database holding the progress.
+        source (str): Path of the file.
+        source_size (int): Size of the file.
+        rows_done (int): The number of imported rows.
+    """
+    progress = session.query(ImportProgress).filter_by(source=source, source_size=source_size).first()
+    if progress:
+        progress.rows_done = rows_done
+    else:
+        session.add(ImportProgress(source=source, source_size=source_size, rows_done=rows_done))
+
+def _bulk_load_connection(engine: Engine) -> Connection:
+    """Open a connection tuned for bulk loading.
+
+    Args:
+        engine (Engine): The engine to connect to.
+
+    Returns:
+        Connection: The connection.
+    """
+    connection = engine.connect()
+    if engine.dialect.name == 'sqlite':
+        connection.info['journal_mode'] = connection.exec_driver_sql('PRAGMA journal_mode').scalar()
+        for pragma in BULK_LOAD_PRAGMAS:
+            connection.exec_driver_sql(pragma)
+        connection.commit()
+    return connection
+
+def _restore_journal_mode(connection: Connection):
+    """Set back the journal mode a bulk load connection found.
+
+    Args:
+        connection (Connection): The connection opened by ``_bulk_load_connection``.
+    """
+    journal_mode = connection.info.pop('journal_mode', None)
+    if journal_mode is None:
+        return
+    try:
+        connection.exec_driver_sql(f'PRAGMA journal_mode={journal_mode}')
+        connection.commit()
+    except Exception as e:
+        logger.warning('Could not restore journal_mode=%s: %s', journal_mode, e)
@@ -0,0 +1,127 @@
+"""Compare module. Aligns several series on a common time grid for side by side display."""
+
+from collections import defaultdict
+from datetime import datetime
+import numpy as np
+from sqlalchemy import select
+
+from .models import MetricReading
+from .storage import Storage
+
+FILL_LAST = 'last'
+FILL_MEAN = 'mean'
+
+def query_series(storage: Storage, device_ids: list, metric_type_ids: list, start: datetime, end: datetime) -> dict[tuple, tuple]:
+    """Read the timestamps and values of several series over a time range.
+
+    Args:
+        storage (Storage): The storage to read from.
+        device_ids (list): The devices to read.
+        metric_type_ids (list): The metric types to read.
+        start (datetime): Start of the range.
+        end (datetime): End of the range.
+
+    Returns:
+        dict[tuple, tuple]: Epoch seconds and values arrays, sorted by time, by (device id, metric type id).
+    """
+    statement = (
+        select(MetricReading.device_id, MetricReading.metric_type_id, MetricReading.timestamp, MetricReading.value)
+        .where(MetricReading.device_id.in_(device_ids))
+        .where(MetricReading.metric_type_id.in_(metric_type_ids))
+        .where(MetricReading.timestamp >= start)
+        .where(MetricReading.timestamp <= end)
+        .order_by(MetricReading.timestamp)
+    )
+    shards = {storage.shard_for(device_id) for device_id in device_ids}
+    rows_by_series = defaultdict(list)
+    for shard in shards:
+        session = storage.shard_session(shard)
+        try:
+            for device_id, metric_type_id, timestamp, value in session.execute(statement):
+                rows_by_series[(device_id, metric_type_id)].append((timestamp, value))
+        finally:
+            session.close()
+
+    series = {}
+    for key, rows in rows_by_series.items():
+        timestamps, values = zip(*rows)
+        epoch_s = np.array(timestamps, dtype='datetime64[ms]').astype(np.int64) / 1000.0
+        series[key] = epoch_s, np.array(values, dtype=np.float64)
+    return series
+
+def time_grid(start: datetime, end: datetime, points: int) -> np.ndarray:
+    """Build evenly spaced grid points over a time range.
+
+    Args:
+        start (datetime): Start of the range.
+        end (datetime): End of the range.
+        points (int): Number of grid points.
+
+    Returns:
+        np.ndarray: Epoch seconds of the grid points, each the end of one bucket.
+    """
+    start_s = np.datetime64(start, 'ms').astype(np.int64) / 1000.0
+    end_s = np.datetime64(end, 'ms').astype(np.int64) / 1000.0
+    return np.linspace(start_s, end_s, points + 1)[1:]
+
+def resample(timestamps: np.ndarray, values: np.ndarray, grid: np.ndarray, fill: str = FILL_LAST) -> np.ndarray:
+    """Resample one series onto a time grid.
+
+    With ``last`` each grid point takes the latest value at or before it; with
+    ``mean`` it takes the mean of the values in the bucket ending at it. Grid
+    points without data are NaN.
+
+    Args:
+        timestamps (np.ndarray): Sorted epoch seconds of the readings.
+        values (np.ndarray): Values of the readings.
+        grid (np.ndarray): Epoch seconds of the grid points, as built by ``time_grid``.
+        fill (str): ``last`` or ``mean``.
+
+    Returns:
+        np.ndarray: One value per grid point.
+    """
+    # Bucket i holds the readings after grid[i - 1] up to grid[i]
+    buckets = np.searchsorted(grid, timestamps, side='left')
+    if fill == FILL_MEAN:
+        inside = buckets < len(grid)
+        sums = np.bincount(buckets[inside], weights=values[inside], minlength=len(grid))
+        counts = np.bincount(buckets[inside], minlength=len(grid))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(counts > 0, sums / counts, np.nan)
+
+    latest = np.searchsorted(timestamps, grid, side='right') - 1
+    result = values[np.maximum(latest, 0)]
+    return np.where(latest >= 0, result, np.nan)
+
+def align_series(series: dict[tuple, tuple], start: datetime, end: datetime, point_budget: int, fill: str = FILL_LAST) -> tuple[np.ndarray, dict[tuple, np.ndarray]]:
+    """Resample several series onto one grid sized to a total point budget.
+
+    Args:
+        series (dict[tuple, tuple]): Epoch seconds and values arrays by series key.
+        start (datetime): Start of the range.
+        end (datetime): End of the range.
+        point_budget (int): Maximum number of points returned over all series.
+        fill (str): ``last`` or ``mean``.
+
+    Returns:
+        tuple[np.ndarray, dict[tuple, np.ndarray]]: The grid and the resampled values by series key.
+    """
+    points = max(2, point_budget // max(1, len(series)))
+    grid = time_grid(start, end, points)
+    return grid, {key: resample(timestamps, values, grid, fill) for key, (timestamps, values) in series.items()}
+
+def correlation(aligned: dict[tuple, np.ndarray]) -> np.ndarray:
+    """Compute the correlation matrix of aligned series over the grid points they all cover.
+
+    Args:
+        aligned (dict[tuple, np.ndarray]): Resampled values by series key.
+
+    Returns:
+        np.ndarray: The Pearson correlation matrix, in the order of ``aligned``.
+    """
+    matrix = np.vstack(list(aligned.values()))
+    matrix = matrix[:, ~np.isnan(matrix).any(axis=0)]
+    if matrix.shape[1] < 2:
+        return np.full((len(aligned), len(aligned)), np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.atleast_2d(np.corrcoef(matrix))
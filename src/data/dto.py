@@ -1,8 +1,10 @@
 from dataclasses import dataclass, asdict
-from typing import Optional
+from typing import Optional, Union
 import uuid
 from datetime import datetime
 
+from timestamps import to_wire
+
 def serialize_with_uuid(obj):
     """Custom serialization function to handle UUID and datetime objects.
 
@@ -16,7 +18,7 @@ def serialize_with_uuid(obj):
         if isinstance(value, uuid.UUID):
             return str(value)
         if isinstance(value, datetime):
-            return value.strftime('%Y-%m-%d %H:%M:%S')
+            return to_wire(value)
         if isinstance(value, list):
             return [convert(v) for v in value]
         if isinstance(value, dict):
@@ -73,10 +75,23 @@ class UnitDTO:
         return serialize_with_uuid(self)
 
 
+def reading_id(device_id, metric_type: str, timestamp: datetime) -> uuid.UUID:
+    """Derive the stable id of a reading, so resending it can be recognised.
+
+    Args:
+        device_id: The device id.
+        metric_type (str): The metric type name.
+        timestamp (datetime): Time of the measurement.
+
+    Returns:
+        uuid.UUID: The reading id.
+    """
+    return uuid.uuid5(uuid.NAMESPACE_OID, f"{device_id}/{metric_type}/{timestamp.isoformat()}")
+
 @dataclass
 class MetricReadingDTO:
     """Data Transfer Object for MetricReading."""
-    id: int
+    id: Union[int, uuid.UUID]
     device: DeviceDTO
     metric_type: MetricTypeDTO
     timestamp: datetime
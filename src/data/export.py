@@ -0,0 +1,129 @@
+"""Export module. Streams readings out of the database in constant memory."""
+
+import csv
+from datetime import datetime
+import heapq
+import io
+import json
+from typing import Iterable, Iterator
+import zlib
+from sqlalchemy import select
+
+from .models import Device, MetricReading, MetricType, Unit
+from .storage import Storage
+
+# Rows fetched from the database cursor at a time
+CHUNK_SIZE = 1000
+
+# The reading id is exported as ``id``, the key collectors send it under, so imports skip readings already stored
+EXPORT_COLUMNS = ('device_id', 'device', 'metric_type', 'timestamp', 'value', 'unit', 'utc_offset', 'id')
+
+def export_rows(storage: Storage, device_id=None, metric_type_id=None, start: datetime | None = None, end: datetime | None = None) -> Iterator[tuple]:
+    """Stream readings ordered by timestamp.
+
+    Each shard is read through a server-side cursor in chunks; the shards are
+    merged lazily, so memory use does not grow with the number of rows.
+
+    Args:
+        storage (Storage): The storage to read from.
+        device_id: Only export this device, all devices if None.
+        metric_type_id: Only export this metric type, all metric types if None.
+        start (datetime | None): Only export readings at or after this time.
+        end (datetime | None): Only export readings before this time.
+
+    Returns:
+        Iterator[tuple]: Rows with the values of ``EXPORT_COLUMNS``.
+    """
+    statement = (
+        select(MetricReading.device_id, Device.name, MetricType.name, MetricReading.timestamp, MetricReading.value, Unit.name, MetricReading.utc_offset, MetricReading.reading_id)
+        .join(Device, MetricReading.device_id == Device.id)
+        .join(MetricType, MetricReading.metric_type_id == MetricType.id)
+        .outerjoin(Unit, MetricReading.unit_id == Unit.id)
+        .order_by(MetricReading.timestamp)
+        .execution_options(stream_results=True, yield_per=CHUNK_SIZE)
+    )
+    if device_id:
+        statement = statement.where(MetricReading.device_id == device_id)
+    if metric_type_id:
+        statement = statement.where(MetricReading.metric_type_id == metric_type_id)
+    if start:
+        statement = statement.where(MetricReading.timestamp >= start)
+    if end:
+        statement = statement.where(MetricReading.timestamp < end)
+
+    def stream(shard: int) -> Iterator[tuple]:
+        session = storage.shard_session(shard)
+        try:
+            for row in session.execute(statement):
+                yield tuple(row)
+        finally:
+            session.close()
+
+    if device_id:
+        return stream(storage.shard_for(device_id))
+    return heapq.merge(*(stream(shard) for shard in range(len(storage.shard_engines))), key=lambda row: row[3])
+
+def to_csv(rows: Iterable[tuple]) -> Iterator[str]:
+    """Format rows as CSV, one chunk of rows at a time.
+
+    Args:
+        rows (Iterable[tuple]): Rows with the values of ``EXPORT_COLUMNS``.
+
+    Returns:
+        Iterator[str]: CSV text chunks, starting with the header.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for index, row in enumerate(rows, 1):
+        writer.writerow(_format_row(row))
+        if index % CHUNK_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def to_ndjson(rows: Iterable[tuple]) -> Iterator[str]:
+    """Format rows as newline delimited JSON, one chunk of rows at a time.
+
+    Args:
+        rows (Iterable[tuple]): Rows with the values of ``EXPORT_COLUMNS``.
+
+    Returns:
+        Iterator[str]: NDJSON text chunks.
+    """
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(EXPORT_COLUMNS, _format_row(row)))))
+        if len(lines) == CHUNK_SIZE:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+def gzip_chunks(chunks: Iterable[str]) -> Iterator[bytes]:
+    """Compress text chunks into a gzip stream as they are produced.
+
+    Args:
+        chunks (Iterable[str]): The text chunks.
+
+    Returns:
+        Iterator[bytes]: The gzip stream.
+    """
+    compressor = zlib.compressobj(wbits=31)  # 31 selects the gzip container
+    for chunk in chunks:
+        if (data := compressor.compress(chunk.encode())):
+            yield data
+    yield compressor.flush()
+
+def _format_row(row: tuple) -> tuple:
+    """Convert the values of a row to serialisable types.
+
+    Args:
+        row (tuple): Row with the values of ``EXPORT_COLUMNS``.
+
+    Returns:
+        tuple: The row with its timestamp as an ISO string.
+    """
+    device_id, device, metric_type, timestamp, value, unit, utc_offset, reading_id = row
+    return device_id, device, metric_type, timestamp.isoformat() if timestamp else '', value, unit or '', utc_offset, reading_id or ''
@@ -0,0 +1,252 @@
+"""Host metrics module. Declares host metrics as extractors over one shared psutil snapshot."""
+from dataclasses import dataclass
+import datetime
+from fnmatch import fnmatch
+from functools import cached_property
+import logging
+import os
+import re
+import time
+from typing import Callable, Iterable
+import psutil
+
+from .dto import DeviceDTO, MetricReadingDTO, MetricTypeDTO, UnitDTO
+from .metric import Metric
+
+logger = logging.getLogger(__name__)
+
+PERCENT = UnitDTO(id=-1, name='Percent', symbol='%')
+SECONDS = UnitDTO(id=-1, name='Seconds', symbol='s')
+BYTES = UnitDTO(id=-1, name='Bytes', symbol='B')
+COUNT = UnitDTO(id=-1, name='Count', symbol='#')
+
+class HostSnapshot:
+    """Host state taken at one instant.
+
+    Every psutil source is read at most once, the first time an extractor
+    needs it, so all the metrics of a tick share the same few system calls.
+    """
+
+    def __init__(self):
+        """Initialize the HostSnapshot."""
+        self.timestamp = datetime.datetime.now()
+
+    @cached_property
+    def virtual_memory(self):
+        """System memory usage."""
+        return psutil.virtual_memory()
+
+    @cached_property
+    def swap_memory(self):
+        """System swap usage."""
+        return psutil.swap_memory()
+
+    @cached_property
+    def cpu_times(self):
+        """System-wide CPU times."""
+        return psutil.cpu_times()
+
+    @cached_property
+    def cpu_times_percpu(self):
+        """CPU times of every logical core."""
+        return psutil.cpu_times(percpu=True)
+
+    @cached_property
+    def cpu_percent_percpu(self):
+        """Utilisation of every logical core since the previous snapshot."""
+        return psutil.cpu_percent(percpu=True)
+
+    @cached_property
+    def cpu_stats(self):
+        """Context switch and interrupt counters."""
+        return psutil.cpu_stats()
+
+    @cached_property
+    def load_average(self):
+        """1, 5 and 15 minute load averages."""
+        return psutil.getloadavg()
+
+    @cached_property
+    def net_io(self):
+        """System-wide network counters."""
+        return psutil.net_io_counters()
+
+    @cached_property
+    def net_io_pernic(self):
+        """Network counters of every interface."""
+        return psutil.net_io_counters(pernic=True)
+
+    @cached_property
+    def disk_io_perdisk(self):
+        """I/O counters of every disk."""
+        return psutil.disk_io_counters(perdisk=True) or {}
+
+    @cached_property
+    def disk_usage(self):
+        """Usage of the root filesystem."""
+        return psutil.disk_usage(os.path.abspath(os.sep))
+
+    @cached_property
+    def process_count(self):
+        """Number of running processes."""
+        return len(psutil.pids())
+
+    @cached_property
+    def boot_time(self):
+        """System boot time as a UNIX timestamp."""
+        return psutil.boot_time()
+
+    @cached_property
+    def process(self) -> dict:
+        """Resource usage of the collector process, read in one oneshot block."""
+        process = psutil.Process()
+        with process.oneshot():
+            cpu_times = process.cpu_times()
+            return {
+                'rss': process.memory_info().rss,
+                'cpu_time': cpu_times.user + cpu_times.system,
+                'threads': process.num_threads(),
+            }
+
+@dataclass(frozen=True)
+class MetricDefinition:
+    """Declaration of a single host metric."""
+    name: str
+    unit: UnitDTO
+    min_value: float | None
+    max_value: float | None
+    extract: Callable[[HostSnapshot], float]
+
+@dataclass(frozen=True)
+class MetricFamily:
+    """Declaration of a host metric repeated for every core, interface or disk."""
+    prefix: str
+    unit: UnitDTO
+    min_value: float | None
+    max_value: float | None
+    keys: Callable[[HostSnapshot], Iterable]
+    extract: Callable[[HostSnapshot, object], float]
+
+    def expand(self, snapshot: HostSnapshot) -> list[MetricDefinition]:
+        """Create one definition per key present on this host.
+
+        Args:
+            snapshot (HostSnapshot): Snapshot used to discover the keys.
+
+        Returns:
+            list[MetricDefinition]: The definitions of the family members.
+        """
+        return [
+            MetricDefinition(
+                name=f"{self.prefix}_{re.sub(r'[^A-Za-z0-9]+', '_', str(key)).strip('_')}",
+                unit=self.unit,
+                min_value=self.min_value,
+                max_value=self.max_value,
+                extract=lambda snapshot, key=key: self.extract(snapshot, key),
+            )
+            for key in self.keys(snapshot)
+        ]
+
+HOST_METRICS: list[MetricDefinition] = [
+    MetricDefinition('RAMUsage', PERCENT, 0, 100, lambda s: s.virtual_memory.percent),
+    MetricDefinition('RAMAvailable', BYTES, 0, None, lambda s: s.virtual_memory.available),
+    MetricDefinition('RAMUsed', BYTES, 0, None, lambda s: s.virtual_memory.used),
+    MetricDefinition('SwapUsage', PERCENT, 0, 100, lambda s: s.swap_memory.percent),
+    MetricDefinition('SwapUsed', BYTES, 0, None, lambda s: s.swap_memory.used),
+    MetricDefinition('CPUTimes', SECONDS, 0, 90000, lambda s: s.cpu_times.user),
+    MetricDefinition('CPUSystemTimes', SECONDS, 0, 90000, lambda s: s.cpu_times.system),
+    MetricDefinition('CPUIdleTimes', SECONDS, 0, None, lambda s: s.cpu_times.idle),
+    MetricDefinition('CPUContextSwitches', COUNT, 0, None, lambda s: s.cpu_stats.ctx_switches),
+    MetricDefinition('CPUInterrupts', COUNT, 0, None, lambda s: s.cpu_stats.interrupts),
+    MetricDefinition('LoadAverage1m', COUNT, 0, None, lambda s: s.load_average[0]),
+    MetricDefinition('LoadAverage5m', COUNT, 0, None, lambda s: s.load_average[1]),
+    MetricDefinition('LoadAverage15m', COUNT, 0, None, lambda s: s.load_average[2]),
+    MetricDefinition('NetworkSend', BYTES, 0, 1000000000, lambda s: s.net_io.bytes_sent),
+    MetricDefinition('NetworkReceive', BYTES, 0, None, lambda s: s.net_io.bytes_recv),
+    MetricDefinition('NetworkPacketsSent', COUNT, 0, None, lambda s: s.net_io.packets_sent),
+    MetricDefinition('NetworkPacketsReceived', COUNT, 0, None, lambda s: s.net_io.packets_recv),
+    MetricDefinition('DiskUsage', PERCENT, 0, 100, lambda s: s.disk_usage.percent),
+    MetricDefinition('DiskFree', BYTES, 0, None, lambda s: s.disk_usage.free),
+    MetricDefinition('ProcessCount', COUNT, 0, None, lambda s: s.process_count),
+    MetricDefinition('Uptime', SECONDS, 0, None, lambda s: time.time() - s.boot_time),
+    MetricDefinition('CollectorRSS', BYTES, 0, None, lambda s: s.process['rss']),
+    MetricDefinition('CollectorCPUTime', SECONDS, 0, None, lambda s: s.process['cpu_time']),
+    MetricDefinition('CollectorThreads', COUNT, 0, None, lambda s: s.process['threads']),
+]
+
+HOST_METRIC_FAMILIES: list[MetricFamily] = [
+    MetricFamily('CPUCoreUsage', PERCENT, 0, 100, lambda s: range(len(s.cpu_percent_percpu)), lambda s, core: s.cpu_percent_percpu[core]),
+    MetricFamily('CPUCoreUserTimes', SECONDS, 0, None, lambda s: range(len(s.cpu_times_percpu)), lambda s, core: s.cpu_times_percpu[core].user),
+    MetricFamily('CPUCoreSystemTimes', SECONDS, 0, None, lambda s: range(len(s.cpu_times_percpu)), lambda s, core: s.cpu_times_percpu[core].system),
+    MetricFamily('NICSend', BYTES, 0, None, lambda s: s.net_io_pernic, lambda s, nic: s.net_io_pernic[nic].bytes_sent),
+    MetricFamily('NICReceive', BYTES, 0, None, lambda s: s.net_io_pernic, lambda s, nic: s.net_io_pernic[nic].bytes_recv),
+    MetricFamily('NICPacketsSent', COUNT, 0, None, lambda s: s.net_io_pernic, lambda s, nic: s.net_io_pernic[nic].packets_sent),
+    MetricFamily('NICPacketsReceived', COUNT, 0, None, lambda s: s.net_io_pernic, lambda s, nic: s.net_io_pernic[nic].packets_recv),
+    MetricFamily('NICErrorsIn', COUNT, 0, None, lambda s: s.net_io_pernic, lambda s, nic: s.net_io_pernic[nic].errin),
+    MetricFamily('NICErrorsOut', COUNT, 0, None, lambda s: s.net_io_pernic, lambda s, nic: s.net_io_pernic[nic].errout),
+    MetricFamily('DiskReadBytes', BYTES, 0, None, lambda s: s.disk_io_perdisk, lambda s, disk: s.disk_io_perdisk[disk].read_bytes),
+    MetricFamily('DiskWriteBytes', BYTES, 0, None, lambda s: s.disk_io_perdisk, lambda s, disk: s.disk_io_perdisk[disk].write_bytes),
+    MetricFamily('DiskReadCount', COUNT, 0, None, lambda s: s.disk_io_perdisk, lambda s, disk: s.disk_io_perdisk[disk].read_count),
+    MetricFamily('DiskWriteCount', COUNT, 0, None, lambda s: s.disk_io_perdisk, lambda s, disk: s.disk_io_perdisk[disk].write_count),
+]
+
+class SnapshotMetric(Metric):
+    """Metric reading its value from a shared host snapshot."""
+
+    def __init__(self, definition: MetricDefinition):
+        """Initialize the SnapshotMetric class.
+
+        Args:
+            definition (MetricDefinition): The declaration of the metric.
+        """
+        super().__init__()
+        self.definition = definition
+        self.UNIT_DTO = definition.unit
+        self.metric_type = MetricTypeDTO(id=-1, name=definition.name, min_value=definition.min_value, max_value=definition.max_value)
+
+    def get_metric_type(self):
+        """Return the metric type.
+
+        Returns:
+            str: The metric type.
+        """
+        return self.definition.name
+
+    def measure(self, device: DeviceDTO, snapshot: HostSnapshot | None = None) -> MetricReadingDTO | None:
+        """Measure the metric from a host snapshot.
+
+        Args:
+            device (DeviceDTO): The device to measure the metric for.
+            snapshot (HostSnapshot | None): The snapshot of the current tick, a new one if None.
+
+        Returns:
+            MetricReadingDTO | None: The measured reading, or None if unavailable on this host.
+        """
+        snapshot = snapshot or HostSnapshot()
+        try:
+            value = float(self.definition.extract(snapshot))
+        except (psutil.Error, OSError, AttributeError, KeyError, IndexError) as e:
+            logger.debug('%s is unavailable: %s', self.definition.name, e)
+            return None
+        return self.build_reading(device, value, snapshot.timestamp)
+
+def host_metrics(patterns: list[str]) -> list[SnapshotMetric]:
+    """Create the host metrics whose names match any of the patterns.
+
+    Args:
+        patterns (list[str]): Shell-style patterns, such as ``RAM*`` or ``*``.
+
+    Returns:
+        list[SnapshotMetric]: The matching metrics.
+    """
+    snapshot = HostSnapshot()
+    definitions = list(HOST_METRICS)
+    for family in HOST_METRIC_FAMILIES:
+        try:
+            definitions.extend(family.expand(snapshot))
+        except (psutil.Error, OSError, AttributeError) as e:
+            logger.warning('Skipping %s metrics: %s', family.prefix, e)
+    return [
+        SnapshotMetric(definition) for definition in definitions
+        if any(fnmatch(definition.name, pattern) for pattern in patterns)
+    ]
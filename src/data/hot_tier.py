@@ -0,0 +1,239 @@
+"""Hot tier module. Keeps the most recent readings of every series in memory."""
+
+from array import array
+import bisect
+from collections import namedtuple
+from datetime import datetime
+import heapq
+import logging
+import threading
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from .models import Device, MetricReading, MetricType, Unit
+from .storage import Storage
+
+logger = logging.getLogger(__name__)
+
+# One reading as rendered by the dashboard
+RecentReading = namedtuple('RecentReading', 'timestamp value device_name metric_type_name min_value max_value unit_name unit_symbol')
+
+class HotSeries:
+    """Fixed-capacity ring buffer of the newest readings of one series, with its lifetime sum and count."""
+    __slots__ = ('timestamps', 'values', 'start', 'size', 'device', 'metric_type', 'unit', 'total', 'count')
+
+    def __init__(self, capacity: int, device: tuple, metric_type: tuple, unit: tuple | None):
+        """Initialize an empty HotSeries.
+
+        Args:
+            capacity (int): Number of readings kept.
+            device (tuple): The device id and name.
+            metric_type (tuple): The metric type id, name, min value and max value.
+            unit (tuple | None): The unit id, name and symbol.
+        """
+        self.timestamps = array('d', bytes(8 * capacity))
+        self.values = array('d', bytes(8 * capacity))
+        self.start = 0
+        self.size = 0
+        self.device = device
+        self.metric_type = metric_type
+        self.unit = unit
+        self.total = 0.0
+        self.count = 0
+
+    def append(self, timestamp: float, value: float):
+        """Add a reading, evicting the oldest one when full.
+
+        Readings arriving out of order are inserted at their place, which
+        costs a copy of the buffer; readings older than a full buffer are dropped.
+
+        Args:
+            timestamp (float): Epoch seconds of the reading.
+            value (float): The reading value.
+        """
+        capacity = len(self.values)
+        newest = (self.start + self.size - 1) % capacity
+        if self.size and timestamp < self.timestamps[newest]:
+            readings = self.newest(self.size)[::-1]
+            if self.size == capacity and timestamp < readings[0][0]:
+                return
+            readings.insert(bisect.bisect_right(readings, timestamp, key=lambda reading: reading[0]), (timestamp, value))
+            self.start, self.size = 0, 0
+            for reading in readings[-capacity:]:
+                self.append(*reading)
+            return
+
+        end = (self.start + self.size) % capacity
+        self.timestamps[end] = timestamp
+        self.values[end] = value
+        if self.size < capacity:
+            self.size += 1
+        else:
+            self.start = (self.start + 1) % capacity
+
+    def newest(self, n: int) -> list[tuple]:
+        """Return the newest readings, newest first.
+
+        Args:
+            n (int): Maximum number of readings.
+
+        Returns:
+            list[tuple]: (epoch seconds, value) pairs.
+        """
+        capacity = len(self.values)
+        end = self.start + self.size
+        return [
+            (self.timestamps[index % capacity], self.values[index % capacity])
+            for index in range(end - 1, end - 1 - min(n, self.size), -1)
+        ]
+
+class HotTier:
+    """Class serving the recent readings of every series from memory.
+
+    The tier is filled by the ingestor and rebuilt from the database on
+    startup. It only sees the readings stored by its own process, so it must
+    not be used when several worker processes share the database.
+    """
+
+    def __init__(self, capacity: int):
+        """Initialize the HotTier class.
+
+        Args:
+            capacity (int): Number of readings kept per series.
+        """
+        self.capacity = capacity
+        self.series: dict[tuple, HotSeries] = {}
+        self._lock = threading.Lock()
+
+    def add(self, readings: list[dict]):
+        """Add stored readings to their series.
+
+        Args:
+            readings (list[dict]): Resolved readings, as built by ``MetricsIngestor``.
+        """
+        with self._lock:
+            for reading in readings:
+                series = self._series(reading['device'], reading['metric_type'], reading['unit'])
+                series.append(reading['timestamp'] / 1000, reading['value'])
+                series.total += reading['value']
+                series.count += 1
+
+    def load(self, storage: Storage):
+        """Rebuild the tier from the newest readings and the totals of every series in the database.
+
+        Args:
+            storage (Storage): The storage to read from.
+        """
+        loaded = storage.fan_out(lambda session: _load_shard(session, self.capacity))
+        with self._lock:
+            self.series = {}
+            for totals, rows in loaded:
+                for device, metric_type, total, count in totals:
+                    series = self._series(device, metric_type, None)
+                    series.total, series.count = total or 0.0, count
+                for device_id, metric_type_id, timestamp, value, unit in rows:
+                    series = self.series.get((device_id, metric_type_id))
+                    if series is None:
+                        # Reading of a device or metric type missing from the catalog
+                        continue
+                    series.append(timestamp.timestamp(), value)
+                    series.unit = unit or series.unit
+        logger.info('Hot tier loaded with %d series', len(self.series))
+
+    def recent(self, device_id, metric_type_id: int, n: int | None = None) -> dict:
+        """Return the newest readings of a metric type, for one device or all of them.
+
+        Args:
+            device_id: The device, or None for all devices.
+            metric_type_id (int): The metric type.
+            n (int | None): Maximum number of readings, all those kept if None.
+
+        Returns:
+            dict: The readings newest first, with the sum and count of all stored values,
+                ``complete`` telling whether every stored reading is kept in memory and
+                ``warm`` whether every series holds its newest readings up to its capacity.
+        """
+        with self._lock:
+            if device_id:
+                series_list = [self.series[key] for key in [(device_id, metric_type_id)] if key in self.series]
+            else:
+                series_list = [series for (_, key_metric_type_id), series in self.series.items() if key_metric_type_id == metric_type_id]
+            newest = [(series, series.newest(n if n is not None else series.size)) for series in series_list]
+            total = sum(series.total for series in series_list)
+            count = sum(series.count for series in series_list)
+            complete = all(series.size == series.count for series in series_list)
+            warm = all(series.size == min(series.count, self.capacity) for series in series_list)
+
+        readings = heapq.merge(
+            *([(timestamp, value, series) for timestamp, value in readings] for series, readings in newest),
+            key=lambda reading: reading[0], reverse=True
+        )
+        recent = []
+        for timestamp, value, series in readings:
+            if len(recent) == n:
+                break
+            _, metric_type_name, min_value, max_value = series.metric_type
+            unit_name, unit_symbol = (series.unit[1], series.unit[2]) if series.unit else (None, None)
+            recent.append(RecentReading(datetime.fromtimestamp(timestamp), value, series.device[1], metric_type_name, min_value, max_value, unit_name, unit_symbol))
+        return {'readings': recent, 'sum': total, 'count': count, 'complete': complete, 'warm': warm}
+
+    def _series(self, device: tuple, metric_type: tuple, unit: tuple | None) -> HotSeries:
+        """Return the series of a device and metric type, creating it on first use.
+
+        Args:
+            device (tuple): The device id and name.
+            metric_type (tuple): The metric type id, name, min value and max value.
+            unit (tuple | None): The unit id, name and symbol of the newest reading.
+
+        Returns:
+            HotSeries: The series.
+        """
+        key = (device[0], metric_type[0])
+        series = self.series.get(key)
+        if series is None:
+            self.series[key] = series = HotSeries(self.capacity, device, metric_type, unit)
+        elif unit:
+            series.unit = unit
+        return series
+
+def _load_shard(session: Session, capacity: int) -> tuple[list, list]:
+    """Read the totals and newest readings of every series in one database.
+
+    Args:
+        session (Session): The database session.
+        capacity (int): Number of readings read per series.
+
+    Returns:
+        tuple[list, list]: Series totals as (device, metric type, sum, count) and
+            readings as (device id, metric type id, timestamp, value, unit), oldest first.
+    """
+    totals = session.execute(
+        select(
+            Device.id, Device.name, MetricType.id, MetricType.name, MetricType.min_value, MetricType.max_value,
+            func.sum(MetricReading.value), func.count(MetricReading.id)
+        )
+        .join(Device, MetricReading.device_id == Device.id)
+        .join(MetricType, MetricReading.metric_type_id == MetricType.id)
+        .group_by(Device.id, MetricType.id)
+    ).all()
+    units = {unit.id: (unit.id, unit.name, unit.symbol) for unit in session.query(Unit)}
+
+    ranked = select(
+        MetricReading.device_id, MetricReading.metric_type_id, MetricReading.timestamp, MetricReading.value, MetricReading.unit_id,
+        func.row_number().over(
+            partition_by=(MetricReading.device_id, MetricReading.metric_type_id),
+            order_by=MetricReading.timestamp.desc()
+        ).label('rank')
+    ).subquery()
+    rows = session.execute(
+        select(ranked.c.device_id, ranked.c.metric_type_id, ranked.c.timestamp, ranked.c.value, ranked.c.unit_id)
+        .where(ranked.c.rank <= capacity)
+        .order_by(ranked.c.timestamp)
+    ).all()
+    return [
+        ((device_id, device_name), (metric_type_id, metric_type_name, min_value, max_value), total, count)
+        for device_id, device_name, metric_type_id, metric_type_name, min_value, max_value, total, count in totals
+    ], [
+        (device_id, metric_type_id, timestamp, value, units.get(unit_id))
+        for device_id, metric_type_id, timestamp, value, unit_id in rows
+    ]
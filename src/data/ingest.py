@@ -0,0 +1,340 @@
+"""Ingest module. Stores batches of serialized metric readings."""
+
+from collections import defaultdict
+import logging
+import math
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from block_timer import BlockTimer
+from config import config
+from stats_registry import stats
+from timestamps import parse_ms
+
+from .alerts import AlertEvaluator
+from .dto import DeviceDTO, MetricTypeDTO, UnitDTO
+from .hot_tier import HotTier
+from .models import AlertEvent, Device, MetricReading, MetricType, Unit
+from .sketch import update_sketches
+from .storage import Storage
+
+logger = logging.getLogger(__name__)
+
+# Reading ids looked up per query when checking for duplicates
+PROBE_CHUNK_SIZE = 500
+
+class InvalidReadingError(ValueError):
+    """Raised for a reading that cannot be stored, before anything is written."""
+
+    def __init__(self, index: int, reason: str):
+        """Initialize the InvalidReadingError.
+
+        Args:
+            index (int): Position of the reading in its batch.
+            reason (str): What is wrong with the reading.
+        """
+        super().__init__(f'Reading {index}: {reason}')
+        self.index = index
+        self.reason = reason
+
+class MetricsIngestor:
+    """Class resolving and storing incoming metric readings."""
+
+    def __init__(self, storage: Storage, evaluator: AlertEvaluator | None = None, hot_tier: HotTier | None = None):
+        """Initialize the MetricsIngestor class.
+
+        Args:
+            storage (Storage): The storage to write to.
+            evaluator (AlertEvaluator | None): Evaluates the stored readings for alerts, if given.
+            hot_tier (HotTier | None): Receives the stored readings, if given.
+        """
+        self.storage = storage
+        self.evaluator = evaluator
+        self.hot_tier = hot_tier
+
+    def store(self, metrics_data: list[dict]) -> int:
+        """Store a batch of serialized metric readings.
+
+        Devices, metric types and units are resolved once per batch in the
+        catalog, then the readings are written shard by shard. Once stored,
+        the readings are evaluated for alerts. Readings whose id is already
+        stored are skipped, so resending a batch is harmless.
+
+        Args:
+            metrics_data (list[dict]): The serialized readings.
+
+        Returns:
+            int: The number of readings stored, not counting duplicates.
+
+        Raises:
+            InvalidReadingError: If a reading is malformed; nothing is stored then.
+        """
+        timestamps = [_validate(index, data) for index, data in enumerate(metrics_data)]
+        catalog = self.storage.catalog_session()
+        try:
+            devices: dict[str, tuple] = {}
+            metric_types: dict[str, tuple] = {}
+            units: dict[str, tuple] = {}
+            readings_by_shard: dict[int, list[dict]] = defaultdict(list)
+
+            for data, timestamp in zip(metrics_data, timestamps):
+                # Map incoming data into DTOs
+                device_dto = DeviceDTO(id=data['device']['id'], name=data['device']['name'])
+                metric_type_dto = MetricTypeDTO(id=data['metric_type']['id'], name=data['metric_type']['name'], min_value=data['metric_type'].get('min_value'), max_value=data['metric_type'].get('max_value'))
+                unit_dto = UnitDTO(id=data['unit']['id'], name=data['unit']['name'], symbol=data['unit'].get('symbol')) if data.get('unit') else None
+
+                device = devices.get(device_dto.id) or resolve_device(catalog, device_dto)
+                devices[device_dto.id] = device
+                metric_type = metric_types.get(metric_type_dto.name) or resolve_metric_type(catalog, metric_type_dto)
+                metric_types[metric_type_dto.name] = metric_type
+                unit = None
+                if unit_dto:
+                    unit = units.get(unit_dto.name) or resolve_unit(catalog, unit_dto)
+                    units[unit_dto.name] = unit
+
+                # Create MetricReading values using DTO data
+                readings_by_shard[self.storage.shard_for(device[0])].append({
+                    'device': device,
+                    'metric_type': metric_type,
+                    'unit': unit,
+                    'timestamp': timestamp,
+                    'value': data['value'],
+                    'reading_id': data['id'] if isinstance(data.get('id'), str) else None,
+                })
+
+            if not self.storage.sharded:
+                # Catalog and readings share one database and one transaction
+                readings_by_shard[0] = add_readings(catalog, readings_by_shard[0])
+            catalog.commit()
+        except Exception:
+            catalog.rollback()
+            raise
+        finally:
+            catalog.close()
+
+        if self.storage.sharded:
+            self._store_shards(readings_by_shard)
+        if self.hot_tier:
+            for readings in readings_by_shard.values():
+                self.hot_tier.add(readings)
+        if self.evaluator:
+            self._evaluate(readings_by_shard)
+        return sum(len(readings) for readings in readings_by_shard.values())
+
+    def _store_shards(self, readings_by_shard: dict[int, list[dict]]):
+        """Write resolved readings to their shards, keeping only the inserted ones in the dict.
+
+        Args:
+            readings_by_shard (dict[int, list[dict]]): The resolved readings by shard index.
+        """
+        for shard, readings in readings_by_shard.items():
+            session = self.storage.shard_session(shard)
+            try:
+                mirror_catalog(
+                    session,
+                    {reading['device'] for reading in readings},
+                    {reading['metric_type'] for reading in readings},
+                    {reading['unit'] for reading in readings if reading['unit']},
+                )
+                readings_by_shard[shard] = add_readings(session, readings)
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+            finally:
+                session.close()
+
+    def _evaluate(self, readings_by_shard: dict[int, list[dict]]):
+        """Evaluate stored readings and record the alerts they raise.
+
+        Args:
+            readings_by_shard (dict[int, list[dict]]): The resolved readings by shard index.
+        """
+        with BlockTimer("evaluate_alerts"):
+            events = []
+            for readings in readings_by_shard.values():
+                events.extend(self.evaluator.evaluate_batch(readings))
+        if not events:
+            return
+
+        catalog = self.storage.catalog_session()
+        try:
+            catalog.add_all([AlertEvent(**event) for event in events])
+            catalog.commit()
+        except Exception:
+            catalog.rollback()
+            raise
+        finally:
+            catalog.close()
+
+def _validate(index: int, data) -> int:
+    """Check that a serialized reading can be stored.
+
+    Args:
+        index (int): Position of the reading in its batch.
+        data: The serialized reading.
+
+    Returns:
+        int: The timestamp of the reading, in epoch milliseconds.
+
+    Raises:
+        InvalidReadingError: If the reading is malformed.
+    """
+    if not isinstance(data, dict):
+        raise InvalidReadingError(index, 'not an object')
+    device, metric_type, unit = data.get('device'), data.get('metric_type'), data.get('unit')
+    if not isinstance(device, dict) or not isinstance(device.get('id'), (str, int)) or not isinstance(device.get('name'), str):
+        raise InvalidReadingError(index, 'device must have an id and a name')
+    if not isinstance(metric_type, dict) or 'id' not in metric_type or not isinstance(metric_type.get('name'), str):
+        raise InvalidReadingError(index, 'metric_type must have an id and a name')
+    if not all(_is_number(metric_type.get(key), optional=True) for key in ('min_value', 'max_value')):
+        raise InvalidReadingError(index, 'metric_type limits must be numbers')
+    if unit and (not isinstance(unit, dict) or 'id' not in unit or not isinstance(unit.get('name'), str)):
+        raise InvalidReadingError(index, 'unit must have an id and a name')
+    if not _is_number(data.get('value')):
+        raise InvalidReadingError(index, 'value must be a finite number')
+    if data.get('id') is not None and not isinstance(data['id'], str):
+        raise InvalidReadingError(index, 'id must be a string')
+    try:
+        return parse_ms(data['timestamp'])
+    except (KeyError, TypeError, AttributeError, ValueError):
+        raise InvalidReadingError(index, 'timestamp is missing or invalid') from None
+
+def _is_number(value, optional: bool = False) -> bool:
+    """Check that a value is a finite number.
+
+    Args:
+        value: The value to check.
+        optional (bool): Whether None is accepted.
+
+    Returns:
+        bool: True if the value is a finite int or float, or None when optional.
+    """
+    if value is None:
+        return optional
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+def resolve_device(session: Session, device_dto: DeviceDTO) -> tuple:
+    """Find or create a device in the catalog.
+
+    Args:
+        session (Session): The catalog session.
+        device_dto (DeviceDTO): The incoming device.
+
+    Returns:
+        tuple: The device id and name.
+    """
+    device = session.query(Device).filter_by(id=device_dto.id).first() or \
+            session.query(Device).filter_by(name=device_dto.name).first()
+    if not device:
+        device = Device(name=device_dto.name, id=device_dto.id)
+        session.add(device)
+        session.flush()
+    return device.id, device.name
+
+def resolve_metric_type(session: Session, metric_type_dto: MetricTypeDTO) -> tuple:
+    """Find or create a metric type in the catalog.
+
+    Args:
+        session (Session): The catalog session.
+        metric_type_dto (MetricTypeDTO): The incoming metric type.
+
+    Returns:
+        tuple: The metric type id, name, min value and max value.
+    """
+    metric_type = session.query(MetricType).filter_by(name=metric_type_dto.name).first()
+    if not metric_type:
+        metric_type = MetricType(name=metric_type_dto.name, min_value=metric_type_dto.min_value, max_value=metric_type_dto.max_value)
+        session.add(metric_type)
+        session.flush()
+    return metric_type.id, metric_type.name, metric_type.min_value, metric_type.max_value
+
+def resolve_unit(session: Session, unit_dto: UnitDTO) -> tuple:
+    """Find or create a unit in the catalog.
+
+    Args:
+        session (Session): The catalog session.
+        unit_dto (UnitDTO): The incoming unit.
+
+    Returns:
+        tuple: The unit id, name and symbol.
+    """
+    unit = session.query(Unit).filter_by(name=unit_dto.name).first()
+    if not unit:
+        unit = Unit(name=unit_dto.name, symbol=unit_dto.symbol)
+        session.add(unit)
+        session.flush()
+    return unit.id, unit.name, unit.symbol
+
+def mirror_catalog(session: Session, devices: set[tuple], metric_types: set[tuple], units: set[tuple]):
+    """Copy catalog rows into a shard, keeping their ids.
+
+    Args:
+        session (Session): The shard session.
+        devices (set[tuple]): Resolved devices, as returned by ``resolve_device``.
+        metric_types (set[tuple]): Resolved metric types, as returned by ``resolve_metric_type``.
+        units (set[tuple]): Resolved units, as returned by ``resolve_unit``.
+    """
+    for device_id, name in devices:
+        session.merge(Device(id=device_id, name=name))
+    for metric_type_id, name, min_value, max_value in metric_types:
+        session.merge(MetricType(id=metric_type_id, name=name, min_value=min_value, max_value=max_value))
+    for unit_id, name, symbol in units:
+        session.merge(Unit(id=unit_id, name=name, symbol=symbol))
+
+def add_readings(session: Session, readings: list[dict]) -> list[dict]:
+    """Insert readings not stored yet, with their values to the quantile sketches.
+
+    Readings are dicts of the resolved ``device``, ``metric_type`` and ``unit``
+    rows, ``timestamp`` (epoch milliseconds), ``value``, ``reading_id`` and optionally ``utc_offset``.
+
+    Readings carrying an id already stored, or repeated within the batch, are
+    dropped after one probe of the reading id index; the insert also ignores
+    conflicts, so a concurrent retry cannot create a duplicate either.
+
+    Args:
+        session (Session): The session to add the readings to.
+        readings (list[dict]): The resolved readings.
+
+    Returns:
+        list[dict]: The readings actually inserted.
+    """
+    fresh = {}
+    for reading in readings:
+        fresh.setdefault(reading['reading_id'] or id(reading), reading)
+    reading_ids = [reading['reading_id'] for reading in readings if reading['reading_id']]
+    if reading_ids:
+        # Probe in chunks to stay under SQLite's bound parameter limit
+        for start in range(0, len(reading_ids), PROBE_CHUNK_SIZE):
+            chunk = reading_ids[start:start + PROBE_CHUNK_SIZE]
+            for stored_id in session.scalars(select(MetricReading.reading_id).where(MetricReading.reading_id.in_(chunk))):
+                fresh.pop(stored_id, None)
+        stats.increment('ingest.duplicates', len(readings) - len(fresh))
+    readings = list(fresh.values())
+    if not readings:
+        return readings
+
+    session.execute(
+        insert(MetricReading).on_conflict_do_nothing(index_elements=[MetricReading.reading_id]),
+        [
+            {
+                'device_id': reading['device'][0],
+                'metric_type_id': reading['metric_type'][0],
+                'timestamp': reading['timestamp'],
+                'value': reading['value'],
+                'unit_id': reading['unit'][0] if reading['unit'] else None,
+                'reading_id': reading['reading_id'],
+                'utc_offset': reading.get('utc_offset', 0.0),
+            }
+            for reading in readings
+        ]
+    )
+    if config.sketches.enabled:
+        update_sketches(
+            session,
+            ((reading['device'][0], reading['metric_type'][0], reading['timestamp'], reading['value']) for reading in readings),
+            config.sketches.bucket_m,
+            config.sketches.relative_accuracy,
+        )
+    return readings
@@ -0,0 +1,40 @@
+"""Message store module. Keeps the pending message in the database so every worker process shares it."""
+
+from sqlalchemy import delete
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.engine import Engine
+
+from .models import PendingMessage
+
+class MessageStore:
+    """Class storing a single pending message, shared across processes."""
+    SLOT_ID = 1
+
+    def __init__(self, engine: Engine):
+        """Initialize the MessageStore class.
+
+        Args:
+            engine (Engine): Engine of the database holding the message.
+        """
+        self.engine = engine
+
+    def put(self, message: str):
+        """Store a message, replacing any message not yet polled.
+
+        Args:
+            message (str): The message to store.
+        """
+        statement = insert(PendingMessage).values(id=self.SLOT_ID, message=message)
+        statement = statement.on_conflict_do_update(index_elements=[PendingMessage.id], set_={'message': message})
+        with self.engine.begin() as connection:
+            connection.execute(statement)
+
+    def take(self) -> str | None:
+        """Atomically remove and return the pending message.
+
+        Returns:
+            str | None: The pending message, or None if there is none.
+        """
+        statement = delete(PendingMessage).where(PendingMessage.id == self.SLOT_ID).returning(PendingMessage.message)
+        with self.engine.begin() as connection:
+            return connection.execute(statement).scalar()
@@ -1,18 +1,30 @@
 """Metrics module. Collects data from the device and serializes the data"""
 from abc import abstractmethod, ABC
+from concurrent.futures import ThreadPoolExecutor
 import datetime
-import psutil
 import logging
-import requests
+import threading
 
 from config import config
+from sdk.resilience import ResilientClient
 
-from .dto import DeviceDTO, MetricReadingDTO, UnitDTO, MetricTypeDTO
+from .dto import DeviceDTO, MetricReadingDTO, UnitDTO, MetricTypeDTO, reading_id
 
 logger = logging.getLogger(__name__)
 
+# Cache policies of metrics fetched from slow sources
+EXPIRE = 'expire'
+STALE_WHILE_REVALIDATE = 'stale_while_revalidate'
+
+# Shared threads refreshing stale caches in the background
+_refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='metric-refresh')
+
+# Weather API GETs are idempotent, so slow ones are hedged
+weather_api = ResilientClient('third_party_api', hedge_after_s=config.http.hedge_after_s)
+
 class Metric(ABC):
     """Abstract class for metrics."""
+    UNIT_DTO: UnitDTO | None = None
     DATA_INDEX = 0
     TIME_UPDATED_INDEX = 1
 
@@ -69,12 +81,37 @@ class Metric(ABC):
         offset = timestamp.utcoffset() if timestamp.utcoffset() else datetime.timezone.utc.utcoffset(timestamp)
         return offset.total_seconds() / 3600
 
+    def build_reading(self, device: DeviceDTO, value: float, timestamp: datetime.datetime | None = None) -> MetricReadingDTO:
+        """Build a reading of this metric.
+
+        Args:
+            device (DeviceDTO): The device the value was measured for.
+            value (float): The measured value.
+            timestamp (datetime.datetime | None): Time of the measurement, now if None.
+
+        Returns:
+            MetricReadingDTO: The reading.
+        """
+        timestamp = timestamp or self.get_timestamp()
+        data = MetricReadingDTO(
+            id=reading_id(device.id, self.metric_type.name, timestamp),
+            device=device,
+            metric_type=self.metric_type,
+            timestamp=timestamp,
+            value=value,
+            unit=self.UNIT_DTO,
+            utc_offset=self.get_utc_offset(timestamp)
+        )
+        logger.debug(data)
+        return data
+
     @abstractmethod
-    def measure(self, device: DeviceDTO) -> MetricReadingDTO | None:
+    def measure(self, device: DeviceDTO, snapshot=None) -> MetricReadingDTO | None:
         """Measure the metric.
 
         Args:
             device (DeviceDTO): The device to measure the metric for.
+            snapshot (HostSnapshot | None): Host snapshot shared by the metrics of a tick.
 
         Returns:
             MetricReadingDTO | None: The measured metric reading or None if cache is expired.
@@ -84,122 +121,108 @@ class Metric(ABC):
             cache_time = self.cache[self.TIME_UPDATED_INDEX]
             current_time = datetime.datetime.now()
             cache_age = current_time - cache_time
-            if cache_age <= datetime.timedelta(minutes=config.third_party_api.cache_timeout_m):
+            if cache_age <= datetime.timedelta(minutes=config.third_party_api.cache_for(self.get_metric_type()).ttl_m):
                 logger.debug('Returning cached data')
                 return self.cache[self.DATA_INDEX]
             else:
                 logger.debug('Cache expired')
                 return None
 
-class RAMUsage(Metric):
-    """Class to measure the RAM usage."""
-    UNIT_DTO: UnitDTO = UnitDTO(id=-1, name='Percent', symbol='%')
+class CachedMetric(Metric):
+    """Abstract class for metrics fetched from a slow source through a cache.
+
+    The cache follows ``third_party_api.cache_policy``. With ``expire`` an
+    expired cache is refreshed synchronously. With ``stale_while_revalidate`` a
+    value older than its TTL but within its max staleness is returned at once
+    while a background refresh runs, so the caller never waits for the source.
+    """
 
     def __init__(self):
-        """Initialize the RAMUsage class."""
+        """Initialize the CachedMetric class."""
         super().__init__()
-        self.metric_type = MetricTypeDTO(id=-1, name=self.get_metric_type(), min_value=0, max_value=100)
+        self._refresh_lock = threading.Lock()
+        self._refreshing = False
 
-    def measure(self, device: DeviceDTO) -> MetricReadingDTO:
-        """Measure the RAM usage.
+    @abstractmethod
+    def fetch(self, device: DeviceDTO) -> MetricReadingDTO:
+        """Fetch a fresh reading from the source, bypassing the cache.
 
         Args:
-            device (DeviceDTO): The device to measure the RAM usage for.
+            device (DeviceDTO): The device to measure the metric for.
 
         Returns:
-            MetricReadingDTO: The measured RAM usage.
+            MetricReadingDTO: The fetched reading.
         """
-        if (cache := super().measure(device)):
-            return cache
 
-        value: float = psutil.virtual_memory().percent
-        timestamp = self.get_timestamp()
-        data = MetricReadingDTO(
-            id=-1,
-            device=device,
-            metric_type=self.metric_type,
-            timestamp=timestamp,
-            value=value,
-            unit=self.UNIT_DTO,
-            utc_offset=self.get_utc_offset(timestamp)
-        )
-        logger.debug(data)
-        self.cache = (data, self.get_timestamp())
-        return data
-
-class CPUTimes(Metric):
-    """Class to measure CPU times in user mode."""
-    UNIT_DTO: UnitDTO = UnitDTO(id=-1, name='Seconds', symbol='s')
-
-    def __init__(self):
-        """Initialize the CPUTimes class."""
-        super().__init__()
-        self.metric_type = MetricTypeDTO(id=-1, name=self.get_metric_type(), min_value=0, max_value=90000)
-
-    def measure(self, device: DeviceDTO) -> MetricReadingDTO:
-        """Measure the CPU user times.
+    def refresh(self, device: DeviceDTO) -> MetricReadingDTO:
+        """Fetch a fresh reading and store it in the cache.
 
         Args:
-            device (DeviceDTO): The device to measure the CPU user times for.
+            device (DeviceDTO): The device to measure the metric for.
 
         Returns:
-            MetricReadingDTO: The measured CPU user times.
+            MetricReadingDTO: The fetched reading.
         """
-        if (cache := super().measure(device)):
-            return cache
-
-        value: float = psutil.cpu_times().user
-        timestamp = self.get_timestamp()
-        data = MetricReadingDTO(
-            id=-1,
-            device=device,
-            metric_type=self.metric_type,
-            timestamp=timestamp,
-            value=value,
-            unit=self.UNIT_DTO,
-            utc_offset=self.get_utc_offset(timestamp)
-        )
-        logger.debug(data)
+        data = self.fetch(device)
         self.cache = (data, self.get_timestamp())
         return data
 
-class NetworkSend(Metric):
-    """Class to measure the network send bytes."""
-    UNIT_DTO: UnitDTO = UnitDTO(id=-1, name='Bytes', symbol='B')
-
-    def __init__(self):
-        """Initialize the NetworkSend class."""
-        super().__init__()
-        self.metric_type = MetricTypeDTO(id=-1, name=self.get_metric_type(), min_value=0, max_value=1000000000)
-
-    def measure(self, device: DeviceDTO) -> MetricReadingDTO:
-        """Measure the network send bytes.
+    def measure(self, device: DeviceDTO, snapshot=None) -> MetricReadingDTO | None:
+        """Measure the metric through the configured cache policy.
 
         Args:
-            device (DeviceDTO): The device to measure the network send bytes for.
+            device (DeviceDTO): The device to measure the metric for.
+            snapshot (HostSnapshot | None): Unused, cached metrics do not read the host.
 
         Returns:
-            MetricReadingDTO: The measured network send bytes.
+            MetricReadingDTO | None: The reading, or None while it is being fetched or if the fetch failed.
         """
-        if (cache := super().measure(device)):
-            return cache
+        if config.third_party_api.cache_policy != STALE_WHILE_REVALIDATE:
+            if (cache := super().measure(device)):
+                return cache
+            try:
+                return self.refresh(device)
+            except Exception as e:
+                logger.warning('Refresh of %s failed: %s', self.get_metric_type(), e)
+                return None
 
-        value: float = psutil.net_io_counters().bytes_sent
-        timestamp = self.get_timestamp()
-        data = MetricReadingDTO(
-            id=-1,
-            device=device,
-            metric_type=self.metric_type,
-            timestamp=timestamp,
-            value=value,
-            unit=self.UNIT_DTO,
-            utc_offset=self.get_utc_offset(timestamp)
-        )
-        logger.debug(data)
-        self.cache = (data, self.get_timestamp())
-        return data
+        cache_config = config.third_party_api.cache_for(self.get_metric_type())
+        data, updated = self.cache
+        if data is not None:
+            cache_age = datetime.datetime.now() - updated
+            if cache_age <= datetime.timedelta(minutes=cache_config.max_stale_m):
+                if cache_age > datetime.timedelta(minutes=cache_config.ttl_m):
+                    logger.debug('Returning stale data while revalidating')
+                    self.revalidate(device)
+                return data
+
+        logger.debug('No usable cached data, fetching in the background')
+        self.revalidate(device)
+        return None
 
-class TemperatureInItaly(Metric):
+    def revalidate(self, device: DeviceDTO):
+        """Refresh the cache in the background, unless a refresh is already running.
+
+        Args:
+            device (DeviceDTO): The device to measure the metric for.
+        """
+        with self._refresh_lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh(device)
+            except Exception as e:
+                logger.warning('Background refresh of %s failed: %s', self.get_metric_type(), e)
+            finally:
+                with self._refresh_lock:
+                    self._refreshing = False
+
+        _refresh_executor.submit(run)
+
+class TemperatureInItaly(CachedMetric):
     """Class to measure the temperature in Italy from a 3rd Party API."""
     UNIT_DTO: UnitDTO = UnitDTO(id=-1, name='Celsius', symbol='°C')
 
@@ -208,37 +231,23 @@ class TemperatureInItaly(Metric):
         super().__init__()
         self.metric_type = MetricTypeDTO(id=-1, name=self.get_metric_type(), min_value=-50, max_value=50)
 
-    def measure(self, device: DeviceDTO) -> MetricReadingDTO:
-        """Measure the temperature in Italy from a 3rd Party API.
+    def fetch(self, device: DeviceDTO) -> MetricReadingDTO:
+        """Fetch the temperature in Italy from a 3rd Party API.
 
         Args:
             device (DeviceDTO): The device to measure the temperature for.
 
         Returns:
-            MetricReadingDTO: The measured temperature.
+            MetricReadingDTO: The fetched temperature.
         """
-        if (cache := super().measure(device)):
-            return cache
-
         # API to weather data
-        all_weather_data = requests.get(config.third_party_api.url, params=config.third_party_api.params).json()
+        response = weather_api.get(config.third_party_api.url, params=config.third_party_api.params)
+        response.raise_for_status()
+        all_weather_data = response.json()
         value = all_weather_data["main"]["temp"]
+        return self.build_reading(device, value)
 
-        timestamp = self.get_timestamp()
-        data = MetricReadingDTO(
-            id=-1,
-            device=device,
-            metric_type=self.metric_type,
-            timestamp=timestamp,
-            value=value,
-            unit=self.UNIT_DTO,
-            utc_offset=self.get_utc_offset(timestamp)
-        )
-        logger.debug(data)
-        self.cache = (data, self.get_timestamp())
-        return data
-
-class TemperatureFeelInItaly(Metric):
+class TemperatureFeelInItaly(CachedMetric):
     """Class to measure the temperature feel in Italy from a 3rd Party API."""
     UNIT_DTO: UnitDTO = UnitDTO(id=-1, name='Celsius', symbol='°C')
 
@@ -247,32 +256,18 @@ class TemperatureFeelInItaly(Metric):
         super().__init__()
         self.metric_type = MetricTypeDTO(id=-1, name=self.get_metric_type(), min_value=-50, max_value=50)
 
-    def measure(self, device: DeviceDTO) -> MetricReadingDTO:
-        """Measure the temperature feel in Italy from a 3rd Party API.
+    def fetch(self, device: DeviceDTO) -> MetricReadingDTO:
+        """Fetch the temperature feel in Italy from a 3rd Party API.
 
         Args:
             device (DeviceDTO): The device to measure the temperature feel for.
 
         Returns:
-            MetricReadingDTO: The measured temperature feel.
+            MetricReadingDTO: The fetched temperature feel.
         """
-        if (cache := super().measure(device)):
-            return cache
-
         # API to weather data
-        all_weather_data = requests.get(config.third_party_api.url, params=config.third_party_api.params).json()
+        response = weather_api.get(config.third_party_api.url, params=config.third_party_api.params)
+        response.raise_for_status()
+        all_weather_data = response.json()
         value = all_weather_data["main"]["feels_like"]
-
-        timestamp = self.get_timestamp()
-        data = MetricReadingDTO(
-            id=-1,
-            device=device,
-            metric_type=self.metric_type,
-            timestamp=timestamp,
-            value=value,
-            unit=self.UNIT_DTO,
-            utc_offset=self.get_utc_offset(timestamp)
-        )
-        logger.debug(data)
-        self.cache = (data, self.get_timestamp())
-        return data
+        return self.build_reading(device, value)
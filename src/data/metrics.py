@@ -1,5 +1,6 @@
 """Metrics module to track metrics"""
 from data.dto import DeviceDTO, MetricReadingDTO
+from .host_metrics import HostSnapshot
 from .metric import Metric
 
 class Metrics:
@@ -38,16 +39,25 @@ class Metrics:
         """
         return [metric.get_metric_type() for metric in self.metrics]
 
-    def measure_metrics(self) -> list[MetricReadingDTO]:
-        """Measure all tracked metrics.
+    def measure_metrics(self, metric_types: list[str] | None = None) -> list[MetricReadingDTO]:
+        """Measure all tracked metrics, or only the given metric types.
+
+        Args:
+            metric_types (list[str] | None): The metric types to measure, all if None.
 
         Returns:
             list[MetricReadingDTO]: The list of measured metric readings.
         """
+        # One snapshot per call, so host metrics share their psutil calls
+        snapshot = HostSnapshot()
+        wanted = set(metric_types) if metric_types is not None else None
         list_data: list[MetricReadingDTO] = []
         for metric in self.metrics:
-            data = metric.measure(self.device_dto)
-            list_data.append(data)
+            if wanted is not None and metric.get_metric_type() not in wanted:
+                continue
+            data = metric.measure(self.device_dto, snapshot)
+            if data is not None:
+                list_data.append(data)
         return list_data
 
     def measure_metric(self, metric_type: str) -> MetricReadingDTO:
@@ -1,20 +1,86 @@
+from collections import defaultdict
 import json
 import logging
 import socket
+import time
 from time import sleep
 import uuid
 from apscheduler.schedulers.background import BackgroundScheduler
 import requests
 from block_timer import BlockTimer
 from config import config
+from profiling import slow_profiler
+from stats_registry import stats
 
-from data.dto import DeviceDTO
+from data.dto import DeviceDTO, MetricReadingDTO
 from .metrics import Metrics
-from .metric import CPUTimes, TemperatureInItaly, TemperatureFeelInItaly, RAMUsage, NetworkSend
+from .host_metrics import host_metrics
+from .metric import TemperatureInItaly, TemperatureFeelInItaly
+from sdk.batcher import MetricsBatcher
 from sdk.metrics_api import MetricsAPI
 
 logger = logging.getLogger(__name__)
 
+# Server responses asking the collector to slow down
+OVERLOAD_STATUS_CODES = (429, 503)
+
+class DeadbandFilter:
+    """Class deciding which readings are worth reporting."""
+
+    def __init__(self):
+        """Initialize the DeadbandFilter."""
+        self.last_sent: dict[tuple, tuple[float, float]] = {}
+
+    def should_send(self, reading: MetricReadingDTO) -> bool:
+        """Check if a reading moved past its deadband or its heartbeat is due.
+
+        Args:
+            reading (MetricReadingDTO): The measured reading.
+
+        Returns:
+            bool: True if the reading should be sent, False otherwise.
+        """
+        schedule = config.collector.schedule_for(reading.metric_type.name)
+        key = (reading.device.id, reading.metric_type.name)
+        now = time.monotonic()
+        last = self.last_sent.get(key)
+        if last is not None:
+            last_value, last_time = last
+            if abs(reading.value - last_value) <= schedule.deadband and now - last_time < schedule.max_silence_s:
+                return False
+        self.last_sent[key] = (reading.value, now)
+        return True
+
+class IntervalBackoff:
+    """Class tracking how much the collection intervals are stretched."""
+
+    def __init__(self, factor: float, max_multiplier: float):
+        """Initialize the IntervalBackoff.
+
+        Args:
+            factor (float): Multiplier applied on every overload response.
+            max_multiplier (float): Upper bound of the interval multiplier.
+        """
+        self.factor = factor
+        self.max_multiplier = max_multiplier
+        self.multiplier = 1.0
+
+    def record(self, status_code: int | None) -> bool:
+        """Update the multiplier from the status code of the last send.
+
+        Args:
+            status_code (int | None): HTTP status of the last send, None if no response.
+
+        Returns:
+            bool: True if the multiplier changed, False otherwise.
+        """
+        previous = self.multiplier
+        if status_code in OVERLOAD_STATUS_CODES:
+            self.multiplier = min(self.multiplier * self.factor, self.max_multiplier)
+        elif status_code is not None and status_code < 400:
+            self.multiplier = max(self.multiplier / self.factor, 1.0)
+        return self.multiplier != previous
+
 class MetricsCollector:
     """Class to collect metrics."""
 
@@ -41,17 +107,74 @@ class MetricsCollector:
     def __init__(self):
         """Initialize the MetricsCollector class."""
         self.scheduler = BackgroundScheduler()
+        self.deadband = DeadbandFilter()
+        self.backoff = IntervalBackoff(config.collector.backoff_factor, config.collector.max_backoff_multiplier)
+        self.job_schedules: dict[str, tuple[float, float]] = {}
+        self.batcher = MetricsBatcher.from_config() if config.collector.batch.enabled else None
         MetricsCollector.connect_local_metrics()
         MetricsCollector.connect_tp_metrics()
-        self.scheduler.add_job(MetricsCollector.collect_local_metrics, 'interval', seconds=12, args=[True], max_instances=1)
-        self.scheduler.add_job(MetricsCollector.collect_tp_metrics, 'interval', seconds=25, args=[True], max_instances=1)
+        self.schedule_jobs(MetricsCollector.local_metrics, 'LOCAL')
+        self.schedule_jobs(MetricsCollector.third_party_metrics, 'THIRD PARTY')
+
+    def schedule_jobs(self, metrics: Metrics, group: str):
+        """Add one job per distinct interval and jitter among the metrics of a group.
+
+        Args:
+            metrics (Metrics): The metrics of the group.
+            group (str): Name of the group, used in the job ids.
+        """
+        metric_types_by_schedule = defaultdict(list)
+        for metric_type in metrics.get_metrics():
+            schedule = config.collector.schedule_for(metric_type)
+            metric_types_by_schedule[(schedule.interval_s, schedule.jitter_s)].append(metric_type)
+
+        for (interval, jitter), metric_types in metric_types_by_schedule.items():
+            job_id = f"{group} Metrics {interval:g}s"
+            self.job_schedules[job_id] = (interval, jitter)
+            self.scheduler.add_job(
+                self.collect_metrics, 'interval', seconds=interval, jitter=jitter or None,
+                args=[metrics, metric_types, job_id], id=job_id, max_instances=1
+            )
+            logger.info('Scheduled %s every %gs: %s', job_id, interval, ', '.join(metric_types))
+
+    def collect_metrics(self, metrics: Metrics, metric_types: list[str], job_name: str):
+        """Collect metrics and send the readings that passed the deadband filter.
+
+        Args:
+            metrics (Metrics): The metrics group to measure.
+            metric_types (list[str]): The metric types measured by this job.
+            job_name (str): Name of the job, used for timing.
+        """
+        with BlockTimer(job_name), slow_profiler.profile(job_name):
+            data_list = metrics.measure_metrics(metric_types)
+            serialise_data_list = [data.serialize() for data in data_list if self.deadband.should_send(data)]
+            stats.increment('collector.readings_suppressed', len(data_list) - len(serialise_data_list))
+
+            if self.batcher:
+                self.batcher.add(serialise_data_list)
+                # A backlog the server cannot drain slows sampling like an overload response
+                status_code = OVERLOAD_STATUS_CODES[0] if self.batcher.congested else self.batcher.last_status_code
+            else:
+                if not serialise_data_list and not MetricsAPI.failed_data:
+                    return
+                logger.debug('Sending %d readings from %s', len(serialise_data_list), job_name)
+                status_code = MetricsAPI.send_metrics(serialise_data_list)
+            stats.increment('collector.readings_sent', len(serialise_data_list))
+            if self.backoff.record(status_code):
+                self.apply_backoff()
+
+    def apply_backoff(self):
+        """Reschedule every job with its interval stretched by the backoff multiplier."""
+        multiplier = self.backoff.multiplier
+        logger.warning('Collection intervals now x%g of their configured value', multiplier)
+        for job_id, (interval, jitter) in self.job_schedules.items():
+            self.scheduler.reschedule_job(job_id, trigger='interval', seconds=interval * multiplier, jitter=jitter or None)
 
     @staticmethod
     def connect_local_metrics():
-        """Connect local metrics."""
-        MetricsCollector.local_metrics.add_metric(CPUTimes())
-        MetricsCollector.local_metrics.add_metric(RAMUsage())
-        MetricsCollector.local_metrics.add_metric(NetworkSend())
+        """Connect the host metrics enabled in the configuration."""
+        for metric in host_metrics(config.collector.host_metrics):
+            MetricsCollector.local_metrics.add_metric(metric)
 
     @staticmethod
     def connect_tp_metrics():
@@ -59,46 +182,16 @@ class MetricsCollector:
         MetricsCollector.third_party_metrics.add_metric(TemperatureInItaly())
         MetricsCollector.third_party_metrics.add_metric(TemperatureFeelInItaly())
 
-    # PJ: PC Collector
-    @staticmethod
-    def collect_local_metrics(save_flag: bool = False):
-        """Collect local metrics.
-
-        Args:
-            save_flag (bool): Flag to indicate whether to save the metrics.
-        """
-        with BlockTimer("LOCAL Metrics"):
-            data_list = MetricsCollector.local_metrics.measure_metrics()
-            serialise_data_list = [data.serialize() for data in data_list]
-            if save_flag:
-                logger.debug('Sending LOCAL data to API')
-                MetricsAPI.send_metrics(serialise_data_list)
-                logger.debug('Data sent to LOCAL')
-            return serialise_data_list
-
-    # PJ: Third Party Collector
-    @staticmethod
-    def collect_tp_metrics(save_flag: bool = False):
-        """Collect third-party metrics.
-
-        Args:
-            save_flag (bool): Flag to indicate whether to save the metrics.
-        """
-        with BlockTimer("THIRD PARTY Metrics"):
-            data_list = MetricsCollector.third_party_metrics.measure_metrics()
-            serialise_data_list = [data.serialize() for data in data_list]
-            if save_flag:
-                logger.debug('Sending data from third party API')
-                MetricsAPI.send_metrics(serialise_data_list)
-                logger.debug('Data sent to third party API')
-            return serialise_data_list
-
     def start_scheduler(self):
-        """Start the scheduler."""
+        """Start the scheduler, and the batcher sending its readings."""
+        if self.batcher:
+            self.batcher.start()
         self.scheduler.start()
         logger.info('Scheduler started')
 
     def stop_scheduler(self):
-        """Stop the scheduler."""
+        """Stop the scheduler, then send the readings still queued."""
         self.scheduler.shutdown()
+        if self.batcher:
+            self.batcher.close()
         logger.info('Scheduler stopped')
\ No newline at end of file
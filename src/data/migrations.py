@@ -0,0 +1,77 @@
+"""Migrations module. Brings databases created by older versions up to the current models."""
+
+import logging
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+
+from config import config
+from timestamps import DATETIME, EPOCH_MS
+
+from .models import Base, Timestamp
+
+logger = logging.getLogger(__name__)
+
+# Value of PRAGMA user_version once every stored timestamp is in a mode
+CONVERTED_VERSIONS = {DATETIME: 1, EPOCH_MS: 2}
+
+def migrate(engine: Engine):
+    """Apply every migration an existing database still needs.
+
+    Each migration checks the schema, or the conversion recorded in the
+    database, first, so running this on an up to date database does nothing. ``create_all`` must have run before.
+
+    Args:
+        engine (Engine): Engine of the database to migrate.
+    """
+    add_reading_id(engine)
+    convert_timestamps(engine)
+
+def add_reading_id(engine: Engine):
+    """Add the client-assigned reading id column and its unique index to the readings.
+
+    Readings stored before the migration keep a NULL id, which the unique
+    index allows any number of times.
+
+    Args:
+        engine (Engine): Engine of the database to migrate.
+    """
+    columns = {column['name'] for column in inspect(engine).get_columns('metric_readings')}
+    with engine.begin() as connection:
+        if 'reading_id' not in columns:
+            logger.info('Adding metric_readings.reading_id to %s', engine.url)
+            connection.execute(text('ALTER TABLE metric_readings ADD COLUMN reading_id VARCHAR(36)'))
+        connection.execute(text('CREATE UNIQUE INDEX IF NOT EXISTS ix_metric_readings_reading_id ON metric_readings (reading_id)'))
+
+def convert_timestamps(engine: Engine):
+    """Rewrite stored timestamps not yet in the configured timestamp mode.
+
+    SQLite does the conversion: ISO strings, which hold local time, become
+    UTC epoch milliseconds in the ``epoch_ms`` mode, and back in the
+    ``datetime`` mode. The mode converted to is recorded in ``PRAGMA
+    user_version``, so the tables are only scanned again after the mode changes.
+
+    Args:
+        engine (Engine): Engine of the database to migrate.
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+    version = CONVERTED_VERSIONS[config.timestamps.mode]
+    if config.timestamps.mode == EPOCH_MS:
+        source_type, conversion = 'text', "CAST(ROUND((julianday({column}, 'utc') - 2440587.5) * 86400000) AS INTEGER)"
+    else:
+        source_type, conversion = 'integer', "strftime('%Y-%m-%d %H:%M:%f', {column} / 1000.0, 'unixepoch', 'localtime') || '000'"
+
+    with engine.begin() as connection:
+        if connection.execute(text('PRAGMA user_version')).scalar() == version:
+            return
+        for table in Base.metadata.sorted_tables:
+            for column in table.columns:
+                if not isinstance(column.type, Timestamp):
+                    continue
+                result = connection.execute(text(
+                    f'UPDATE {table.name} SET {column.name} = {conversion.format(column=column.name)} '
+                    f"WHERE typeof({column.name}) = '{source_type}'"
+                ))
+                if result.rowcount:
+                    logger.info('Converted %d %s.%s values from %s', result.rowcount, table.name, column.name, source_type)
+        connection.execute(text(f'PRAGMA user_version = {version}'))
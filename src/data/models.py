@@ -1,9 +1,55 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime
+from datetime import datetime
+from sqlalchemy import BigInteger, Column, Integer, String, Float, ForeignKey, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.types import TypeDecorator
+
+from timestamps import STORAGE_FORMAT, epoch_mode, from_ms, to_ms
 
 Base = declarative_base()
 
+class Timestamp(TypeDecorator):
+    """Column type storing datetimes as epoch milliseconds or as ISO strings, depending on the timestamp mode.
+
+    Values of either form are read back as naive local datetimes, so rows not
+    yet migrated to the configured mode stay readable.
+    """
+    impl = BigInteger
+    cache_ok = True
+
+    def process_bind_param(self, value: datetime | int | None, dialect) -> int | str | None:
+        """Convert a datetime or epoch milliseconds to the stored form.
+
+        Args:
+            value (datetime | int | None): The datetime, or milliseconds since the Unix epoch.
+            dialect: The database dialect.
+
+        Returns:
+            int | str | None: Epoch milliseconds, or an ISO string in the datetime mode.
+        """
+        if value is None:
+            return None
+        if isinstance(value, int):
+            # Epoch milliseconds are stored as they are in the epoch_ms mode
+            return value if epoch_mode() else from_ms(value).strftime(STORAGE_FORMAT)
+        return to_ms(value) if epoch_mode() else value.strftime(STORAGE_FORMAT)
+
+    def process_result_value(self, value: int | str | None, dialect) -> datetime | None:
+        """Convert a stored value to a datetime.
+
+        Args:
+            value (int | str | None): The stored value.
+            dialect: The database dialect.
+
+        Returns:
+            datetime | None: The naive local datetime.
+        """
+        if value is None:
+            return None
+        if isinstance(value, str):
+            return datetime.fromisoformat(value)
+        return from_ms(value)
+
 class Device(Base):
     """Model representing a device."""
     __tablename__ = 'devices'
@@ -34,10 +80,57 @@ class MetricReading(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     device_id = Column(Integer, ForeignKey('devices.id'), nullable=False)
     metric_type_id = Column(Integer, ForeignKey('metric_types.id'), nullable=False)
-    timestamp = Column(DateTime, nullable=False)
+    timestamp = Column(Timestamp, nullable=False)
     value = Column(Float, nullable=False)
     unit_id = Column(Integer, ForeignKey('units.id'), nullable=True)
     utc_offset = Column(Float, nullable=False, default=0.0)
+    reading_id = Column(String(36), nullable=True, unique=True, index=True)
     device = relationship('Device', back_populates='metric_readings')
     metric_type = relationship('MetricType', back_populates='metric_readings')
     unit = relationship('Unit', back_populates='metric_readings')
+
+class PendingMessage(Base):
+    """Model representing the message waiting to be polled by the collector."""
+    __tablename__ = 'pending_messages'
+    id = Column(Integer, primary_key=True)
+    message = Column(String, nullable=False)
+
+class ImportProgress(Base):
+    """Model recording how far a bulk import of a file has got."""
+    __tablename__ = 'import_progress'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    source = Column(String, nullable=False)
+    source_size = Column(Integer, nullable=False)
+    rows_done = Column(Integer, nullable=False, default=0)
+    __table_args__ = (UniqueConstraint('source', 'source_size'),)
+
+class AlertEvent(Base):
+    """Model representing an alert raised while ingesting a reading."""
+    __tablename__ = 'alert_events'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    device_id = Column(String, ForeignKey('devices.id'), nullable=False)
+    metric_type_id = Column(Integer, ForeignKey('metric_types.id'), nullable=False)
+    timestamp = Column(Timestamp, nullable=False, index=True)
+    kind = Column(String, nullable=False)
+    value = Column(Float, nullable=False)
+    detail = Column(String, nullable=True)
+
+class QuantileSketch(Base):
+    """Model representing the quantile sketch of one series over one time bucket."""
+    __tablename__ = 'quantile_sketches'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    device_id = Column(String, ForeignKey('devices.id'), nullable=False)
+    metric_type_id = Column(Integer, ForeignKey('metric_types.id'), nullable=False)
+    bucket_start = Column(Timestamp, nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+    sketch = Column(String, nullable=False)
+    __table_args__ = (UniqueConstraint('device_id', 'metric_type_id', 'bucket_start'),)
+
+class AnalyticsJob(Base):
+    """Model tracking an analytics report computed in the background."""
+    __tablename__ = 'analytics_jobs'
+    id = Column(String(36), primary_key=True)
+    status = Column(String, nullable=False)
+    chunks = Column(Integer, nullable=False)
+    chunks_done = Column(Integer, nullable=False, default=0)
+    result = Column(String, nullable=True)
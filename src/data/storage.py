@@ -0,0 +1,145 @@
+"""Storage module. Routes devices to database shards and fans queries out over them."""
+
+from concurrent.futures import ThreadPoolExecutor
+import logging
+from typing import Callable
+import zlib
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from config import config
+
+from .migrations import migrate
+from .models import Base
+
+logger = logging.getLogger(__name__)
+
+class Storage:
+    """Class owning the database engines.
+
+    The engine named by ``database.db_engine`` is the catalog: devices, metric
+    types and units get their ids there. With a single shard it also stores the
+    readings. With several shards each device's readings live in the shard its
+    id hashes to, along with copies of the catalog rows they reference.
+    """
+
+    def __init__(self, db_engine: str, shards: int = 1, shard_engine_template: str = '', query_workers: int = 4):
+        """Initialize the Storage class.
+
+        Args:
+            db_engine (str): URL of the catalog database.
+            shards (int): Number of reading shards.
+            shard_engine_template (str): URL template of the shards, formatted with ``shard``.
+            query_workers (int): Number of threads used to query the shards in parallel.
+        """
+        self.catalog_engine = create_engine(db_engine)
+        self.catalog_sessionmaker = sessionmaker(bind=self.catalog_engine)
+        if shards > 1:
+            self.shard_engines = [create_engine(shard_engine_template.format(shard=shard)) for shard in range(shards)]
+            self.shard_sessionmakers = [sessionmaker(bind=engine) for engine in self.shard_engines]
+            self.executor = ThreadPoolExecutor(max_workers=min(shards, query_workers), thread_name_prefix='shard-query')
+            logger.info('Storing readings in %d shards', shards)
+        else:
+            self.shard_engines = [self.catalog_engine]
+            self.shard_sessionmakers = [self.catalog_sessionmaker]
+            self.executor = None
+
+    @classmethod
+    def from_config(cls) -> "Storage":
+        """Create the storage described by the configuration.
+
+        Returns:
+            Storage: The configured storage.
+        """
+        return cls(
+            db_engine=config.database.db_engine,
+            shards=config.database.shards,
+            shard_engine_template=config.database.shard_engine_template,
+            query_workers=config.database.query_workers,
+        )
+
+    @property
+    def sharded(self) -> bool:
+        """Return whether readings are spread over several shards.
+
+        Returns:
+            bool: True if sharded, False otherwise.
+        """
+        return len(self.shard_engines) > 1
+
+    def create_all(self):
+        """Create the tables in the catalog and in every shard, and migrate existing ones."""
+        Base.metadata.create_all(self.catalog_engine)
+        migrate(self.catalog_engine)
+        if self.sharded:
+            for engine in self.shard_engines:
+                Base.metadata.create_all(engine)
+                migrate(engine)
+
+    def dispose(self):
+        """Close all pooled connections."""
+        self.catalog_engine.dispose()
+        if self.sharded:
+            for engine in self.shard_engines:
+                engine.dispose()
+
+    def shard_for(self, device_id) -> int:
+        """Return the shard storing the readings of a device.
+
+        Args:
+            device_id: The device id.
+
+        Returns:
+            int: The shard index.
+        """
+        return zlib.crc32(str(device_id).encode()) % len(self.shard_engines)
+
+    def catalog_session(self) -> Session:
+        """Return a new session on the catalog database.
+
+        Returns:
+            Session: The catalog session.
+        """
+        return self.catalog_sessionmaker()
+
+    def shard_session(self, shard: int) -> Session:
+        """Return a new session on a shard.
+
+        Args:
+            shard (int): The shard index.
+
+        Returns:
+            Session: The shard session.
+        """
+        return self.shard_sessionmakers[shard]()
+
+    def device_session(self, device_id) -> Session:
+        """Return a new session on the shard storing a device.
+
+        Args:
+            device_id: The device id.
+
+        Returns:
+            Session: The shard session.
+        """
+        return self.shard_session(self.shard_for(device_id))
+
+    def fan_out(self, query: Callable[[Session], object]) -> list:
+        """Run a query on every shard, in parallel when sharded.
+
+        Args:
+            query (Callable[[Session], object]): Function running the query on a session.
+
+        Returns:
+            list: The result of the query for each shard, in shard order.
+        """
+        def run(shard: int):
+            session = self.shard_session(shard)
+            try:
+                return query(session)
+            finally:
+                session.close()
+
+        if self.executor is None:
+            return [run(0)]
+        return list(self.executor.map(run, range(len(self.shard_engines))))
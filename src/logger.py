@@ -1,14 +1,107 @@
 """This module contains the logger setup function."""
 
+import atexit
 import logging
+import logging.handlers
 from config import config
 import os
 from pathlib import Path
+import queue
+import threading
+import time
+
+from stats_registry import stats
 
 logger = logging.getLogger(__name__)
 
+# Queue handler and running listener of the queued mode
+_queue_handler: logging.handlers.QueueHandler | None = None
+_listener: logging.handlers.QueueListener | None = None
+
+class RateLimitFilter(logging.Filter):
+    """Filter dropping records of chatty loggers beyond a rate.
+
+    Each configured logger, and its children, gets a token bucket holding
+    one second worth of records. Warnings and errors always pass. The decision
+    is kept on the record, so a filter shared by several handlers takes one
+    token and counts one suppression per record.
+    """
+
+    def __init__(self, rate_limits: dict[str, float]):
+        """Initialize the RateLimitFilter class.
+
+        Args:
+            rate_limits (dict[str, float]): Records per second allowed by logger name.
+        """
+        super().__init__()
+        self.rate_limits = rate_limits
+        self._buckets: dict[str, list[float]] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        """Decide whether a record is emitted.
+
+        Args:
+            record (logging.LogRecord): The record.
+
+        Returns:
+            bool: True to emit the record, False to drop it.
+        """
+        passed = getattr(record, 'rate_limit_passed', None)
+        if passed is None:
+            passed = record.rate_limit_passed = self._take_token(record)
+        return passed
+
+    def _take_token(self, record: logging.LogRecord) -> bool:
+        """Take a token for a record from its logger's bucket.
+
+        Args:
+            record (logging.LogRecord): The record.
+
+        Returns:
+            bool: True if the record is within the rate, False if it is suppressed.
+        """
+        if record.levelno >= logging.WARNING:
+            return True
+        name = self._limited_name(record.name)
+        if name is None:
+            return True
+
+        rate = self.rate_limits[name]
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.setdefault(name, [rate, now])
+            bucket[0] = min(bucket[0] + (now - bucket[1]) * rate, rate)
+            bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return True
+        stats.increment('logging.suppressed')
+        return False
+
+    def _limited_name(self, name: str) -> str | None:
+        """Return the configured logger a record's logger falls under.
+
+        Args:
+            name (str): Name of the record's logger.
+
+        Returns:
+            str | None: The closest configured logger name, or None if it is not limited.
+        """
+        while name:
+            if name in self.rate_limits:
+                return name
+            name = name.rpartition('.')[0]
+        return None
+
 def setup_logger():
-    """Setup the logger."""
+    """Setup the logger.
+
+    In the queued mode (``logging.queued``), log calls only put the record on
+    a queue; a listener thread writes it to the console and to the size-rotated
+    log file. Otherwise the handlers write on the calling thread.
+    """
+    global _queue_handler
     script_dir = Path(__file__).parent
     filepath = script_dir / config.logging.file_path
 
@@ -17,11 +110,60 @@ def setup_logger():
         with open(filepath, 'w') as f:
             pass
 
-    logging.basicConfig(
-        level=config.logging.level, 
-        format=config.logging.format, 
-        handlers=[
-            logging.FileHandler(filepath),
-            logging.StreamHandler()
-        ])
-    logger.info('Logger is setup')
+    handlers = [
+        logging.handlers.RotatingFileHandler(filepath, maxBytes=config.logging.max_bytes, backupCount=config.logging.backup_count),
+        logging.StreamHandler()
+    ]
+    rate_limit = RateLimitFilter(config.logging.rate_limits)
+
+    if not config.logging.queued:
+        for handler in handlers:
+            handler.addFilter(rate_limit)
+        logging.basicConfig(level=config.logging.level, format=config.logging.format, handlers=handlers)
+        logger.info('Logger is setup')
+        return
+
+    formatter = logging.Formatter(config.logging.format)
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    # Dropped records are filtered before being queued
+    _queue_handler = logging.handlers.QueueHandler(queue.SimpleQueue())
+    # Only merge the message arguments here, the listener's handlers apply the format
+    _queue_handler.setFormatter(logging.Formatter('%(message)s'))
+    _queue_handler.addFilter(rate_limit)
+    logging.basicConfig(level=config.logging.level, handlers=[_queue_handler])
+    _start_listener(handlers)
+
+    # Forking while the listener writes would leave the child's copy of the
+    # file locked, so the listener is stopped around forks; each child then
+    # starts its own, leaving the records already queued to the parent
+    os.register_at_fork(
+        before=_stop_listener,
+        after_in_parent=lambda: _start_listener(handlers, _queue_handler.queue),
+        after_in_child=lambda: _start_listener(handlers)
+    )
+    atexit.register(_stop_listener)
+    logger.info('Logger is setup, writing from a background thread')
+
+def _start_listener(handlers: list[logging.Handler], records: queue.SimpleQueue | None = None):
+    """Start a listener thread emitting the queued records.
+
+    Args:
+        handlers (list[logging.Handler]): The handlers writing the records.
+        records (queue.SimpleQueue | None): The queue to read, a new one if None.
+    """
+    global _listener
+    _queue_handler.queue = records if records is not None else queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(_queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+def flush_logs():
+    """Write the queued records, for processes leaving with ``os._exit`` and so without the ``atexit`` handlers."""
+    _stop_listener()
+
+def _stop_listener():
+    """Write the queued records and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
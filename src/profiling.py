@@ -0,0 +1,130 @@
+"""Opt-in profiling helpers: a thread stack sampler and a slow call profiler."""
+
+from collections import Counter
+from contextlib import contextmanager
+import cProfile
+import logging
+import os
+from pathlib import Path
+import re
+import sys
+import threading
+import time
+
+from stats_registry import stats
+
+logger = logging.getLogger(__name__)
+
+def sample_stacks(duration_s: float, interval_s: float = 0.005) -> str:
+    """Sample the stacks of all other threads for a period of time.
+
+    Args:
+        duration_s (float): How long to sample for, in seconds.
+        interval_s (float): Delay between two samples, in seconds.
+
+    Returns:
+        str: Collapsed stacks, one ``frame;frame;frame count`` line per unique stack,
+            ready to feed into flamegraph tools.
+    """
+    own_ident = threading.get_ident()
+    counts: Counter = Counter()
+    deadline = time.perf_counter() + duration_s
+
+    while time.perf_counter() < deadline:
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            stack.append(thread_names.get(ident, f"thread-{ident}"))
+            counts[';'.join(reversed(stack))] += 1
+        time.sleep(interval_s)
+
+    return '\n'.join(f"{stack} {count}" for stack, count in counts.most_common())
+
+class SlowCallProfiler:
+    """Runs cProfile around calls and keeps the output of the slow ones.
+
+    Only one call is profiled at a time; concurrent calls run unprofiled.
+    """
+
+    def __init__(self):
+        """Initialize the SlowCallProfiler, disabled by default."""
+        self.enabled = False
+        self.threshold_s = 0.5
+        self.output_dir = Path('.')
+        self._lock = threading.Lock()
+
+    def configure(self, enabled: bool, threshold_ms: float, output_dir: str):
+        """Configure the profiler.
+
+        Args:
+            enabled (bool): Whether calls should be profiled.
+            threshold_ms (float): Calls slower than this are written to disk.
+            output_dir (str): Directory for the profiles, relative to the src folder.
+        """
+        self.enabled = enabled
+        self.threshold_s = threshold_ms / 1000
+        self.output_dir = Path(__file__).parent / output_dir
+        if enabled:
+            os.makedirs(self.output_dir, exist_ok=True)
+            logger.info('Profiling calls slower than %.0f ms into %s', threshold_ms, self.output_dir)
+
+    def start(self) -> tuple | None:
+        """Start profiling the current thread.
+
+        Returns:
+            tuple | None: A token to pass to ``finish``, or None if nothing is profiled.
+        """
+        if not self.enabled or not self._lock.acquire(blocking=False):
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiling tool is already active
+            self._lock.release()
+            return None
+        return profiler, time.perf_counter()
+
+    def finish(self, token: tuple | None, name: str):
+        """Stop profiling and keep the profile if the call was slow.
+
+        Args:
+            token (tuple | None): The token returned by ``start``.
+            name (str): Name of the profiled call.
+        """
+        if token is None:
+            return
+        profiler, start = token
+        try:
+            profiler.disable()
+            elapsed = time.perf_counter() - start
+            if elapsed >= self.threshold_s:
+                safe_name = re.sub(r'[^A-Za-z0-9_.-]+', '_', name).strip('_') or 'call'
+                filepath = self.output_dir / f"{safe_name}-{time.strftime('%Y%m%d-%H%M%S')}-{int(start * 1000) % 1000:03d}.prof"
+                profiler.dump_stats(filepath)
+                stats.increment('profiling.slow_calls')
+                logger.warning('%s took %.3f seconds, profile written to %s', name, elapsed, filepath)
+        finally:
+            self._lock.release()
+
+    @contextmanager
+    def profile(self, name: str):
+        """Context manager profiling the enclosed block.
+
+        Args:
+            name (str): Name of the profiled block.
+        """
+        token = self.start()
+        try:
+            yield
+        finally:
+            self.finish(token, name)
+
+# Singleton profiler shared by the web app and the collector
+slow_profiler = SlowCallProfiler()
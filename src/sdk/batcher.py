@@ -0,0 +1,171 @@
+"""Batcher module. Merges readings from all collector jobs into fewer, larger requests."""
+
+from collections import deque
+import logging
+import threading
+import time
+
+from block_timer import BlockTimer
+from config import config
+from stats_registry import stats
+
+from .metrics_api import MetricsAPI
+
+logger = logging.getLogger(__name__)
+
+class MetricsBatcher:
+    """Class queueing serialized readings and sending them from one background thread.
+
+    A batch is sent once ``max_batch_size`` readings are waiting or the oldest
+    one has waited ``max_delay_s``. Only one request is in flight at a time; a
+    failed batch goes back to the front of the queue and is retried after a
+    growing delay, or the ``Retry-After`` delay if longer. The queue holds at
+    most ``max_pending`` readings, dropping the oldest beyond that.
+    """
+
+    def __init__(self, max_batch_size: int, max_delay_s: float, max_pending: int, max_retry_delay_s: float):
+        """Initialize the MetricsBatcher class.
+
+        Args:
+            max_batch_size (int): Maximum number of readings per request.
+            max_delay_s (float): Maximum time a reading waits before being sent.
+            max_pending (int): Maximum number of queued readings.
+            max_retry_delay_s (float): Upper bound of the delay between retries.
+        """
+        self.max_batch_size = max_batch_size
+        self.max_delay_s = max_delay_s
+        self.max_pending = max_pending
+        self.max_retry_delay_s = max_retry_delay_s
+        self.last_status_code = None
+        self._pending: deque[tuple[float, dict]] = deque()
+        self._condition = threading.Condition()
+        self._closing = False
+        self._thread = threading.Thread(target=self._run, name='metrics-batcher', daemon=True)
+
+    @classmethod
+    def from_config(cls) -> "MetricsBatcher":
+        """Create the batcher described by the configuration.
+
+        Returns:
+            MetricsBatcher: The configured batcher.
+        """
+        batch = config.collector.batch
+        return cls(batch.max_batch_size, batch.max_delay_s, batch.max_pending, batch.max_retry_delay_s)
+
+    @property
+    def backlog(self) -> int:
+        """Return the number of queued readings.
+
+        Returns:
+            int: The number of readings waiting to be sent.
+        """
+        return len(self._pending)
+
+    @property
+    def congested(self) -> bool:
+        """Return whether the server is not keeping up with the collected readings.
+
+        Returns:
+            bool: True if more than a full batch is waiting or the server asked to slow down.
+        """
+        return self.backlog > self.max_batch_size or self.last_status_code in (429, 503)
+
+    def start(self):
+        """Start the sending thread."""
+        self._thread.start()
+
+    def add(self, readings: list[dict]):
+        """Queue serialized readings for sending.
+
+        Args:
+            readings (list[dict]): The serialized readings.
+        """
+        if not readings:
+            return
+        now = time.monotonic()
+        with self._condition:
+            self._pending.extend((now, reading) for reading in readings)
+            self._trim()
+            stats.set_gauge('batcher.backlog', len(self._pending))
+            if len(self._pending) >= self.max_batch_size:
+                self._condition.notify()
+
+    def close(self, timeout: float = 10):
+        """Send the queued readings and stop the sending thread.
+
+        Args:
+            timeout (float): Seconds to wait for the last batches.
+        """
+        with self._condition:
+            self._closing = True
+            self._condition.notify()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+        if self._pending:
+            logger.warning('Dropping %d unsent readings on shutdown', len(self._pending))
+
+    def _run(self):
+        """Send batches until closed."""
+        retry_delay = self.max_delay_s
+        while True:
+            with self._condition:
+                while not self._closing and not self._due():
+                    self._condition.wait(self._time_until_due())
+                if not self._pending:
+                    return
+                batch = [self._pending.popleft() for _ in range(min(self.max_batch_size, len(self._pending)))]
+
+            with BlockTimer('batcher.send'):
+                status_code, unsent = MetricsAPI.post_metrics([reading for _, reading in batch])
+            self.last_status_code = status_code
+            stats.increment('batcher.readings_sent', len(batch) - len(unsent))
+            if not unsent:
+                stats.increment('batcher.requests')
+                retry_delay = self.max_delay_s
+                continue
+
+            # Only the readings not sent yet go back to the queue
+            unsent_ids = {id(reading) for reading in unsent}
+            batch = [item for item in batch if id(item[1]) in unsent_ids]
+            with self._condition:
+                self._pending.extendleft(reversed(batch))
+                self._trim()
+                if self._closing:
+                    return
+                # Wait at least as long as the web app asked with Retry-After
+                delay = max(retry_delay, MetricsAPI.retry_after())
+                logger.warning('Retrying %d readings in %gs', len(batch), delay)
+                # New readings must not cut the delay short, only closing does
+                deadline = time.monotonic() + delay
+                while not self._closing and (remaining := deadline - time.monotonic()) > 0:
+                    self._condition.wait(remaining)
+            retry_delay = min(retry_delay * 2, self.max_retry_delay_s)
+
+    def _due(self) -> bool:
+        """Return whether a batch should be sent now. Requires the condition lock.
+
+        Returns:
+            bool: True if a full batch is waiting or the oldest reading waited long enough.
+        """
+        return len(self._pending) >= self.max_batch_size or (
+            bool(self._pending) and time.monotonic() - self._pending[0][0] >= self.max_delay_s
+        )
+
+    def _time_until_due(self) -> float | None:
+        """Return how long until the oldest reading must be sent. Requires the condition lock.
+
+        Returns:
+            float | None: Seconds to wait, or None to wait for new readings.
+        """
+        if not self._pending:
+            return None
+        return max(self.max_delay_s - (time.monotonic() - self._pending[0][0]), 0)
+
+    def _trim(self):
+        """Drop the oldest readings beyond the queue bound. Requires the condition lock."""
+        dropped = len(self._pending) - self.max_pending
+        if dropped > 0:
+            for _ in range(dropped):
+                self._pending.popleft()
+            stats.increment('batcher.readings_dropped', dropped)
+            logger.warning('Batcher queue full, dropped the %d oldest readings', dropped)
@@ -1,56 +1,157 @@
-from time import sleep
+from time import monotonic, sleep
 import json
 import logging
 import requests
 from config import config
+from stats_registry import stats
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 import os
 import subprocess
 
+from .resilience import CircuitOpenError, ResilientClient
+
 logger = logging.getLogger(__name__)
 
+def _retrying_session() -> requests.Session:
+    """Create a session retrying failed requests to the web app.
+
+    Returns:
+        requests.Session: The session.
+    """
+    # Setup retry strategy
+    retry_strategy = Retry(
+        total=3,
+        backoff_factor=1,
+        status_forcelist=[500, 502, 503, 504],  # Status codes that trigger a retry
+        allowed_methods=["HEAD", "GET", "OPTIONS", "POST"],  # HTTP methods to retry
+        # MetricsAPI defers sending on Retry-After instead of sleeping here, holding the caller
+        respect_retry_after_header=False,
+        raise_on_status=False  # Return the final response so its status code is known
+    )
+    adapter = HTTPAdapter(max_retries=retry_strategy)
+    http = requests.Session()
+    http.mount("https://", adapter)
+    http.mount("http://", adapter)
+    return http
+
 class MetricsAPI:
     """Class to handle metrics API interactions."""
     failed_data = []
+    # Monotonic time before which the web app asked not to send again
+    retry_at = 0.0
+    # Polls take the pending message, so requests to the web app are never hedged
+    server = ResilientClient('server', session=_retrying_session())
 
     @staticmethod
     def send_metrics(data: list):
         """Send metrics data to the web app.
 
+        Readings that could not be sent are kept and sent first next time, up
+        to ``collector.batch.max_pending`` of them; the oldest are dropped beyond that.
+
         Args:
             data (list): List of metrics data to send.
+
+        Returns:
+            int | None: The status code of the last response, None if the web app could not be reached.
         """
-        url = config.server.url + '/store_metrics'
-        headers = {'Content-Type': 'application/json'}
-        
-        # Setup retry strategy
-        retry_strategy = Retry(
-            total=3,
-            backoff_factor=1,
-            status_forcelist=[429, 500, 502, 503, 504],  # Status codes that trigger a retry
-            allowed_methods=["HEAD", "GET", "OPTIONS", "POST"]  # HTTP methods to retry
-        )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
-        http = requests.Session()
-        http.mount("https://", adapter)
-        http.mount("http://", adapter)
-        
         # Include previously failed data
         if MetricsAPI.failed_data:
             data = MetricsAPI.failed_data + data
 
-        try:
-            response = http.post(url, data=json.dumps(data), headers=headers)
-            response.raise_for_status()
-            # Clear failed data if request is successful
-            MetricsAPI.failed_data = []
-            return response.status_code
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Failed to send metrics to web app: {e}")
-            # Store failed data
-            MetricsAPI.failed_data = data
-            return None
+        status_code, unsent = MetricsAPI.post_metrics(data)
+        dropped = len(unsent) - config.collector.batch.max_pending
+        if dropped > 0:
+            logger.warning("Dropping the %d oldest unsent readings", dropped)
+            stats.increment('metrics_api.readings_dropped', dropped)
+            unsent = unsent[dropped:]
+        # Keep failed data for the next send
+        MetricsAPI.failed_data = unsent
+        return status_code
+
+    @staticmethod
+    def post_metrics(data: list) -> tuple[int | None, list]:
+        """Post metrics data to the web app once, leaving retries to the caller.
+
+        The readings are sent in requests below ``admission.max_payload_bytes``.
+        A request refused as too large (413) is split in two and resent; a
+        single reading refused as too large is dropped. A reading the web app
+        rejects as malformed (400 with its ``index``) is dropped and the others
+        resent; a payload refused with any other client error is dropped, since
+        resending it cannot succeed. Sending stops at the first other failure.
+
+        Args:
+            data (list): List of metrics data to send.
+
+        Returns:
+            tuple[int | None, list]: The status code of the last response, None if none was
+                received, and the readings not sent, oldest first; all were sent if none is left.
+        """
+        if MetricsAPI.retry_after() > 0:
+            logger.debug("Holding back %d readings until the web app accepts them again", len(data))
+            return None, data
+
+        url = config.server.url + '/store_metrics'
+        headers = {'Content-Type': 'application/json'}
+        status_code = None
+        # Payloads left to send, the next one last
+        payloads = _payloads(data, config.admission.max_payload_bytes)[::-1]
+        while payloads:
+            payload = payloads.pop()
+            try:
+                response = MetricsAPI.server.post(url, data=json.dumps(payload), headers=headers)
+                status_code = response.status_code
+                retry_after = response.headers.get('Retry-After', '')
+                if response.status_code in (429, 503) and retry_after.isdigit():
+                    MetricsAPI.retry_at = monotonic() + int(retry_after)
+                if response.status_code == 413:
+                    if len(payload) > 1:
+                        # Never resend the same payload, send each half on its own
+                        payloads += [payload[len(payload) // 2:], payload[:len(payload) // 2]]
+                    else:
+                        logger.error("Dropping a reading the web app refuses as too large")
+                        stats.increment('metrics_api.readings_dropped')
+                    continue
+                if MetricsAPI.rejected(response.status_code):
+                    index = _rejected_index(response, len(payload))
+                    if index is not None and len(payload) > 1:
+                        # Resend the readings around the one the web app refuses
+                        logger.error("Dropping reading refused by the web app: %s", response.text)
+                        stats.increment('metrics_api.readings_dropped')
+                        payloads.append(payload[:index] + payload[index + 1:])
+                    else:
+                        logger.error("Dropping %d readings refused by the web app: %s", len(payload), response.text)
+                        stats.increment('metrics_api.readings_dropped', len(payload))
+                    continue
+                response.raise_for_status()
+            except requests.exceptions.RequestException as e:
+                logger.error(f"Failed to send metrics to web app: {e}")
+                if e.response is None:
+                    status_code = None
+                return status_code, [reading for payload in [payload, *payloads[::-1]] for reading in payload]
+        return status_code, []
+
+    @staticmethod
+    def retry_after() -> float:
+        """Return how long the web app asked to wait before sending again.
+
+        Returns:
+            float: Seconds left, 0 once sending is allowed.
+        """
+        return max(MetricsAPI.retry_at - monotonic(), 0.0)
+
+    @staticmethod
+    def rejected(status_code: int | None) -> bool:
+        """Tell whether the web app refused readings for good, so resending them cannot succeed.
+
+        Args:
+            status_code (int | None): The status code of the response, None if none was received.
+
+        Returns:
+            bool: True for client errors other than timeouts and rate limiting.
+        """
+        return status_code is not None and 400 <= status_code < 500 and status_code not in (408, 429)
 
     @staticmethod
     def poll_for_message(interval: int = 3):
@@ -61,10 +162,15 @@ class MetricsAPI:
         """
         logger.info("Beginning polling for messages")
         while True:
-            data = requests.get(config.server.url + '/poll_message')
-            logger.debug(f"Polling for message: {data.status_code}")
-            if data.status_code == 200 and data.json().get("message"):
-                _open_win_app(data.json().get("message"))
+            try:
+                data = MetricsAPI.server.get(config.server.url + '/poll_message')
+                logger.debug(f"Polling for message: {data.status_code}")
+                if data.status_code == 200 and data.json().get("message"):
+                    _open_win_app(data.json().get("message"))
+            except CircuitOpenError:
+                logger.debug("Skipping poll, the web app circuit is open")
+            except (requests.exceptions.RequestException, ValueError) as e:
+                logger.error("Failed to poll for message: %s", e)
             sleep(interval)
 
 def _open_win_app(app_name: str):
@@ -89,3 +195,42 @@ def _open_win_app(app_name: str):
                 logger.error("Failed to open %s: %s", app_name, e)
     else:
         logger.error("%s can only be opened on Windows systems.", app_name)
+
+def _rejected_index(response: requests.Response, size: int) -> int | None:
+    """Return the index of the reading a refusal names, if any.
+
+    Args:
+        response (requests.Response): The refusal from the web app.
+        size (int): Number of readings in the refused payload.
+
+    Returns:
+        int | None: The index of the malformed reading, None if the refusal is about the whole payload.
+    """
+    try:
+        index = response.json().get('index')
+    except (ValueError, AttributeError):
+        return None
+    return index if isinstance(index, int) and 0 <= index < size else None
+
+def _payloads(data: list, max_bytes: int) -> list[list]:
+    """Split readings into consecutive payloads whose JSON stays below a size.
+
+    Args:
+        data (list): The serialized readings.
+        max_bytes (int): Maximum size of a payload in bytes. A larger reading gets a payload of its own.
+
+    Returns:
+        list[list]: The payloads, in order.
+    """
+    payloads = [[]]
+    # Opening and closing brackets
+    size = 2
+    for reading in data:
+        # The reading and the separator before it
+        reading_size = len(json.dumps(reading).encode()) + 2
+        if payloads[-1] and size + reading_size > max_bytes:
+            payloads.append([])
+            size = 2
+        payloads[-1].append(reading)
+        size += reading_size
+    return [payload for payload in payloads if payload]
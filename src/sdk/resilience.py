@@ -0,0 +1,191 @@
+"""Resilience module. Timeouts, circuit breaking and hedging for outbound HTTP calls."""
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import logging
+import threading
+import time
+import requests
+
+from config import config
+from stats_registry import stats
+
+logger = logging.getLogger(__name__)
+
+# Threads running hedged requests
+_hedge_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='hedged-request')
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised instead of calling a dependency whose circuit is open."""
+
+class CircuitBreaker:
+    """Class failing calls fast while a dependency keeps failing.
+
+    After ``failure_threshold`` consecutive failures the circuit opens and
+    calls are rejected. Once ``reset_timeout_s`` has passed a single probe
+    call is let through; its outcome closes or re-opens the circuit.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+    STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout_s: float):
+        """Initialize the CircuitBreaker class.
+
+        Args:
+            name (str): Name of the dependency, used in logs and stats.
+            failure_threshold (int): Consecutive failures opening the circuit.
+            reset_timeout_s (float): Seconds before an open circuit lets a probe through.
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_s = reset_timeout_s
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+        stats.set_gauge(f'breaker.{name}.state', self.STATE_VALUES[self.state])
+
+    def allow(self) -> bool:
+        """Check if a call may go through.
+
+        Returns:
+            bool: True if the call may be made, False if it must be rejected.
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout_s:
+                self._transition(self.HALF_OPEN)
+                return True
+            return False
+
+    def record_success(self):
+        """Record a successful call."""
+        with self._lock:
+            self.failures = 0
+            if self.state != self.CLOSED:
+                self._transition(self.CLOSED)
+
+    def record_failure(self):
+        """Record a failed call."""
+        with self._lock:
+            self.failures += 1
+            stats.increment(f'breaker.{self.name}.failures')
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+                self.opened_at = time.monotonic()
+                self._transition(self.OPEN)
+
+    def _transition(self, state: str):
+        """Change state, logging it and publishing it to the stats registry.
+
+        Args:
+            state (str): The new state.
+        """
+        level = logging.WARNING if state == self.OPEN else logging.INFO
+        logger.log(level, 'Circuit breaker "%s" %s -> %s after %d consecutive failures', self.name, self.state, state, self.failures)
+        self.state = state
+        stats.set_gauge(f'breaker.{self.name}.state', self.STATE_VALUES[state])
+        stats.increment(f'breaker.{self.name}.{state}')
+
+class ResilientClient:
+    """HTTP client applying timeouts, a circuit breaker and optional hedging to one dependency."""
+
+    def __init__(self, name: str, hedge_after_s: float | None = None, session: requests.Session | None = None):
+        """Initialize the ResilientClient class.
+
+        Args:
+            name (str): Name of the dependency.
+            hedge_after_s (float | None): Delay before a GET is duplicated, None to never hedge.
+                Only use hedging for dependencies whose GETs are idempotent.
+            session (requests.Session | None): Session to send requests with, plain requests if None.
+        """
+        self.name = name
+        self.hedge_after_s = hedge_after_s
+        self.session = session or requests
+        self.timeout = (config.http.connect_timeout_s, config.http.read_timeout_s)
+        self.breaker = CircuitBreaker(name, config.http.failure_threshold, config.http.reset_timeout_s)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """Send a GET request, hedged if configured.
+
+        Args:
+            url (str): The URL to request.
+            **kwargs: Extra arguments for ``requests``.
+
+        Returns:
+            requests.Response: The response.
+        """
+        if self.hedge_after_s:
+            return self._call(self._hedged_get, url, **kwargs)
+        return self._call(self.session.get, url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        """Send a POST request. POSTs are never hedged.
+
+        Args:
+            url (str): The URL to request.
+            **kwargs: Extra arguments for ``requests``.
+
+        Returns:
+            requests.Response: The response.
+        """
+        return self._call(self.session.post, url, **kwargs)
+
+    def _call(self, send, url: str, **kwargs) -> requests.Response:
+        """Send a request through the circuit breaker.
+
+        Args:
+            send: Function sending the request.
+            url (str): The URL to request.
+            **kwargs: Extra arguments for ``requests``.
+
+        Returns:
+            requests.Response: The response.
+
+        Raises:
+            CircuitOpenError: If the circuit is open.
+        """
+        if not self.breaker.allow():
+            stats.increment(f'breaker.{self.name}.rejected')
+            raise CircuitOpenError(f'Circuit breaker "{self.name}" is open')
+
+        kwargs.setdefault('timeout', self.timeout)
+        try:
+            response = send(url, **kwargs)
+        except BaseException:
+            # Any error counts, or a failed half-open probe would leave the circuit half open
+            self.breaker.record_failure()
+            raise
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    def _hedged_get(self, url: str, **kwargs) -> requests.Response:
+        """Send a GET and a second copy if the first is slower than the hedge delay.
+
+        Args:
+            url (str): The URL to request.
+            **kwargs: Extra arguments for ``requests``.
+
+        Returns:
+            requests.Response: The first successful response.
+        """
+        pending = {_hedge_executor.submit(self.session.get, url, **kwargs)}
+        done, pending = wait(pending, timeout=self.hedge_after_s)
+        if not done:
+            stats.increment(f'hedge.{self.name}.sent')
+            pending.add(_hedge_executor.submit(self.session.get, url, **kwargs))
+
+        error = None
+        while True:
+            for future in done:
+                try:
+                    return future.result()
+                except requests.exceptions.RequestException as e:
+                    error = e
+            if not pending:
+                raise error
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
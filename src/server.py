@@ -0,0 +1,134 @@
+"""Production server module. Serves the app from a pool of pre-forked worker processes."""
+
+import logging
+import os
+import signal
+import socket
+import time
+from werkzeug.serving import make_server
+
+from config import config
+from logger import flush_logs
+
+logger = logging.getLogger(__name__)
+
+# Exit status of a worker that stopped on an exception
+WORKER_FAILED = 1
+# Delay before respawning a worker that crashed, doubled on every crash in a row
+RESPAWN_BACKOFF_S = 1.0
+MAX_RESPAWN_BACKOFF_S = 60.0
+# Uptime after which a worker's earlier crashes are forgotten
+STABLE_UPTIME_S = 60.0
+
+def serve(workers: int):
+    """Serve the app from pre-forked worker processes sharing one listening socket.
+
+    The parent process creates the schema, then only supervises: it
+    respawns workers that exit, at once after a clean exit and otherwise
+    (a nonzero status or a signal) waiting longer after each crash in a row.
+    It stops them all on SIGINT/SIGTERM. Platforms without ``os.fork`` fall
+    back to a single threaded process.
+
+    Args:
+        workers (int): Number of worker processes.
+    """
+    from data.storage import Storage
+
+    # Create the schema once, before forking, so workers do not race on it
+    storage = Storage.from_config()
+    storage.create_all()
+    storage.dispose()
+
+    if not hasattr(os, 'fork') or workers <= 1:
+        if workers > 1:
+            logger.warning('Pre-forked workers are not supported on this platform, serving from one process')
+        from app import create_app
+        make_server(config.server.host, config.server.port, create_app(create_schema=False), threaded=True).serve_forever()
+        return
+
+    listener = socket.create_server((config.server.host, config.server.port), backlog=128)
+    listener.set_inheritable(True)
+
+    children: dict[int, int] = {}
+    started: dict[int, float] = {}
+    crashes: dict[int, int] = {}
+    stopping = False
+
+    def spawn(index: int):
+        pid = os.fork()
+        if pid == 0:
+            status = WORKER_FAILED
+            try:
+                _run_worker(listener, index, workers)
+                status = 0
+            except SystemExit as e:
+                status = e.code if isinstance(e.code, int) else WORKER_FAILED
+            except BaseException:
+                logger.exception('Worker %d (pid %d) failed', index, os.getpid())
+            finally:
+                flush_logs()
+                os._exit(status)
+        children[pid] = index
+        started[index] = time.monotonic()
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for index in range(workers):
+        spawn(index)
+    logger.info('Serving on %s:%d with %d worker processes', config.server.host, config.server.port, workers)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        index = children.pop(pid, None)
+        if index is None or stopping:
+            continue
+        uptime = time.monotonic() - started[index]
+        # Negative for a worker killed by a signal
+        exit_code = os.waitstatus_to_exitcode(status)
+        if exit_code == 0:
+            crashes[index] = 0
+            delay = 0.0
+            logger.warning('Worker %d (pid %d) exited after %.0fs, restarting it', index, pid, uptime)
+        else:
+            crashes[index] = 1 if uptime >= STABLE_UPTIME_S else crashes.get(index, 0) + 1
+            delay = min(RESPAWN_BACKOFF_S * 2 ** (crashes[index] - 1), MAX_RESPAWN_BACKOFF_S)
+            logger.error('Worker %d (pid %d) exited with status %d after %.0fs, restarting it in %gs', index, pid, exit_code, uptime, delay)
+        deadline = time.monotonic() + delay
+        while not stopping and (remaining := deadline - time.monotonic()) > 0:
+            time.sleep(min(remaining, 0.5))
+        if not stopping:
+            spawn(index)
+
+    listener.close()
+    logger.info('All workers stopped')
+
+def _run_worker(listener: socket.socket, index: int, workers: int):
+    """Create the app and serve requests from the shared socket.
+
+    Args:
+        listener (socket.socket): The listening socket inherited from the parent.
+        index (int): Index of the worker, used in logs.
+        workers (int): Number of worker processes.
+    """
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    from app import create_app
+    # The supervisor created the schema before forking
+    app = create_app(workers, create_schema=False)
+    server = make_server(config.server.host, config.server.port, app, threaded=True, fd=listener.fileno())
+    logger.info('Worker %d (pid %d) ready', index, os.getpid())
+    server.serve_forever()
@@ -0,0 +1,54 @@
+"""Stats exporter module. Serves the stats registry of processes running without the web app."""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import logging
+import threading
+from urllib.parse import parse_qs, urlparse
+
+from stats_registry import stats
+
+logger = logging.getLogger(__name__)
+
+class StatsRequestHandler(BaseHTTPRequestHandler):
+    """Handler answering ``/internal/stats`` like the web app route of the same path."""
+
+    def do_GET(self):
+        """Send the registry as JSON, or in the Prometheus text format with ``format=prometheus``."""
+        url = urlparse(self.path)
+        if url.path != '/internal/stats':
+            self.send_error(404)
+            return
+        if parse_qs(url.query).get('format', ['json'])[0] == 'prometheus':
+            body, content_type = stats.to_prometheus().encode(), 'text/plain; version=0.0.4'
+        else:
+            body, content_type = json.dumps(stats.to_dict()).encode(), 'application/json'
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args):
+        """Log requests at debug level instead of writing them to stderr.
+
+        Args:
+            format (str): The message format.
+            *args: The message arguments.
+        """
+        logger.debug(format, *args)
+
+def start_stats_server(host: str, port: int) -> ThreadingHTTPServer:
+    """Serve the stats registry from a background thread.
+
+    Args:
+        host (str): The interface to listen on.
+        port (int): The port to listen on, 0 for any free port.
+
+    Returns:
+        ThreadingHTTPServer: The running server, stopped with ``shutdown``.
+    """
+    server = ThreadingHTTPServer((host, port), StatsRequestHandler)
+    threading.Thread(target=server.serve_forever, name='stats-exporter', daemon=True).start()
+    logger.info('Serving stats on http://%s:%d/internal/stats', host, server.server_address[1])
+    return server
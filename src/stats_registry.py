@@ -0,0 +1,213 @@
+"""In-process registry of latency histograms, counters and gauges keyed by name."""
+
+import bisect
+import threading
+
+# Upper bounds (seconds) of the fixed latency buckets; the last bucket is +Inf
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+class Histogram:
+    """Fixed-bucket latency histogram."""
+
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        """Initialize the Histogram.
+
+        Args:
+            buckets (tuple): Sorted bucket upper bounds in seconds.
+        """
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        """Record a single observation.
+
+        Args:
+            value (float): The observed duration in seconds.
+        """
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    def snapshot(self) -> tuple:
+        """Return a consistent copy of the histogram state.
+
+        Returns:
+            tuple: (bucket counts, count, sum, max).
+        """
+        with self._lock:
+            return list(self.counts), self.count, self.sum, self.max
+
+    def quantile(self, q: float, counts: list | None = None, count: int | None = None, max_value: float | None = None) -> float | None:
+        """Estimate a quantile by linear interpolation inside the matching bucket.
+
+        Args:
+            q (float): The quantile to estimate, between 0 and 1.
+            counts (list | None): Bucket counts to use instead of the live ones.
+            count (int | None): Total count matching ``counts``.
+            max_value (float | None): Largest observation matching ``counts``.
+
+        Returns:
+            float | None: The estimated quantile in seconds, or None if empty.
+        """
+        if counts is None:
+            counts, count, _, max_value = self.snapshot()
+        if not count:
+            return None
+
+        rank = q * count
+        cumulative = 0
+        for index, bucket_count in enumerate(counts):
+            if cumulative + bucket_count >= rank and bucket_count:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else max_value
+                upper = min(upper, max_value)
+                lower = min(lower, upper)
+                return lower + (upper - lower) * ((rank - cumulative) / bucket_count)
+            cumulative += bucket_count
+        return max_value
+
+class StatsRegistry:
+    """Registry of histograms, counters and gauges shared by the whole process."""
+
+    def __init__(self):
+        """Initialize the StatsRegistry."""
+        self.histograms: dict[str, Histogram] = {}
+        self.counters: dict[str, int] = {}
+        self.gauges: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name: str) -> Histogram:
+        """Return the histogram for a name, creating it on first use.
+
+        Args:
+            name (str): The block name.
+
+        Returns:
+            Histogram: The histogram registered under the name.
+        """
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(name, Histogram())
+        return histogram
+
+    def observe(self, name: str, value: float):
+        """Record a duration for a block.
+
+        Args:
+            name (str): The block name.
+            value (float): The duration in seconds.
+        """
+        self.histogram(name).observe(value)
+
+    def increment(self, name: str, amount: int = 1):
+        """Increment a counter.
+
+        Args:
+            name (str): The counter name.
+            amount (int): The amount to add.
+        """
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def set_gauge(self, name: str, value: float):
+        """Set a gauge to its current value.
+
+        Args:
+            name (str): The gauge name.
+            value (float): The current value.
+        """
+        with self._lock:
+            self.gauges[name] = value
+
+    def reset(self):
+        """Drop all recorded data."""
+        with self._lock:
+            self.histograms = {}
+            self.counters = {}
+            self.gauges = {}
+
+    def to_dict(self) -> dict:
+        """Summarise the registry as a JSON-serialisable dict.
+
+        Returns:
+            dict: Timers with count/sum/max/p50/p90/p99, counters and gauges.
+        """
+        timers = {}
+        for name, histogram in list(self.histograms.items()):
+            counts, count, total, max_value = histogram.snapshot()
+            timers[name] = {
+                'count': count,
+                'sum_s': total,
+                'mean_s': total / count if count else None,
+                'max_s': max_value,
+                'p50_s': histogram.quantile(0.5, counts, count, max_value),
+                'p90_s': histogram.quantile(0.9, counts, count, max_value),
+                'p99_s': histogram.quantile(0.99, counts, count, max_value),
+            }
+        with self._lock:
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+        return {'timers': timers, 'counters': counters, 'gauges': gauges}
+
+    def to_prometheus(self) -> str:
+        """Render the registry in the Prometheus text exposition format.
+
+        Returns:
+            str: The exposition text.
+        """
+        lines = [
+            '# HELP block_duration_seconds Duration of timed code blocks.',
+            '# TYPE block_duration_seconds histogram',
+        ]
+        for name, histogram in sorted(self.histograms.items()):
+            counts, count, total, _ = histogram.snapshot()
+            label = _escape_label(name)
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'block_duration_seconds_bucket{{block="{label}",le="{bound}"}} {cumulative}')
+            lines.append(f'block_duration_seconds_bucket{{block="{label}",le="+Inf"}} {count}')
+            lines.append(f'block_duration_seconds_sum{{block="{label}"}} {total}')
+            lines.append(f'block_duration_seconds_count{{block="{label}"}} {count}')
+
+        with self._lock:
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+        if counters:
+            lines.append('# HELP events_total Event counters.')
+            lines.append('# TYPE events_total counter')
+            for name, value in sorted(counters.items()):
+                lines.append(f'events_total{{name="{_escape_label(name)}"}} {value}')
+
+        if gauges:
+            lines.append('# HELP gauge_value Current value of gauges.')
+            lines.append('# TYPE gauge_value gauge')
+            for name, value in sorted(gauges.items()):
+                lines.append(f'gauge_value{{name="{_escape_label(name)}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+def _escape_label(value: str) -> str:
+    """Escape a Prometheus label value.
+
+    Args:
+        value (str): The raw label value.
+
+    Returns:
+        str: The escaped label value.
+    """
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+# Singleton registry used throughout the application
+stats = StatsRegistry()
@@ -0,0 +1,120 @@
+"""Timestamp conversions between datetimes, the wire format and the database.
+
+Readings are timestamped with naive local datetimes. In the ``epoch_ms``
+mode (``timestamps.mode``) they travel and are stored as integer milliseconds
+since the Unix epoch, in UTC; in the ``datetime`` mode they travel as
+``%Y-%m-%d %H:%M:%S`` strings and are stored as ISO strings.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+from config import config
+
+DATETIME = 'datetime'
+EPOCH_MS = 'epoch_ms'
+
+# Format of timestamps sent by collectors in the datetime mode
+WIRE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Format of timestamps stored in the datetime mode, as written by SQLAlchemy's DateTime
+STORAGE_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+# Range of parsed timestamps, a day inside the datetime range so that
+# timezone conversions and bucket widening cannot overflow
+MIN_TIMESTAMP = datetime.min + timedelta(days=1)
+MAX_TIMESTAMP = datetime.max - timedelta(days=1)
+
+# Range of epoch milliseconds, two days inside the datetime range so that the
+# local time of any of them stays between MIN_TIMESTAMP and MAX_TIMESTAMP
+MIN_MS = round(datetime(1, 1, 3, tzinfo=timezone.utc).timestamp() * 1000)
+MAX_MS = round(datetime(9999, 12, 30, tzinfo=timezone.utc).timestamp() * 1000)
+
+def epoch_mode() -> bool:
+    """Return whether timestamps travel and are stored as epoch milliseconds.
+
+    Returns:
+        bool: True in the ``epoch_ms`` mode.
+    """
+    return config.timestamps.mode == EPOCH_MS
+
+def to_ms(timestamp: datetime) -> int:
+    """Convert a datetime to epoch milliseconds.
+
+    Args:
+        timestamp (datetime): The datetime, naive datetimes being local time.
+
+    Returns:
+        int: Milliseconds since the Unix epoch.
+    """
+    return round(timestamp.timestamp() * 1000)
+
+def from_ms(timestamp_ms: int) -> datetime:
+    """Convert epoch milliseconds to a naive local datetime.
+
+    Args:
+        timestamp_ms (int): Milliseconds since the Unix epoch.
+
+    Returns:
+        datetime: The local datetime.
+    """
+    return datetime.fromtimestamp(timestamp_ms / 1000)
+
+def to_wire(timestamp: datetime) -> int | str:
+    """Convert a datetime to the format sent by collectors.
+
+    Args:
+        timestamp (datetime): The datetime.
+
+    Returns:
+        int | str: Epoch milliseconds, or a formatted string in the datetime mode.
+    """
+    return to_ms(timestamp) if epoch_mode() else timestamp.strftime(WIRE_FORMAT)
+
+def from_wire(value: int | float | str) -> datetime:
+    """Parse a timestamp received from a collector or read from a file.
+
+    Both modes are accepted whatever the configured mode, so collectors can
+    be switched one at a time.
+
+    Args:
+        value (int | float | str): Epoch milliseconds, or a formatted or ISO string.
+
+    Returns:
+        datetime: The naive local datetime.
+
+    Raises:
+        ValueError: If the value is not a timestamp or is out of the supported range.
+    """
+    if not isinstance(value, str) or value.isdigit():
+        return from_ms(parse_ms(value))
+    timestamp = datetime.fromisoformat(value)
+    if not MIN_TIMESTAMP <= timestamp.replace(tzinfo=None) <= MAX_TIMESTAMP:
+        raise ValueError(f'Timestamp out of range: {value}')
+    return timestamp
+
+def parse_ms(value: int | float | str) -> int:
+    """Parse a timestamp received from a collector or read from a file to epoch milliseconds.
+
+    Epoch milliseconds are only range checked, so readings sent in the
+    ``epoch_ms`` mode reach the database without a conversion.
+
+    Args:
+        value (int | float | str): Epoch milliseconds, or a formatted or ISO string.
+
+    Returns:
+        int: Milliseconds since the Unix epoch.
+
+    Raises:
+        ValueError: If the value is not a timestamp or is out of the supported range.
+    """
+    if isinstance(value, str) and not value.isdigit():
+        return to_ms(from_wire(value))
+    if isinstance(value, bool):
+        raise ValueError(f'Not a timestamp: {value}')
+    try:
+        timestamp_ms = int(value)
+    except OverflowError as e:
+        raise ValueError(f'Timestamp out of range: {value}') from e
+    if not MIN_MS <= timestamp_ms <= MAX_MS:
+        raise ValueError(f'Timestamp out of range: {value}')
+    return timestamp_ms
@@ -0,0 +1,9 @@
+"""Pytest configuration. Makes the modules under src importable the way the entry point imports them."""
+
+from pathlib import Path
+import sys
+
+SRC_DIR = Path(__file__).resolve().parent.parent / 'src'
+
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
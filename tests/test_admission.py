@@ -0,0 +1,82 @@
+"""Admission control of /store_metrics: payload size, concurrency and per-device rate."""
+
+import threading
+
+import pytest
+
+from config import config
+
+def _readings(device_id: str, count: int) -> list[dict]:
+    """Build serialized readings of one device, as sent by the collector."""
+    return [
+        {
+            'device': {'id': device_id, 'name': device_id},
+            'metric_type': {'id': -1, 'name': 'CPU', 'min_value': 0, 'max_value': 100},
+            'unit': None,
+            'timestamp': 1_700_000_000_000 + index * 1000,
+            'value': float(index),
+            'id': f'{device_id}-{index}',
+        }
+        for index in range(count)
+    ]
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """Yield a test client of the app admitting bursts of 5 readings per device, one request at a time."""
+    monkeypatch.setattr(config.database, 'db_engine', f'sqlite:///{tmp_path / "catalog.db"}')
+    monkeypatch.setattr(config.database, 'shards', 1)
+    monkeypatch.setattr(config.hot_tier, 'enabled', False)
+    monkeypatch.setattr(config.analytics, 'enabled', False)
+    monkeypatch.setattr(config.admission, 'enabled', True)
+    monkeypatch.setattr(config.admission, 'device_burst', 5)
+    monkeypatch.setattr(config.admission, 'device_rate', 1.0)
+    monkeypatch.setattr(config.admission, 'max_concurrent', 1)
+    monkeypatch.setattr(config.admission, 'max_payload_bytes', 10_000)
+    monkeypatch.setattr(config.admission, 'retry_after_s', 3)
+
+    from app import create_app
+    yield create_app().test_client()
+
+def test_length_required(client):
+    # A chunked body has no Content-Length
+    response = client.post('/store_metrics', data=b'[]', headers={'Content-Type': 'application/json', 'Transfer-Encoding': 'chunked'})
+    assert response.status_code == 411
+
+def test_payload_too_large(client):
+    response = client.post('/store_metrics', json=_readings('d1', 100))
+    assert response.status_code == 413
+
+def test_device_over_its_rate(client):
+    assert client.post('/store_metrics', json=_readings('d1', 4)).status_code == 201
+
+    response = client.post('/store_metrics', json=_readings('d1', 3))
+    assert response.status_code == 429
+    # One token is left, two more come back at one per second
+    assert response.headers['Retry-After'] == '2'
+    # Other devices have buckets of their own
+    assert client.post('/store_metrics', json=_readings('d2', 5)).status_code == 201
+
+def test_concurrent_request_over_the_limit(client, monkeypatch):
+    from data.ingest import MetricsIngestor
+    storing, release = threading.Event(), threading.Event()
+    store = MetricsIngestor.store
+
+    def slow_store(self, metrics_data):
+        storing.set()
+        release.wait(5)
+        return store(self, metrics_data)
+
+    monkeypatch.setattr(MetricsIngestor, 'store', slow_store)
+    first = threading.Thread(target=client.post, args=('/store_metrics',), kwargs={'json': _readings('d1', 1)})
+    first.start()
+    try:
+        assert storing.wait(5)
+        response = client.post('/store_metrics', json=_readings('d2', 1))
+    finally:
+        release.set()
+        first.join()
+
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '3'
+    # The slot is given back once the first request is done
+    assert client.post('/store_metrics', json=_readings('d2', 1)).status_code == 201
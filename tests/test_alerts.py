@@ -0,0 +1,39 @@
+"""Threshold and anomaly alerts, on gauges and on cumulative counters."""
+
+from data.alerts import ANOMALY, THRESHOLD_CLEAR, THRESHOLD_HIGH, AlertEvaluator
+
+# Epoch milliseconds of the first reading
+START = 1_704_067_200_000
+CPU = (1, 'CPUUsage', 0, 100)
+NETWORK = (2, 'NetworkSend', 0, 1_000_000_000)
+
+def _evaluator() -> AlertEvaluator:
+    """Create an evaluator treating the Network metric types as counters."""
+    return AlertEvaluator(alpha=0.1, z_threshold=4.0, warmup=10, hysteresis=0.05, counter_metrics=['Network*'])
+
+def _kinds(evaluator: AlertEvaluator, metric_type: tuple, values: list[float], interval_s: float = 12) -> list[str]:
+    """Evaluate readings of one series at a fixed interval and return the kinds of the raised alerts."""
+    return [
+        event['kind']
+        for index, value in enumerate(values)
+        for event in evaluator.evaluate('d1', metric_type, START + round(index * interval_s * 1000), value)
+    ]
+
+def test_threshold_with_hysteresis():
+    # 99 is within the 5% hysteresis below the maximum, so the breach only clears at 90
+    assert _kinds(_evaluator(), CPU, [50, 101, 99, 102, 90, 50]) == [THRESHOLD_HIGH, THRESHOLD_CLEAR]
+
+def test_counter_past_maximum_raises_nothing():
+    # A steady 100 MB per interval takes the cumulative value far past its maximum
+    values = [index * 100_000_000 for index in range(40)]
+    assert _kinds(_evaluator(), NETWORK, values) == []
+
+def test_counter_rate_spike_is_anomalous():
+    values = [index * 1000 + (index % 2) * 10 for index in range(30)]
+    values.append(values[-1] + 1_000_000)
+    assert _kinds(_evaluator(), NETWORK, values) == [ANOMALY]
+
+def test_counter_reset_is_skipped():
+    evaluator = _evaluator()
+    values = [index * 1000 + (index % 2) * 10 for index in range(30)]
+    assert _kinds(evaluator, NETWORK, values + [5, 1005, 2005]) == []
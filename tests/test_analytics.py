@@ -0,0 +1,66 @@
+"""Analytics jobs are reported from the catalog, by any web app process."""
+
+import time
+
+import pytest
+
+from config import config
+
+@pytest.fixture
+def clients(tmp_path, monkeypatch):
+    """Yield test clients of two web app processes sharing a database holding readings of two devices."""
+    monkeypatch.setattr(config.database, 'db_engine', f'sqlite:///{tmp_path / "catalog.db"}')
+    monkeypatch.setattr(config.database, 'shards', 1)
+    monkeypatch.setattr(config.hot_tier, 'enabled', False)
+    monkeypatch.setattr(config.analytics, 'enabled', True)
+    monkeypatch.setattr(config.analytics, 'workers', 1)
+
+    from app import create_app
+    apps = [create_app(workers=2), create_app(workers=2, create_schema=False)]
+    clients = [app.test_client() for app in apps]
+    readings = [
+        {
+            'device': {'id': device_id, 'name': device_id},
+            'metric_type': {'id': -1, 'name': 'CPU', 'min_value': 0, 'max_value': 100},
+            'unit': None,
+            'timestamp': 1_700_000_000_000 + index * 60_000,
+            'value': float(index),
+            'id': f'{device_id}-{index}',
+        }
+        for device_id in ('d1', 'd2')
+        for index in range(1, 101)
+    ]
+    assert clients[0].post('/store_metrics', json=readings).status_code == 201
+    yield clients
+
+def test_job_reported_by_another_process(clients):
+    submitting, other = clients
+    response = submitting.post('/analytics', query_string={
+        'metric_type_id': 1, 'start': 1_699_990_000_000, 'end': 1_700_010_000_000, 'q': '0.5',
+    })
+    assert response.status_code == 202
+    status_url = response.get_json()['status_url']
+
+    deadline = time.monotonic() + 30
+    while (status := other.get(status_url).get_json())['status'] == 'running' and time.monotonic() < deadline:
+        time.sleep(0.1)
+
+    assert status['status'] == 'done'
+    assert status['result']['overall']['count'] == 200
+    assert set(status['result']['devices']) == {'d1', 'd2'}
+    assert other.get('/analytics/unknown').status_code == 404
+
+@pytest.mark.parametrize('web_workers, pool_workers', [(1, 8), (3, 2), (16, 1)])
+def test_pool_shares_the_cpus(tmp_path, monkeypatch, web_workers, pool_workers):
+    monkeypatch.setattr(config.database, 'db_engine', f'sqlite:///{tmp_path / "catalog.db"}')
+    monkeypatch.setattr(config.database, 'shards', 1)
+    monkeypatch.setattr(config.analytics, 'workers', None)
+    monkeypatch.setattr('os.cpu_count', lambda: 8)
+
+    from data.analytics import AnalyticsExecutor
+    from data.storage import Storage
+    executor = AnalyticsExecutor.from_config(Storage.from_config(), web_workers)
+    try:
+        assert executor.executor._max_workers == pool_workers
+    finally:
+        executor.shutdown()
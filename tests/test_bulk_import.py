@@ -0,0 +1,61 @@
+"""An interrupted import resumes where it stopped, without duplicates, even between a shard commit and the progress commit."""
+
+import csv
+
+import pytest
+from sqlalchemy import func, select
+
+import data.bulk_import
+from config import config
+from data.bulk_import import BulkImporter
+from data.models import MetricReading
+from data.storage import Storage
+
+ROWS = 10
+
+@pytest.fixture(params=[1, 2], ids=['single', 'sharded'])
+def source(request, tmp_path, monkeypatch):
+    """Yield a storage and a CSV file of readings without ids."""
+    monkeypatch.setattr(config.database, 'db_engine', f'sqlite:///{tmp_path / "catalog.db"}')
+    monkeypatch.setattr(config.database, 'shards', request.param)
+    monkeypatch.setattr(config.database, 'shard_engine_template', f'sqlite:///{tmp_path}/shard_{{shard}}.db')
+    path = tmp_path / 'readings.csv'
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(('device_id', 'device', 'metric_type', 'timestamp', 'value', 'unit', 'utc_offset'))
+        for index in range(ROWS):
+            writer.writerow((f'd{index % 3}', f'd{index % 3}', 'CPU', 1_700_000_000_000 + index * 1000, index, 'Percent', 0))
+
+    storage = Storage.from_config()
+    storage.create_all()
+    yield storage, path
+    storage.dispose()
+
+def _stored(storage: Storage) -> int:
+    """Return the number of readings in every shard."""
+    return sum(storage.fan_out(lambda session: session.scalar(select(func.count()).select_from(MetricReading))))
+
+def test_resume_after_crash_before_progress(source, monkeypatch):
+    storage, path = source
+    save_progress = data.bulk_import._save_progress
+    saves = []
+
+    def crash_on_second_chunk(session, *args):
+        saves.append(args)
+        if len(saves) == 2:
+            raise RuntimeError('crash')
+        save_progress(session, *args)
+
+    monkeypatch.setattr(data.bulk_import, '_save_progress', crash_on_second_chunk)
+    with pytest.raises(RuntimeError):
+        BulkImporter(storage, chunk_size=4).import_file(str(path))
+    # A single database commits the readings with their progress; shards commit
+    # the second chunk before its progress
+    stored = 8 if storage.sharded else 4
+    assert _stored(storage) == stored
+
+    monkeypatch.setattr(data.bulk_import, '_save_progress', save_progress)
+    assert BulkImporter(storage, chunk_size=4).import_file(str(path)) == ROWS - stored
+    assert _stored(storage) == ROWS
+    # Once complete, running the import again reads nothing
+    assert BulkImporter(storage, chunk_size=4).import_file(str(path)) == 0
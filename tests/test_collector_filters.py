@@ -0,0 +1,60 @@
+"""The collector only reports readings that moved, and stretches its intervals while the server is overloaded."""
+
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from config import MetricScheduleConfig, config
+from data import metrics_collector
+from data.dto import DeviceDTO, MetricReadingDTO, MetricTypeDTO
+from data.metrics_collector import DeadbandFilter, IntervalBackoff
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Yield a list holding the monotonic time seen by the deadband filter, in seconds."""
+    now = [0.0]
+    monkeypatch.setattr(metrics_collector, 'time', SimpleNamespace(monotonic=lambda: now[0]))
+    monkeypatch.setitem(config.collector.metrics, 'Load', MetricScheduleConfig(interval_s=10, deadband=1.0, max_silence_s=60))
+    return now
+
+def _reading(value: float, device_id: str = 'd1') -> MetricReadingDTO:
+    """Build a reading of the test metric type."""
+    return MetricReadingDTO(
+        id=1, device=DeviceDTO(id=device_id, name=device_id), metric_type=MetricTypeDTO(id=-1, name='Load'),
+        timestamp=datetime(2024, 1, 1), value=value,
+    )
+
+def test_deadband_drops_small_moves(clock):
+    deadband = DeadbandFilter()
+    sent = []
+    for value in (10.0, 10.5, 11.0, 11.2, 9.9, 9.0):
+        clock[0] += 10
+        sent.append(deadband.should_send(_reading(value)))
+
+    # Moves are measured from the last value sent, not the last one seen
+    assert sent == [True, False, False, True, True, False]
+    # Each device and metric type is filtered on its own
+    assert deadband.should_send(_reading(9.0, 'd2'))
+
+def test_deadband_heartbeat(clock):
+    deadband = DeadbandFilter()
+    assert deadband.should_send(_reading(10.0))
+    clock[0] += 59
+    assert not deadband.should_send(_reading(10.0))
+    clock[0] += 1
+    assert deadband.should_send(_reading(10.0))
+
+def test_backoff_stretches_and_recovers():
+    backoff = IntervalBackoff(factor=2, max_multiplier=8)
+    multipliers = []
+    for status_code in (429, 503, 429, 429, None, 500, 400, 201, 201, 201, 201):
+        backoff.record(status_code)
+        multipliers.append(backoff.multiplier)
+
+    # Overload doubles up to the bound, success halves down to 1, other outcomes change nothing
+    assert multipliers == [2, 4, 8, 8, 8, 8, 8, 4, 2, 1, 1]
+
+def test_backoff_reports_changes():
+    backoff = IntervalBackoff(factor=2, max_multiplier=4)
+    assert [backoff.record(status_code) for status_code in (201, 429, 429, 429, None, 200)] == [False, True, True, False, False, True]
@@ -0,0 +1,58 @@
+"""Collector startup must not import the web stack, and must take a fraction of the web app's import time."""
+
+import subprocess
+import sys
+
+from conftest import SRC_DIR
+
+# Share of the web app's import time allowed for collector startup. Both are
+# measured on the same machine, so the check holds however fast it is
+MAX_IMPORT_TIME_RATIO = 0.5
+
+# Loads the entry point without running a mode, then imports what collector mode imports
+COLLECTOR_STARTUP = f'''
+import runpy, sys
+sys.path.insert(0, {str(SRC_DIR)!r})
+entry = runpy.run_path({str(SRC_DIR / '__main__.py')!r}, run_name='entry')
+entry['import_collector']()
+print(','.join(name for name in entry['WEB_STACK_MODULES'] if name in sys.modules))
+'''
+
+# Imports what serving the web app imports
+APP_STARTUP = f'''
+import sys
+sys.path.insert(0, {str(SRC_DIR)!r})
+import app
+'''
+
+def _startup(code: str) -> tuple[list[str], float]:
+    """Run startup code in a fresh interpreter run with ``-X importtime``.
+
+    Args:
+        code (str): The code to run.
+
+    Returns:
+        tuple[list[str], float]: The names the code printed, comma separated, and the cumulative import time in milliseconds.
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        capture_output=True, text=True, cwd=SRC_DIR, timeout=120, check=True
+    )
+    printed = [name for name in result.stdout.strip().split(',') if name]
+    # Lines are "import time: self [us] | cumulative | package"; the self times add up to the total
+    total_us = sum(
+        int(line.split('|')[0].split(':')[1])
+        for line in result.stderr.splitlines()
+        if line.startswith('import time:') and 'self [us]' not in line
+    )
+    return printed, total_us / 1000
+
+def test_collector_does_not_import_web_stack():
+    loaded, _ = _startup(COLLECTOR_STARTUP)
+    assert loaded == []
+
+def test_collector_import_time_relative_to_app():
+    _, collector_ms = _startup(COLLECTOR_STARTUP)
+    _, app_ms = _startup(APP_STARTUP)
+    assert collector_ms < app_ms * MAX_IMPORT_TIME_RATIO, \
+        f'Collector imports took {collector_ms:.0f} ms, over {MAX_IMPORT_TIME_RATIO:.0%} of the {app_ms:.0f} ms of the web app'
@@ -0,0 +1,137 @@
+"""The dashboard metrics callback must read each database with a single statement."""
+
+from collections import Counter, namedtuple
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from config import config
+
+# Dash request updating the gauge, the historical plot and the table
+UPDATE_METRICS = {
+    'output': '..gauge.figure...historical-plot.figure...data-table.data..',
+    'outputs': [
+        {'id': 'gauge', 'property': 'figure'},
+        {'id': 'historical-plot', 'property': 'figure'},
+        {'id': 'data-table', 'property': 'data'},
+    ],
+    'changedPropIds': [],
+}
+
+def _readings(device_id: str, count: int) -> list[dict]:
+    """Build serialized readings of one device, as sent by the collector.
+
+    Args:
+        device_id (str): The device id.
+        count (int): Number of readings.
+
+    Returns:
+        list[dict]: The readings.
+    """
+    return [
+        {
+            'device': {'id': device_id, 'name': device_id},
+            'metric_type': {'id': 1, 'name': 'CPU', 'min_value': 0, 'max_value': 100},
+            'unit': {'id': 1, 'name': 'Percent', 'symbol': '%'},
+            'timestamp': 1_700_000_000_000 + index * 1000,
+            'value': float(index),
+            'id': f'{device_id}-{index}',
+        }
+        for index in range(count)
+    ]
+
+# Hot tier flag, shard count and hot tier capacity of each tested setup
+SETUPS = {
+    'single': (False, 1, None),
+    'sharded': (False, 2, None),
+    'hot_in_memory': (True, 1, 100),
+    'hot_overflowing': (True, 1, 25),
+}
+
+Dashboard = namedtuple('Dashboard', 'client hot_tier shards capacity')
+
+@pytest.fixture(params=list(SETUPS.values()), ids=list(SETUPS))
+def dashboard(request, tmp_path, monkeypatch):
+    """Yield a test client of the app, with 30 readings of three devices stored, and its setup.
+
+    The hot tier holds every reading with a capacity of 100, and only the
+    newest 25 of each series with a capacity of 25.
+    """
+    hot_tier, shards, capacity = request.param
+    monkeypatch.setattr(config.database, 'db_engine', f'sqlite:///{tmp_path / "catalog.db"}')
+    monkeypatch.setattr(config.database, 'shards', shards)
+    monkeypatch.setattr(config.database, 'shard_engine_template', f'sqlite:///{tmp_path}/shard_{{shard}}.db')
+    monkeypatch.setattr(config.hot_tier, 'enabled', hot_tier)
+    if capacity:
+        monkeypatch.setattr(config.hot_tier, 'capacity', capacity)
+    monkeypatch.setattr(config.analytics, 'enabled', False)
+
+    from app import create_app
+    client = create_app().test_client()
+    for device_id in ('d1', 'd2', 'd3'):
+        assert client.post('/store_metrics', json=_readings(device_id, 30)).status_code == 201
+    yield Dashboard(client, hot_tier, shards, capacity)
+
+def _in_memory(dashboard: Dashboard) -> bool:
+    """Return whether the hot tier holds every stored reading, so no query is needed."""
+    return dashboard.hot_tier and dashboard.capacity >= 30
+
+def _update_metrics(client, device_id, texts: list | None = None) -> tuple[dict, Counter]:
+    """Run the metrics callback and count the statements run on each database.
+
+    Args:
+        client: The Flask test client.
+        device_id: The selected device, or None for all devices.
+        texts (list | None): List receiving the SQL of the statements, if given.
+
+    Returns:
+        tuple[dict, Counter]: The callback response and the statements by database file.
+    """
+    statements = Counter()
+
+    def count(connection, cursor, statement, parameters, context, executemany):
+        statements[connection.engine.url.database] += 1
+        if texts is not None:
+            texts.append(statement)
+
+    payload = dict(UPDATE_METRICS, inputs=[
+        {'id': 'interval-component', 'property': 'n_intervals', 'value': 1},
+        {'id': 'device-dropdown', 'property': 'value', 'value': device_id},
+        {'id': 'metric-type-dropdown', 'property': 'value', 'value': 1},
+    ])
+    event.listen(Engine, 'before_cursor_execute', count)
+    try:
+        response = client.post('/dashboard/_dash-update-component', json=payload)
+    finally:
+        event.remove(Engine, 'before_cursor_execute', count)
+    assert response.status_code == 200
+    return response.get_json()['response'], statements
+
+def test_all_devices_one_statement_per_database(dashboard):
+    response, statements = _update_metrics(dashboard.client, None)
+
+    # Series longer than the tier capacity are read from the database, not truncated
+    assert len(response['data-table']['data']) == 90
+    if _in_memory(dashboard):
+        assert not statements
+    else:
+        assert len(statements) == dashboard.shards
+        assert all(count == 1 for count in statements.values())
+
+def test_one_device_one_statement(dashboard):
+    response, statements = _update_metrics(dashboard.client, 'd2')
+
+    assert len(response['data-table']['data']) == 30
+    assert sum(statements.values()) == (0 if _in_memory(dashboard) else 1)
+
+def test_gauge_and_history(dashboard):
+    texts = []
+    response, _ = _update_metrics(dashboard.client, 'd2', texts)
+
+    assert response['gauge']['figure']['data'][0]['value'] == 29.0
+    assert response['historical-plot']['figure']['data'][0]['y'] == [float(value) for value in range(10, 30)]
+    if dashboard.hot_tier:
+        # The gauge and history come from memory even once the series outgrew the tier;
+        # only the full table may be read from the database, without recomputing totals
+        assert all('OVER' not in text.upper() for text in texts)
@@ -0,0 +1,44 @@
+"""Exported files carry the reading ids, so importing them back stores nothing twice."""
+
+import pytest
+
+from config import config
+from data.bulk_import import BulkImporter, parse_file
+from data.storage import Storage
+
+@pytest.fixture(params=['csv', 'ndjson'])
+def exported(request, tmp_path, monkeypatch):
+    """Yield the storage of an app holding three readings, and a file exporting them."""
+    monkeypatch.setattr(config.database, 'db_engine', f'sqlite:///{tmp_path / "catalog.db"}')
+    monkeypatch.setattr(config.database, 'shards', 1)
+    monkeypatch.setattr(config.hot_tier, 'enabled', False)
+    monkeypatch.setattr(config.analytics, 'enabled', False)
+
+    from app import create_app
+    client = create_app().test_client()
+    readings = [
+        {
+            'device': {'id': 'd1', 'name': 'd1'},
+            'metric_type': {'id': -1, 'name': 'CPU', 'min_value': 0, 'max_value': 100},
+            'unit': {'id': -1, 'name': 'Percent', 'symbol': '%'},
+            'timestamp': 1_700_000_000_000 + index * 1000,
+            'value': float(index),
+            'id': f'd1-{index}',
+        }
+        for index in range(3)
+    ]
+    assert client.post('/store_metrics', json=readings).status_code == 201
+    path = tmp_path / f'readings.{request.param}'
+    path.write_bytes(client.get('/export', query_string={'format': request.param}).data)
+
+    storage = Storage.from_config()
+    yield storage, path
+    storage.dispose()
+
+def test_export_keeps_reading_ids(exported):
+    _, path = exported
+    assert [row[-1] for row in parse_file(path)] == ['d1-0', 'd1-1', 'd1-2']
+
+def test_reimport_stores_nothing(exported):
+    storage, path = exported
+    assert BulkImporter(storage).import_file(str(path)) == 0
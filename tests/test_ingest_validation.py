@@ -0,0 +1,106 @@
+"""Malformed readings are refused with 400 before anything is stored, and the SDK drops them."""
+
+import json
+
+import pytest
+import requests
+
+from config import config
+from sdk.metrics_api import MetricsAPI
+
+def _reading(index: int) -> dict:
+    """Build a valid serialized reading, as sent by the collector.
+
+    Args:
+        index (int): Position of the reading, used for its id, time and value.
+
+    Returns:
+        dict: The reading.
+    """
+    return {
+        'device': {'id': 'd1', 'name': 'd1'},
+        'metric_type': {'id': -1, 'name': 'CPU', 'min_value': 0, 'max_value': 100},
+        'unit': {'id': -1, 'name': 'Percent', 'symbol': '%'},
+        'timestamp': 1_700_000_000_000 + index * 1000,
+        'value': float(index),
+        'id': f'd1-{index}',
+    }
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """Yield a test client of the app on an empty database."""
+    monkeypatch.setattr(config.database, 'db_engine', f'sqlite:///{tmp_path / "catalog.db"}')
+    monkeypatch.setattr(config.database, 'shards', 1)
+    monkeypatch.setattr(config.hot_tier, 'enabled', False)
+    monkeypatch.setattr(config.analytics, 'enabled', False)
+
+    from app import create_app
+    yield create_app().test_client()
+
+def _stored(client) -> int:
+    """Return the number of readings of the test device."""
+    response = client.get('/export', query_string={'device_id': 'd1', 'format': 'ndjson'})
+    return len(response.get_data(as_text=True).splitlines())
+
+@pytest.mark.parametrize('key, value', [
+    ('device', None),
+    ('timestamp', 10 ** 20),
+    ('value', 'high'),
+], ids=['missing_device', 'timestamp_out_of_range', 'non_numeric_value'])
+def test_malformed_reading_is_refused(client, key, value):
+    readings = [_reading(index) for index in range(3)]
+    if value is None:
+        del readings[1][key]
+    else:
+        readings[1][key] = value
+
+    response = client.post('/store_metrics', json=readings)
+
+    assert response.status_code == 400
+    assert response.get_json()['index'] == 1
+    assert _stored(client) == 0
+
+class _Server:
+    """Stand-in for the SDK's HTTP client, posting to the Flask test client."""
+
+    def __init__(self, client):
+        self.client = client
+        self.status_codes = []
+
+    def post(self, url: str, data: str, headers: dict) -> requests.Response:
+        result = self.client.post('/store_metrics', data=data, headers=headers)
+        response = requests.Response()
+        response.status_code = result.status_code
+        response._content = result.data
+        response.url = url
+        self.status_codes.append(result.status_code)
+        return response
+
+def test_sdk_drops_malformed_reading_and_sends_the_others(client, monkeypatch):
+    server = _Server(client)
+    monkeypatch.setattr(MetricsAPI, 'server', server)
+    monkeypatch.setattr(MetricsAPI, 'retry_at', 0.0)
+    readings = [_reading(index) for index in range(3)]
+    readings[1]['value'] = 'high'
+
+    status_code, unsent = MetricsAPI.post_metrics(json.loads(json.dumps(readings)))
+
+    assert server.status_codes == [400, 201]
+    assert (status_code, unsent) == (201, [])
+    assert _stored(client) == 2
+
+@pytest.mark.parametrize('status_code, dropped', [(403, True), (429, False), (500, False)])
+def test_sdk_drops_payload_refused_as_a_whole(monkeypatch, status_code, dropped):
+    class Refusing:
+        def post(self, url: str, data: str, headers: dict) -> requests.Response:
+            response = requests.Response()
+            response.status_code = status_code
+            response._content = b'{"error": "refused"}'
+            response.url = url
+            return response
+
+    monkeypatch.setattr(MetricsAPI, 'server', Refusing())
+    monkeypatch.setattr(MetricsAPI, 'retry_at', 0.0)
+    readings = [_reading(index) for index in range(3)]
+
+    assert MetricsAPI.post_metrics(readings) == (status_code, [] if dropped else readings)
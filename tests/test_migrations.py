@@ -0,0 +1,47 @@
+"""Stored timestamps are converted once per timestamp mode, not on every startup."""
+
+import pytest
+from sqlalchemy import event, text
+
+from config import config
+from data.storage import Storage
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    """Yield a single database storage holding one reading stored in the datetime mode."""
+    monkeypatch.setattr(config.database, 'db_engine', f'sqlite:///{tmp_path / "catalog.db"}')
+    monkeypatch.setattr(config.database, 'shards', 1)
+    monkeypatch.setattr(config.timestamps, 'mode', 'datetime')
+    storage = Storage.from_config()
+    storage.create_all()
+    with storage.catalog_engine.begin() as connection:
+        connection.execute(text(
+            "INSERT INTO metric_readings (device_id, metric_type_id, timestamp, value, utc_offset) "
+            "VALUES ('d1', 1, '2024-01-01 10:00:00.000000', 1.0, 0)"
+        ))
+    yield storage
+    storage.dispose()
+
+def _updates(storage: Storage) -> list[str]:
+    """Run the migrations and return the UPDATE statements they ran."""
+    statements = []
+
+    def record(connection, cursor, statement, parameters, context, executemany):
+        if statement.startswith('UPDATE'):
+            statements.append(statement)
+
+    event.listen(storage.catalog_engine, 'before_cursor_execute', record)
+    try:
+        storage.create_all()
+    finally:
+        event.remove(storage.catalog_engine, 'before_cursor_execute', record)
+    return statements
+
+def test_conversion_runs_once_per_mode(storage, monkeypatch):
+    assert _updates(storage) == []
+
+    monkeypatch.setattr(config.timestamps, 'mode', 'epoch_ms')
+    assert _updates(storage)
+    with storage.catalog_engine.connect() as connection:
+        assert connection.execute(text('SELECT typeof(timestamp) FROM metric_readings')).scalar() == 'integer'
+    assert _updates(storage) == []
@@ -0,0 +1,94 @@
+"""Circuit breaking and hedging of outbound HTTP calls."""
+
+import threading
+import time
+
+import pytest
+import requests
+
+from sdk.resilience import CircuitBreaker, CircuitOpenError, ResilientClient
+from stats_registry import stats
+
+RESET_TIMEOUT_S = 0.05
+
+class FakeSession:
+    """Session answering each request with the next outcome: a status code, an exception, or a delay and a status code."""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _send(self, url: str, **kwargs) -> requests.Response:
+        with self._lock:
+            outcome = self.outcomes[min(self.calls, len(self.outcomes) - 1)]
+            self.calls += 1
+        if isinstance(outcome, Exception):
+            raise outcome
+        delay_s, status_code = outcome if isinstance(outcome, tuple) else (0, outcome)
+        time.sleep(delay_s)
+        response = requests.Response()
+        response.status_code = status_code
+        response.url = url
+        return response
+
+    get = post = _send
+
+def _client(session: FakeSession, hedge_after_s: float | None = None) -> ResilientClient:
+    """Create a client of the fake session whose circuit opens after two failures."""
+    client = ResilientClient('test', hedge_after_s=hedge_after_s, session=session)
+    client.breaker = CircuitBreaker('test', failure_threshold=2, reset_timeout_s=RESET_TIMEOUT_S)
+    return client
+
+def test_circuit_opens_after_consecutive_failures():
+    session = FakeSession(500, requests.exceptions.ConnectionError(), 200)
+    client = _client(session)
+
+    assert client.get('http://dependency').status_code == 500
+    with pytest.raises(requests.exceptions.ConnectionError):
+        client.get('http://dependency')
+    # Open: rejected without calling the dependency
+    with pytest.raises(CircuitOpenError):
+        client.get('http://dependency')
+    assert session.calls == 2
+    assert client.breaker.state == CircuitBreaker.OPEN
+
+def test_probe_closes_or_reopens_the_circuit():
+    session = FakeSession(500, 500, 500, 200)
+    client = _client(session)
+    for _ in range(2):
+        client.post('http://dependency')
+
+    # A failed probe opens the circuit again at once
+    time.sleep(RESET_TIMEOUT_S)
+    assert client.post('http://dependency').status_code == 500
+    assert client.breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        client.post('http://dependency')
+
+    time.sleep(RESET_TIMEOUT_S)
+    assert client.post('http://dependency').status_code == 200
+    assert client.breaker.state == CircuitBreaker.CLOSED
+    assert stats.to_dict()['gauges']['breaker.test.state'] == CircuitBreaker.STATE_VALUES[CircuitBreaker.CLOSED]
+
+def test_client_errors_do_not_open_the_circuit():
+    client = _client(FakeSession(404))
+    for _ in range(3):
+        assert client.get('http://dependency').status_code == 404
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+def test_slow_get_is_hedged():
+    # The first copy hangs, the hedge answers
+    session = FakeSession((1.0, 500), 200)
+    started = time.monotonic()
+
+    response = _client(session, hedge_after_s=0.05).get('http://dependency')
+
+    assert response.status_code == 200
+    assert session.calls == 2
+    assert time.monotonic() - started < 0.5
+
+def test_fast_get_is_not_hedged():
+    session = FakeSession(200)
+    assert _client(session, hedge_after_s=0.5).get('http://dependency').status_code == 200
+    assert session.calls == 1
@@ -0,0 +1,68 @@
+"""Quantile sketches: their accuracy, and merging writes from several processes into one bucket."""
+
+import random
+
+import pytest
+from sqlalchemy import event
+
+from config import config
+from data.sketch import DDSketch, percentiles, update_sketches
+from data.storage import Storage
+
+START_MS = 1_700_000_000_000
+QUANTILES = (0, 0.01, 0.25, 0.5, 0.9, 0.99, 0.999, 1)
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    """Yield a single database storage with its tables created."""
+    monkeypatch.setattr(config.database, 'db_engine', f'sqlite:///{tmp_path / "catalog.db"}')
+    monkeypatch.setattr(config.database, 'shards', 1)
+    storage = Storage.from_config()
+    storage.create_all()
+    yield storage
+    storage.dispose()
+
+def _add(storage: Storage, values: list[float]):
+    """Add values of one series to the sketches in a transaction of their own, as a web app process would."""
+    session = storage.catalog_session()
+    try:
+        update_sketches(session, [('d1', 1, START_MS + index, value) for index, value in enumerate(values)], 60, 0.01)
+        session.commit()
+    finally:
+        session.close()
+
+def test_bucket_created_concurrently_is_merged(storage):
+    # Another process creates the bucket between the lookup and the insert of this one
+    racing = []
+
+    def race(connection, cursor, statement, parameters, context, executemany):
+        if statement.startswith('INSERT INTO quantile_sketches') and not racing:
+            racing.append(True)
+            _add(storage, [1.0, 2.0])
+
+    event.listen(storage.catalog_engine, 'before_cursor_execute', race)
+    try:
+        _add(storage, [3.0])
+    finally:
+        event.remove(storage.catalog_engine, 'before_cursor_execute', race)
+
+    result = percentiles(storage, 1, [0.5])
+    assert (result['count'], result['min'], result['max']) == (3, 1.0, 3.0)
+
+@pytest.mark.parametrize('relative_accuracy', [0.01, 0.05])
+def test_quantiles_within_relative_accuracy(relative_accuracy):
+    generator = random.Random(42)
+    # Heavy tailed values over several orders of magnitude, both signs and zeros
+    values = [generator.lognormvariate(0, 2) * generator.choice((-1, 1, 1, 1)) for _ in range(20000)] + [0.0] * 100
+    halves = DDSketch(relative_accuracy), DDSketch(relative_accuracy)
+    for index, value in enumerate(values):
+        halves[index % 2].add(value)
+    # Merged and serialized, as the sketches of two buckets read back from the database
+    sketch = DDSketch.from_json(halves[0].to_json())
+    sketch.merge(DDSketch.from_json(halves[1].to_json()))
+
+    values.sort()
+    assert sketch.count == len(values)
+    for q in QUANTILES:
+        exact = values[int(q * (len(values) - 1))]
+        assert abs(sketch.quantile(q) - exact) <= relative_accuracy * abs(exact), q
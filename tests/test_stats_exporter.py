@@ -0,0 +1,40 @@
+"""The collector's stats listener must serve the registry like the web app route."""
+
+import json
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+import pytest
+
+from stats_exporter import start_stats_server
+from stats_registry import stats
+
+@pytest.fixture
+def stats_url():
+    """Yield the base URL of a stats listener on a free port."""
+    server = start_stats_server('127.0.0.1', 0)
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+def test_serves_json(stats_url):
+    stats.observe('collector.test_job', 0.02)
+    stats.set_gauge('breaker.test.state', 2)
+    with urlopen(f'{stats_url}/internal/stats') as response:
+        body = json.load(response)
+
+    assert body['timers']['collector.test_job']['count'] >= 1
+    assert body['gauges']['breaker.test.state'] == 2
+
+def test_serves_prometheus(stats_url):
+    stats.increment('collector.test_sent', 3)
+    with urlopen(f'{stats_url}/internal/stats?format=prometheus') as response:
+        text = response.read().decode()
+
+    assert response.headers['Content-Type'].startswith('text/plain')
+    assert 'events_total{name="collector.test_sent"}' in text
+
+def test_unknown_path(stats_url):
+    with pytest.raises(HTTPError) as error:
+        urlopen(f'{stats_url}/other')
+    assert error.value.code == 404